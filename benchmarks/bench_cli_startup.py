@@ -0,0 +1,96 @@
+""" Mede o tempo de inicialização a frio de cada subcomando do csctl.
+
+    Cada invocação é executada em um novo interpretador com `-X importtime`; são exibidos o
+    tempo total (mediana), o tempo gasto em imports e os pacotes de topo mais custosos. As
+    invocações `--help` não executam o comando, `status`, `supervise -s` e `reconcile -n` apenas
+    leem estado.
+
+    Uso: python benchmarks/bench_cli_startup.py [--repeat 5] [--budget-ms 250]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+CSCTL = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'csctl', 'csctl.py')
+
+INVOCATIONS = [
+    ['--help'],
+    ['start', '--help'],
+    ['stop', '--help'],
+    ['status', '--help'],
+    ['restart', '--help'],
+    ['add', '--help'],
+    ['remove', '--help'],
+    ['show', '--help'],
+    ['registry', '--help'],
+    ['supervise', '--help'],
+    ['reconcile', '--help'],
+    ['top', '--help'],
+    ['exporter', '--help'],
+    ['history', '--help'],
+    ['status', '-a', '-i', '0'],
+    ['supervise', '-s'],
+    ['reconcile', '-n'],
+]
+
+
+def parse_importtime(stderr):
+    """ Retorna o tempo total de imports e o cumulativo de cada pacote de topo, em microssegundos"""
+    total, top_level = 0, {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        total += int(self_us)
+        if len(name) - len(name.lstrip()) == 1:
+            top_level[name.strip()] = int(cumulative_us)
+    return total, top_level
+
+
+def run(args, env):
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-X', 'importtime', CSCTL] + args, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    elapsed = time.perf_counter() - start
+    imports, top_level = parse_importtime(completed.stderr)
+    return elapsed, imports, top_level
+
+
+def measure(args, repeat, env):
+    timings, imports, top_level = [], [], {}
+    for _ in range(repeat):
+        elapsed, import_us, top_level = run(args, env)
+        timings.append(elapsed)
+        imports.append(import_us)
+    heaviest = sorted(top_level.items(), key=lambda item: item[1], reverse=True)[:3]
+    return statistics.median(timings), statistics.median(imports), heaviest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, help="Falha se alguma invocação exceder o tempo (mediana)")
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONWARNINGS='ignore', PYTHONDONTWRITEBYTECODE='1')
+
+    print('{:<26} {:>10} {:>12}  {}'.format('invocation', 'wall (ms)', 'imports (ms)', 'heaviest imports (ms)'))
+    over_budget = []
+    for invocation in INVOCATIONS:
+        wall, imports, heaviest = measure(invocation, args.repeat, env)
+        print('{:<26} {:>10.1f} {:>12.1f}  {}'.format(
+            ' '.join(invocation), wall * 1000, imports / 1000,
+            ', '.join('{} {:.1f}'.format(name, us / 1000) for name, us in heaviest)))
+        if args.budget_ms is not None and wall * 1000 > args.budget_ms:
+            over_budget.append(' '.join(invocation))
+
+    if over_budget:
+        print('acima de {:.0f} ms: {}'.format(args.budget_ms, ', '.join(over_budget)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+""" Compara a descoberta de processos via psutil e via leitura direta do /proc.
+
+    Gera uma árvore /proc sintética com 100, 1.000 e 5.000 processos, dos quais 10% são
+    serviços cs* executados pelo python3, e mede o tempo de um status em cada backend.
+
+    Uso: python benchmarks/bench_process_discovery.py [--repeat 5] [--sizes 100,1000,5000]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'csctl'))
+
+import psutil  # noqa: E402
+
+from repository.inmemory_repo import ListFieldsRepo  # noqa: E402
+from repository.inmemory_repo import ListProcessRepo  # noqa: E402
+from repository.procfs_repo import ProcFsProcessRepo  # noqa: E402
+
+FIELDS = ['pid', 'started', 'memory_percent', 'cpu_percent']
+SERVICE_RATIO = 10
+
+
+def write(path, content):
+    with open(path, 'wb') as file:
+        file.write(content)
+
+
+def build_proc_tree(root, size):
+    """ Cria um /proc sintético com `size` processos"""
+    write(os.path.join(root, 'stat'), b'cpu  100 0 100 10000 0 0 0 0 0 0\nbtime 1700000000\n')
+    write(os.path.join(root, 'uptime'), b'100000.00 90000.00\n')
+    write(os.path.join(root, 'meminfo'), b''.join(
+        b'%s: %d kB\n' % (k, v) for k, v in ((b'MemTotal', 16384000), (b'MemFree', 8192000),
+                                            (b'MemAvailable', 8192000), (b'Buffers', 1000),
+                                            (b'Cached', 100000), (b'Shmem', 1000), (b'Active', 1000),
+                                            (b'Inactive', 1000), (b'SReclaimable', 1000))))
+
+    for pid in range(1000, 1000 + size):
+        proc = os.path.join(root, str(pid))
+        os.mkdir(proc)
+        if pid % SERVICE_RATIO == 0:
+            comm = b'python3'
+            cmdline = b'/usr/bin/python3\x00/usr/local/bin/cortex/brain\x00--instance\x00csbrain-%d\x00' % pid
+        else:
+            comm = b'worker'
+            cmdline = b'/usr/sbin/worker\x00--config\x00/etc/worker.conf\x00'
+        stat = b'%d (%s) S 1 %d %d 0 -1 4194560 100 0 0 0 120 30 0 0 20 0 1 0 5000 1000000 2500 ' % (
+            pid, comm, pid, pid) + b' '.join([b'0'] * 29) + b'\n'
+        write(os.path.join(proc, 'cmdline'), cmdline)
+        write(os.path.join(proc, 'stat'), stat)
+        write(os.path.join(proc, 'statm'), b'2500 2500 100 10 0 200 0\n')
+        write(os.path.join(proc, 'status'), b'Name:\t%s\nUid:\t0\t0\t0\t0\nGid:\t0\t0\t0\t0\n' % comm)
+
+
+def run_psutil(root):
+    psutil.PROCFS_PATH = root
+    if hasattr(psutil, '_pmap'):
+        psutil._pmap.clear()
+    repo = ListProcessRepo(ListFieldsRepo().fields)
+    return sum(1 for _ in repo.list_process(FIELDS))
+
+
+def run_procfs(root):
+    repo = ProcFsProcessRepo(ListFieldsRepo().fields, proc_path=root)
+    return sum(1 for _ in repo.list_process(FIELDS))
+
+
+def measure(func, root, repeat):
+    timings, found = [], 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        found = func(root)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--sizes', default='100,1000,5000')
+    args = parser.parse_args()
+
+    print('{:>8} {:>10} {:>14} {:>14} {:>8}'.format('procs', 'services', 'psutil (ms)', 'procfs (ms)', 'ratio'))
+    for size in (int(s) for s in args.sizes.split(',')):
+        with tempfile.TemporaryDirectory() as root:
+            build_proc_tree(root, size)
+            psutil_time, psutil_found = measure(run_psutil, root, args.repeat)
+            procfs_time, procfs_found = measure(run_procfs, root, args.repeat)
+            assert psutil_found == procfs_found, (psutil_found, procfs_found)
+            print('{:>8} {:>10} {:>14.2f} {:>14.2f} {:>7.1f}x'.format(
+                size, procfs_found, psutil_time * 1000, procfs_time * 1000, psutil_time / procfs_time))
+
+
+if __name__ == '__main__':
+    main()
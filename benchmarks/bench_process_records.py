@@ -0,0 +1,141 @@
+""" Compara a memória retida pelos registros de processo em dicionário e em ServiceProcess.
+
+    Monta 1.000 processos sintéticos no formato do info do psutil (cmdline, environ com 40
+    variáveis e 6 conexões) e mede com tracemalloc os bytes retidos e o pico de alocação da lista
+    de registros, já descartado o info. O registro em dicionário reproduz o process_record usado
+    antes do ServiceProcess, que copiava environ e connections e filtrava o cmdline duas vezes.
+    Os cenários são o registro completo e o usado pelo start/stop (apenas nome e pid), em que o
+    ServiceProcess não mantém o cmdline. O ServiceProcess é medido sem acessar environ e
+    connections (`lazy`) e depois de lê-los por um loader que devolve os mesmos dados sintéticos
+    (`loaded`), o equivalente ao dicionário completo.
+
+    Uso: python benchmarks/bench_process_records.py [--size 1000] [--repeat 5]
+"""
+import argparse
+import gc
+import os
+import re
+import statistics
+import sys
+import time
+import tracemalloc
+from collections import namedtuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'csctl'))
+
+from entities.service_process import ServiceProcess  # noqa: E402
+
+ALL_FIELDS = list(ServiceProcess.FIELDS[1:])
+RUNNING_FIELDS = ['pid']
+
+Connection = namedtuple('Connection', 'fd family type laddr raddr status pid')
+
+
+def dict_record(process_name, info, fields):
+    """ Registro em dicionário como montado antes do ServiceProcess"""
+    cmdline = info['cmdline'] or []
+    record = {'name': process_name}
+    for field in fields:
+        if field == 'pid':
+            record['pid'] = info['pid']
+        elif field == 'started':
+            record['started'] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(info.get('create_time')))
+        elif field == 'memory_percent':
+            record['memory_percent'] = round(info.get('memory_percent') or 0)
+        elif field == 'cpu_percent':
+            record['cpu_percent'] = round(info.get('cpu_percent') or 0)
+        elif field == 'parameters':
+            record['parameters'] = list(filter(lambda v: re.match('^(--[a-z].*)', v), cmdline))
+        elif field == 'arguments':
+            record['arguments'] = list(filter(lambda v: re.match('^([^\\-\\-])', v), cmdline))
+        elif field == 'environ':
+            record['environ'] = info.get('environ') or {}
+        elif field == 'connections':
+            record['connections'] = info.get('connections') or []
+    return record
+
+
+class SyntheticLoader:
+    """ Loader do ServiceProcess com os mesmos environ e connections do info sintético"""
+
+    @staticmethod
+    def load(pid, field):
+        return synthetic_info(pid, [field]).get(field)
+
+
+def slots_record(process_name, info, fields):
+    return ServiceProcess.from_info(process_name, info, SyntheticLoader, fields)
+
+
+def loaded_record(process_name, info, fields):
+    record = ServiceProcess.from_info(process_name, info, SyntheticLoader, fields)
+    for field in ('environ', 'connections'):
+        if field in fields:
+            getattr(record, field)
+    return record
+
+
+def synthetic_info(pid, fields):
+    """ Info de um processo como entregue pelo psutil para os campos pedidos"""
+    info = {'name': 'python3', 'pid': pid,
+            'cmdline': ['/usr/bin/python3', '/usr/local/bin/cortex/brain', '--instance', 'csbrain-%d' % pid,
+                        '--port', str(20000 + pid), '--workers', '4']}
+    if 'started' in fields:
+        info['create_time'] = 1700000000.0 + pid
+    if 'memory_percent' in fields:
+        info['memory_percent'] = 0.37
+    if 'cpu_percent' in fields:
+        info['cpu_percent'] = 1.5
+    if 'environ' in fields:
+        info['environ'] = {'VAR_%02d_%d' % (i, pid): '/opt/cortex/value/%d/%d' % (i, pid) for i in range(40)}
+    if 'connections' in fields:
+        info['connections'] = [Connection(10 + i, 2, 1, ('127.0.0.1', 20000 + pid), ('127.0.0.1', 40000 + i),
+                                          'ESTABLISHED', pid) for i in range(6)]
+    return info
+
+
+def build(factory, size, fields):
+    records = []
+    for pid in range(1000, 1000 + size):
+        info = synthetic_info(pid, fields)
+        records.append(factory('csbrain-%d' % pid, info, fields))
+        del info
+    return records
+
+
+def measure(factory, size, fields, repeat):
+    retained, peaks, timings = [], [], []
+    for _ in range(repeat):
+        gc.collect()
+        tracemalloc.start()
+        start = time.perf_counter()
+        records = build(factory, size, fields)
+        timings.append(time.perf_counter() - start)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        retained.append(current)
+        peaks.append(peak)
+        del records
+    return statistics.median(retained), statistics.median(peaks), statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print('{:>10} {:>11} {:>14} {:>14} {:>12}'.format('fields', 'record', 'bytes/proc', 'peak KB', 'build (ms)'))
+    for label, fields in (('all', ALL_FIELDS), ('name,pid', RUNNING_FIELDS)):
+        results = {}
+        for kind, factory in (('dict', dict_record), ('lazy', slots_record), ('loaded', loaded_record)):
+            retained, peak, elapsed = measure(factory, args.size, fields, args.repeat)
+            results[kind] = retained
+            print('{:>10} {:>11} {:>14.0f} {:>14.1f} {:>12.2f}'.format(
+                label, kind, retained / args.size, peak / 1024, elapsed * 1000))
+        for kind in ('lazy', 'loaded'):
+            print('{:>10} {:>11} {:>13.1f}x'.format(label, 'dict/' + kind, results['dict'] / results[kind]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+""" Cliente leve do csctl.
+
+    Encaminha o comando ao csctld pelo socket Unix usando apenas a biblioteca padrão; se o
+    daemon não estiver em execução o csctl é importado e executado no próprio processo.
+"""
+import json
+import os
+import socket
+import sys
+
+# Mesmo padrão do Config.DAEMON_SOCKET, lido do ambiente para não importar o dynaconf
+SOCKET_PATH = os.environ.get('CSCTLD_SOCKET', '/var/run/cs/csctld.sock')
+
+# Comandos de longa duração ou interativos, sempre executados localmente
+LOCAL_COMMANDS = {'supervise', 'top', 'exporter'}
+
+
+def remote(argv):
+    """ Executa o comando no csctld, retorna o código de saída ou None sem daemon"""
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(SOCKET_PATH)
+    except OSError:
+        client.close()
+        return None
+
+    with client:
+        request = {'a': argv, 't': sys.stdout.isatty(), 'env': dict(os.environ), 'cwd': os.getcwd()}
+        client.sendall(json.dumps(request).encode() + b'\n')
+        for line in client.makefile('rb'):
+            message = json.loads(line)
+            if 'o' in message:
+                sys.stdout.write(message['o'])
+                sys.stdout.flush()
+            elif 'e' in message:
+                sys.stderr.write(message['e'])
+            elif 'c' in message:
+                return message['c']
+    return 1
+
+
+def main():
+    argv = sys.argv[1:]
+    if not argv or argv[0] not in LOCAL_COMMANDS:
+        code = remote(argv)
+        if code is not None:
+            sys.exit(code)
+
+    import csctl
+
+    csctl.cli(prog_name='csctl')
+
+
+if __name__ == '__main__':
+    main()
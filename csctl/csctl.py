@@ -1,39 +1,21 @@
 import logging
 import os
-import glob
 import time
 import click
 import sys
 import subprocess
-import psutil
-import signal
 import shutil
-import stat
-import socket
 import re
-from jinja2 import Environment
-from jinja2 import FileSystemLoader
-from time import sleep
-from prettytable import PrettyTable
-from termcolor import colored
-from prettytable import (SINGLE_BORDER, PLAIN_COLUMNS)
-
-from repository.mongo_repo import MongoRepo
-from repository.inmemory_repo import ListProcessRepo
-from repository.inmemory_repo import ListFilesRepo
-from repository.inmemory_repo import ListFieldsRepo
-from repository.inmemory_repo import ListDirRepo
+
 from repository.inmemory_repo import DitcInstanceRepo
-from usecases.list_istance import ListInstanceUseCase
-from usecases.list_process import ListProcessUseCase
-from usecases.list_files import ListFileUseCase
-from usecases.list_dirs import ListDirUseCase
-from usecases.list_istance import UpdateInstanceUseCase
 from infra.config import Config
-from infra.config_hostname import IpAddrOrHostname
+from infra.container import Container
 
-host_name = IpAddrOrHostname()
+# Módulos pesados (pymongo, jinja2, psutil, asyncio, netifaces, dynaconf) são importados no
+# primeiro uso, cada subcomando paga apenas pelo que utiliza. prettytable e termcolor também,
+# a saída para máquinas (--output, ver infra/output.py) não os carrega
 settings = Config()
+container = Container(settings)
 
 # Crie um logger
 logger = logging.getLogger("-")
@@ -60,90 +42,169 @@ BRAIN = settings.BRAIN
 RENDER = settings.RENDER
 PREFIX = settings.PREFIX
 HTTP_DEFAULT_PORT = settings.HTTP_DEFAULT_PORT
+SUPERVISOR_STATE = os.path.join(PATH_PID, 'supervisor.json')
 COLLECTION_NAME = settings.COLLECTION
 DATABASE_NAME = settings.DB_NAME
-CONFIG_DATABASE_URL = settings.MONGODB_URL
 
-repo_fields = ListFieldsRepo()
-repo_instance = MongoRepo(url=CONFIG_DATABASE_URL, db=DATABASE_NAME, collection=COLLECTION_NAME)
-repo_process = ListProcessRepo(repo_fields.fields)
-repo_files = ListFilesRepo(PREFIX, PATH_INITD)
-repo_dirs = ListDirRepo(PATH_CORTEX)
+# Estilos do prettytable, resolvidos em pretty_table()
+SINGLE_BORDER = 'SINGLE_BORDER'
+PLAIN_COLUMNS = 'PLAIN_COLUMNS'
+
+
+def colored(text, color=None, *args, **kwargs):
+    """ termcolor.colored, importado apenas quando há saída colorida"""
+    from termcolor import colored as termcolor_colored
+    if container.color is not None:
+        kwargs.setdefault('force_color' if container.color else 'no_color', True)
+    return termcolor_colored(text, color, *args, **kwargs)
+
+
+class PseudoTerminal:
+    """ Prompt >>> colorido das mensagens, montado na primeira mensagem exibida"""
+
+    def __str__(self):
+        return f"{colored('>', 'white')}{colored('>', 'green')}{colored('>', 'magenta')}"
 
-use_case_files = ListFileUseCase(repo_files)
-use_case_dirs = ListDirUseCase(repo_dirs)
-use_case_process = ListProcessUseCase(repo_process)
-use_case_instances = ListInstanceUseCase(repo_instance)
-use_case_update = UpdateInstanceUseCase(repo_instance)
+    def __format__(self, spec):
+        return format(str(self), spec)
 
-term_color = f"{colored('>', 'white')}{colored('>', 'green')}{colored('>', 'magenta')}"  # Pseudo terminal
+
+term_color = PseudoTerminal()  # Pseudo terminal
+
+# Campos coletados por cada comando, os custosos (environ, connections) apenas para o serviço alvo
+STATUS_FIELDS = ['pid', 'started', 'memory_percent', 'cpu_percent']
+RUNNING_FIELDS = ['pid']
+PARAMS_FIELDS = ['parameters', 'arguments']
+CONNECTIONS_FIELDS = ['connections']
+ENVIRON_FIELDS = ['environ']
+
+# Formatos de --output, o table é desenhado pelo próprio comando e os demais por infra.output
+OUTPUT_FORMATS = ('table', 'json', 'ndjson', 'tsv')
 
 
 def pretty_table(columns: str = None, fields: list = None, title: str = None):
     """ Formata o output das tabelas """
-    table = PrettyTable()
+    import prettytable
+
+    table = prettytable.PrettyTable()
     if title:
-        table = PrettyTable(title=colored(title, 'magenta'))
-    table.set_style(columns)
+        table = prettytable.PrettyTable(title=colored(title, 'magenta'))
+    styles = getattr(prettytable, 'TableStyle', prettytable)
+    table.set_style(getattr(styles, columns))
     table.field_names = fields
     table.align = "l"
     return table
 
 
-def list_files():
-    """ Retorna uma lista de arquivos"""
-    services = []
-    for f in use_case_files.list_files():
-        service_name_file = f.split("/")[-1]
-        services.append(service_name_file)
-    return sorted(services)
+def reload_inventory():
+    """ Recarrega a lista de scripts instalados, usado pelo csctld quando o PATH_INITD muda"""
+    container.reset('repo_files', 'use_case_files', 'inventory')
 
 
-def do_status(name_service=None):
-    """ Retorna o estatus dos processos em execução no sistema"""
+def list_files():
+    """ Retorna uma lista de arquivos"""
+    return container.inventory.names()
+
+
+def status_rows(name_service=None, interval=None, wait_ready_timeout=None):
+    """ Produz o status de cada serviço selecionado, os em execução primeiro e depois os parados
+
+        Sem amostragem de CPU (`interval` 0) e sem `wait_ready_timeout`, cada processo é entregue
+        assim que é encontrado. Caso contrário os processos são coletados para a amostragem em
+        lote e para a verificação de prontidão antes da primeira linha.
+    """
+    from entities.service_selector import ServiceSelector
+
+    interval = settings.CPU_SAMPLE_INTERVAL if interval is None else interval
+    fields = [f for f in STATUS_FIELDS if f != 'cpu_percent'] if interval > 0 else STATUS_FIELDS
+
+    selector = ServiceSelector(name_service)
+    running = (p for p in container.use_case_process.list_process(fields)
+               if p is not None and selector.matches(p['name']))
+
+    ready = None
+    if interval > 0 or wait_ready_timeout is not None:
+        running = list(running)
+        if interval > 0:
+            from repository.procfs_repo import CpuSampler
+            usage = CpuSampler().sample([p['pid'] for p in running], interval)
+            for each_proc in running:
+                each_proc['cpu_percent'] = round(usage.get(each_proc['pid'], 0))
+        if wait_ready_timeout is not None:
+            ready = {probe.name: probe.ready for probe in wait_ready([p['name'] for p in running],
+                                                                       wait_ready_timeout, check_alive=False)}
+
+    process_name_list = set()
+
+    for each_proc in running:
+        process_name_list.add(each_proc['name'])
+        row = {'name': each_proc['name'], 'pid': each_proc['pid'], 'started': each_proc['started'],
+               'memory_percent': each_proc['memory_percent'], 'cpu_percent': each_proc['cpu_percent'],
+               'status': 'running'}
+        if ready is not None:
+            row['ready'] = bool(ready.get(each_proc['name']))
+        yield row
+
+    for each in container.inventory.match(name_service):
+        if each not in process_name_list:
+            row = {'name': each, 'pid': None, 'started': None, 'memory_percent': None, 'cpu_percent': None,
+                   'status': 'down'}
+            if ready is not None:
+                row['ready'] = None
+            yield row
+
+
+def do_status(name_service=None, interval=None, wait_ready_timeout=None):
+    """ Retorna o estatus dos processos em execução no sistema
+
+        O CPU% é medido em lote durante `interval` segundos (Config.CPU_SAMPLE_INTERVAL por padrão),
+        com 0 é exibido o valor instantâneo do backend de processos. Com `wait_ready_timeout` os
+        serviços em execução são verificados pelo ReadinessProbe e a coluna READY é exibida.
+    """
 
     field_names = ["NAME", "PID", "STARTED", "MEM%", "CPU%", "STATUS"]
+    if wait_ready_timeout is not None:
+        field_names.append("READY")
     colums_styles = PLAIN_COLUMNS
 
     table = pretty_table(colums_styles, field_names)
 
-    process_name_list = []
+    for row in status_rows(name_service, interval, wait_ready_timeout):
+        if row['status'] == 'running':
+            line = [colored("🟢 {}".format(row['name']), 'green'), colored("{}".format(row['pid']), color='cyan'),
+                    "started {}".format(row['started']), "mem {}%".format(row['memory_percent']),
+                    "cpu {}%".format(row['cpu_percent']), colored('running', color='yellow')]
+            if wait_ready_timeout is not None:
+                line.append(colored('ready', 'green') if row['ready'] else colored('not ready', 'red'))
+        else:
+            line = [colored("🔴 {}".format(row['name']), 'red'), colored("-", color='cyan'), "-", "mem - %",
+                    "cpu - %", colored('down', color='red')]
+            if wait_ready_timeout is not None:
+                line.append(colored('-', 'red'))
+        table.add_row(line)
+    return table
 
-    result = use_case_process.list_process()
-    
-    if result is not None:
-        for each_proc in result:
-            if each_proc is None:
-                continue
-            process_name = each_proc['name']
-            process_pid = each_proc['pid']
-            process_started = each_proc['started']
-            process_memory = each_proc['memory_percent']
-            process_cpu = each_proc['cpu_percent']
 
-            process_name_list.append(process_name)
+def instance_rows():
+    """ Produz o registro das instâncias do host e os serviços instalados sem registro"""
+    ipaddr = container.host_name.ip_addr_or_hostname[0]
+    hostname = container.host_name.ip_addr_or_hostname[1]
 
-            running = [colored("🟢 {}".format(process_name), 'green'), colored("{}".format(process_pid), color='cyan'),
-                    "started {}".format(process_started), "mem {}%".format(process_memory),
-                    "cpu {}%".format(process_cpu), colored('running', color='yellow')]
+    servers = container.use_case_instances.list_host_instances(hostname, ipaddr)
+    stale = container.repo_instance.last_source == 'stale'
 
-            if name_service:
-                if process_name.startswith(name_service):
-                    table.add_row(running)
-            else:
-                table.add_row(running)
-
-        for each in list_files():
-
-            if each not in sorted(process_name_list):
-                down = [colored("🔴 {}".format(each), 'red'), colored("-", color='cyan'), "-", "mem - %",
-                        "cpu - %", colored('down', color='red')]
-                if name_service:
-                    if each.startswith(name_service):
-                        table.add_row(down)
-                else:
-                    table.add_row(down)
-    return table
+    instances_registred = set()
+
+    for server in servers:
+        for inst in server['instances']:
+            instances_registred.add(inst['instance'])
+            yield {'kind': 'instance', 'instance': inst['instance'], 'hostname': server['hostname'],
+                   'ipaddr': server['ipaddr'], 'registered': True, 'stale': stale}
+
+    for instance in list_files():
+        if instance not in instances_registred:
+            yield {'kind': 'instance', 'instance': instance, 'hostname': hostname, 'ipaddr': ipaddr,
+                   'registered': False, 'stale': stale}
 
 
 def list_instances():
@@ -155,157 +216,327 @@ def list_instances():
 
     table = pretty_table(colums_styles, field_names, title=title)
 
-    ipaddr = host_name.ip_addr_or_hostname[0]
-    hostname = host_name.ip_addr_or_hostname[1]
+    for row in instance_rows():
+        if row['registered']:
+            table.add_row([colored(row['instance'], color='green'), row['hostname'], row['ipaddr'],
+                           colored('TRUE', 'green')])
+        else:
+            table.add_row([colored(row['instance'], color='red'), row['hostname'], row['ipaddr'],
+                           colored('FALSE', 'red')])
+        if row['stale']:
+            table.title = colored('{} (OFFLINE, cópia local)'.format(title), 'red')
+    return table
 
-    list_instance_use_case = use_case_instances
 
-    instances_registred = []
+def sync_registry():
+    """ Reenvia as escritas pendentes e atualiza a cópia local do registro"""
+    from repository.cached_mongo_repo import RegistryRejected, RegistryUnavailable
 
-    for each in list_instance_use_case.list_instances({'nome': 'instances'}, {'_id': 0, 'nome': 0}):
-        for server in each['servers']:
-            for inst in server['instances']:
-                if hostname in server['hostname'] or ipaddr in server['ipaddr']:
-                    instances_registred.append(inst['instance'])
-                    table.add_row([colored(inst['instance'], color='green'), server['hostname'], server['ipaddr'],
-                                   colored('TRUE', 'green')])
+    try:
+        state = container.repo_instance.sync()
+    except RegistryUnavailable as err:
+        print(f"{term_color} AVISO! MongoDB inacessível, {container.repo_instance.status()['pending']} "
+              f"escritas pendentes: {err}")
+        sys.exit(1)
+    except RegistryRejected as err:
+        print(f"{term_color} AVISO! Escritas recusadas pelo MongoDB e descartadas, cópia local relida: {err}")
+        sys.exit(1)
+    print(f"{term_color} Registro sincronizado: {state['applied']} escritas enviadas, revisão {state['revision']}.")
 
-    for instance in list_files():
-        if instance not in instances_registred:
-            table.add_row([colored(instance, color='red'), hostname, ipaddr, colored('FALSE', 'red')])
 
+RECONCILE_LABELS = {'installed_not_running': ('instalado, parado', 'red'),
+                    'running_not_installed': ('em execução, sem script', 'yellow'),
+                    'installed_not_registered': ('instalado, sem registro', 'red'),
+                    'registered_not_installed': ('registrado, sem script', 'yellow')}
+
+
+def do_reconcile(with_registry=True):
+    """ Confronta scripts instalados, processos em execução e registro do host
+
+        Com o MongoDB inacessível e sem cópia local, as divergências do registro são omitidas e
+        indicadas em `registry_available`.
+    """
+    import socket
+
+    from repository.cached_mongo_repo import RegistryUnavailable
+
+    if with_registry:
+        try:
+            ipaddr, hostname = container.host_name.ip_addr_or_hostname[:2]
+        except (KeyError, IndexError, ValueError, OSError) as err:
+            logger.warning("endereço do host indisponível, reconciliação sem o MongoDB: %r", err)
+            with_registry = False
+    if not with_registry:
+        ipaddr, hostname = None, socket.gethostname()
+    try:
+        return container.use_case_reconcile.reconcile(hostname, ipaddr, with_registry=with_registry)
+    except RegistryUnavailable as err:
+        logger.warning("registro inacessível, reconciliação sem o MongoDB: %s", err)
+        return container.use_case_reconcile.reconcile(hostname, ipaddr, with_registry=False)
+
+
+def reconcile_table(report):
+    """ Formata as divergências da reconciliação"""
+    table = pretty_table(SINGLE_BORDER, ['SERVICE', 'DISCREPANCY'],
+                         title='RECONCILIAÇÃO {} ({})'.format(report.hostname, report.ipaddr or '-'))
+    for kind, names in report.discrepancies().items():
+        label, color = RECONCILE_LABELS[kind]
+        for name in names:
+            table.add_row([colored(name, color), colored(label, color)])
+    registered = 'indisponível' if report.registered is None else len(report.registered)
+    table.add_row([colored('total', 'cyan'), 'instalados {}, em execução {}, registrados {}'.format(
+        len(report.installed), len(report.running), registered)])
     return table
 
 
-def is_running():
+def process_snapshot(fields=None):
+    """ Retorna a fotografia dos processos em execução, tirada uma vez por comando"""
+    return container.use_case_process.snapshot(fields or RUNNING_FIELDS)
+
+
+def is_running(snapshot=None):
     """ Retorna uma lista de processos em execução"""
-    process_name_list = []
-    process_dict = {}
+    snapshot = process_snapshot() if snapshot is None else snapshot
+    return snapshot.names()
 
-    for each_proc in use_case_process.list_process():
-        if each_proc is None:
-            continue
-        
-        process_name = each_proc['name']
-        process_pid = each_proc['pid']
 
-        process_name_list.append(process_name)
-        process_dict[process_name] = process_pid
+def read_pid(name_service):
+    """ Retorna o pid registrado no arquivo de PID do serviço"""
+    try:
+        with open(os.path.join(PATH_PID, "{}.pid".format(name_service))) as pid_file:
+            return int(pid_file.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None
 
-    return process_name_list
 
+def remove_pid(_path, name_service):
+    """ Remove o arquivo de PID do serviço, apenas o de nome exato (csbrain-1 não remove csbrain-10)"""
+    try:
+        os.remove(os.path.join(_path, "{}.pid".format(name_service)))
+    except FileNotFoundError:
+        pass
+    except OSError as err:
+        return err
 
-def get_file_pid(_path, file_name=None):
-    """ Retorna os arquivos de PID"""
-    r_path = os.path.join(_path, file_name)
-    for filename in glob.glob("{}/*.pid".format(_path)):
-        if filename.startswith(r_path):
-            yield filename
+
+def take_pid(_path, name_service):
+    """ Remove o arquivo de PID do serviço e retorna o seu conteúdo, None se não existia"""
+    pid_path = os.path.join(_path, "{}.pid".format(name_service))
+    try:
+        with open(pid_path) as pid_file:
+            content = pid_file.read()
+        os.remove(pid_path)
+    except OSError:
+        return None
+    return content
 
 
-def remove_pid(_path, name_service=None):
-    """ Remove arquivos de PID"""
-    for pid_file in get_file_pid(_path, name_service):
-        if os.path.exists(pid_file):
-            try:
-                os.remove(pid_file)
-            except OSError as err:
-                return err
+def restore_pid(_path, name_service, content):
+    """ Regrava o arquivo de PID retirado por take_pid, a menos que o serviço já tenha outro"""
+    try:
+        with open(os.path.join(_path, "{}.pid".format(name_service)), 'x') as pid_file:
+            pid_file.write(content)
+    except OSError:
+        pass
 
 
 def start_process(_service):
-    """ Executa um processo colocando em background."""
+    """ Executa um processo colocando em background, no ambiente do cliente quando atendido pelo csctld"""
+    from usecases.manage_process import ServiceResult
+
     cmd = [_service, "start"]
     try:
-        subprocess.run(cmd, stdout=subprocess.DEVNULL)
-    except subprocess.CalledProcessError as err:
-        return err
+        completed = subprocess.run(cmd, stdout=subprocess.DEVNULL, start_new_session=True, env=container.environ,
+                                   cwd=container.cwd)
+    except OSError as err:
+        return ServiceResult(_service, False, detail=str(err))
+    return ServiceResult(_service, completed.returncode == 0, completed.returncode,
+                         'exit {}'.format(completed.returncode))
 
 
-def do_start(_name=None, _all=False):
-    """ Inicia os processos"""
+def print_start(result):
+    """ Exibe o resultado da inicialização de um serviço"""
+    if result.ok:
+        print("🟡 Starting process: {:<60}{}".format(colored(result.name, 'cyan'), colored('done', 'yellow')))
+    else:
+        print("🔴 Starting process: {:<60}{} {}".format(colored(result.name, 'cyan'),
+                                                      colored('failed', 'red'), result.detail))
 
-    for proc in list_files():
-        if proc is None:
-            continue
-        
-        if _name:
-            if proc.startswith(_name):
-                if proc in is_running():
-                    print("🟢 Process {:<47}is already {}".format(colored(proc, 'green'), colored('running', 'green')))
-                else:
-                    print("🟡 Starting process: {:<60}{}".format(colored(proc, 'cyan'), colored('done', 'yellow')))
-                    start_process(proc)
-        if _all is True:
-            if proc in is_running():
-                print("🟢 Process {:<47}is already {}".format(colored(proc, 'green'), colored('running', 'green')))
-            else:
-                print("🟡 Starting process: {:<60}{}".format(colored(proc, 'cyan'), colored('done', 'yellow')))
-                start_process(proc)
 
+def do_start(_name=None, _all=False, snapshot=None, workers=1):
+    """ Inicia os processos, retorna a lista de resultados"""
+    snapshot = process_snapshot() if snapshot is None else snapshot
+    to_start = []
 
-def do_stop(name_service=None):
-    """ Responsável por parar os serviços """
-    
-    for proc in use_case_process.list_process():
-        if proc is None:
-            continue
-        
-        if name_service:
-            if proc['name'].startswith(name_service):
-                if psutil.pid_exists(proc['pid']):
-                    print("🔴 Stoping process: {:<47} PID: {}".format(colored(proc['name'], 'cyan'),
-                                                                    colored(proc['pid'], 'green')))
-                    os.kill(proc['pid'], signal.SIGTERM)
-                    remove_pid(PATH_PID, name_service)
-                    sleep(0.1)
+    if not _all and not _name:
+        return []
 
+    for proc in container.inventory.match(None if _all else _name):
+        if proc in snapshot:
+            print("🟢 Process {:<47}is already {}".format(colored(proc, 'green'), colored('running', 'green')))
         else:
-            if psutil.pid_exists(proc['pid']):
-                print("🔴 Stoping process: {:<47} PID: {}".format(colored(proc['name'], 'cyan'),
-                                                                colored(proc['pid'], 'green')))
+            to_start.append(proc)
 
-                os.kill(proc['pid'], signal.SIGTERM)
-                remove_pid(PATH_PID, proc['name'])
-                sleep(0.1)
+    from usecases.manage_process import ManageProcessUseCase
 
+    results = []
+    for result in ManageProcessUseCase(workers).run(start_process, to_start):
+        print_start(result)
+        snapshot.track(result.name, read_pid(result.name))
+        results.append(result)
+    return results
 
-def do_restart(name_service):
-    """ Responsável por einicia serviços """
 
-    for _proc in use_case_process.list_process():
-        if _proc is None:
-            continue
-        
-        if name_service:
-            if _proc['name'].startswith(name_service):
-                if psutil.pid_exists(_proc['pid']):
-                    print("🔴 Stoping process: {:<47} PID: {}".format(colored(_proc['name'], 'cyan'),
-                                                                     colored(_proc['pid'], 'green')))
-                    os.kill(_proc['pid'], signal.SIGTERM)
-                    remove_pid(PATH_PID, name_service)
-                    sleep(0.1)
-                    print("🟡 Starting process: {:<60}{}".format(colored(_proc['name'], 'cyan'), colored('done', 'yellow')))
-                    start_process(_proc['name'])
-        else:
-            if psutil.pid_exists(_proc['pid']):
-                print("🔴 Stoping process: {:<47} PID: {}".format(colored(_proc['name'], 'cyan'),
-                                                                 colored(_proc['pid'], 'green')))
+def print_stop(proc, result):
+    """ Exibe o resultado da parada de um serviço"""
+    print("🔴 Stoping process: {:<47} PID: {} {}".format(colored(proc['name'], 'cyan'), colored(proc['pid'], 'green'),
+                                                       colored(result.detail, 'yellow' if result.ok else 'red')))
+
+
+def stop_processes(targets, grace=None):
+    """ Sinaliza todos os processos, aguarda a saída em conjunto e remove os arquivos de PID
+
+        Os arquivos de PID são retirados antes do SIGTERM: a ausência do arquivo é a marca de
+        parada do operador lida pelo csctl supervise, que assim não reinicia um serviço que
+        termina enquanto os demais ainda são aguardados. Se a parada falhar o arquivo é regravado.
+    """
+    from usecases.manage_process import StopProcessUseCase, parse_grace_overrides
+
+    grace = settings.STOP_GRACE_TIMEOUT if grace is None else grace
+    pid_files = {proc['name']: take_pid(PATH_PID, proc['name']) for proc in targets}
+    results = StopProcessUseCase(grace, overrides=parse_grace_overrides(settings.STOP_GRACE_OVERRIDES)).stop(targets)
+
+    for proc, result in zip(targets, results):
+        print_stop(proc, result)
+        if not result.ok and pid_files[proc['name']] is not None:
+            restore_pid(PATH_PID, proc['name'], pid_files[proc['name']])
+    return results
+
+
+def do_stop(name_service=None, snapshot=None, grace=None):
+    """ Responsável por parar os serviços, retorna a lista de resultados"""
+    snapshot = process_snapshot() if snapshot is None else snapshot
+    targets = snapshot.select(name_service)
+
+    results = stop_processes(targets, grace)
+
+    snapshot.refresh([proc['pid'] for proc in targets])
+    return results
+
+
+def do_restart(name_service, snapshot=None, workers=1, grace=None):
+    """ Responsável por einicia serviços, retorna as paradas que falharam e o resultado de cada início
+
+        Todos os alvos são parados e aguardados antes de qualquer início, evitando que o
+        script de init encontre o processo anterior ainda em execução.
+    """
+    from usecases.manage_process import ManageProcessUseCase
+
+    snapshot = process_snapshot() if snapshot is None else snapshot
+    targets = snapshot.select(name_service)
 
-                os.kill(_proc['pid'], signal.SIGTERM)
-                remove_pid(PATH_PID, _proc['name'])
-                sleep(0.1)
-                print("🟡 Starting process: {:<60}{}".format(colored(_proc['name'], 'cyan'), colored('done', 'yellow')))
-                start_process(_proc['name'])
+    results = stop_processes(targets, grace)
+    snapshot.refresh([proc['pid'] for proc in targets])
+
+    stopped = [proc['name'] for proc, result in zip(targets, results) if result.ok]
+    results = [result for result in results if not result.ok]
+
+    for result in ManageProcessUseCase(workers).run(start_process, stopped):
+        print_start(result)
+        snapshot.track(result.name, read_pid(result.name))
+        results.append(result)
+    return results
+
+
+def service_port(name_service):
+    """ Retorna a porta HTTP gravada no script de init do serviço (ver create_services) ou None"""
+    try:
+        with open(os.path.join(PATH_INITD, name_service)) as script:
+            match = re.search(r'http_port=(\d+)', script.read())
+    except OSError:
+        return None
+    return int(match.group(1)) if match else None
+
+
+def is_alive(name_service):
+    """ Retorna True se o processo registrado no arquivo de PID existe"""
+    import psutil
+
+    pid = read_pid(name_service)
+    if pid is None:
+        return False
+    try:
+        return psutil.Process(pid).status() != psutil.STATUS_ZOMBIE
+    except (psutil.NoSuchProcess, psutil.AccessDenied):
+        return False
+
+
+def wait_ready(names, timeout=None, http_path=None, check_alive=True):
+    """ Aguarda os serviços ficarem prontos: processo ativo e porta HTTP respondendo"""
+    from infra.readiness import ReadinessProbe
+
+    probe = ReadinessProbe(http_path=settings.READY_HTTP_PATH if http_path is None else http_path,
+                           timeout=settings.READY_TIMEOUT if timeout is None else timeout,
+                           alive=is_alive if check_alive else None)
+    return probe.probe({name: service_port(name) for name in names})
+
+
+def print_ready(probe_results):
+    """ Exibe o resultado da verificação de prontidão, retorna os serviços que não ficaram prontos"""
+    from usecases.manage_process import ServiceResult
+
+    failed = []
+    for probe in probe_results:
+        if probe.ready:
+            state = colored('ready', 'green')
+        else:
+            state = "{} {}".format(colored('not ready', 'red'), probe.detail)
+            failed.append(ServiceResult(probe.name, False, detail='not ready'))
+        print("🔵 Readiness: {:<67}{}".format(colored(probe.name, 'cyan'), state))
+    return failed
+
+
+def do_rolling_restart(name_service, batch=1, snapshot=None, grace=None, ready_timeout=None, http_path=None):
+    """ Reinicia os serviços em lotes de `batch`, avançando apenas quando o lote está pronto"""
+    from usecases.manage_process import ManageProcessUseCase
+
+    snapshot = process_snapshot() if snapshot is None else snapshot
+    targets = sorted(snapshot.select(name_service), key=lambda proc: proc['name'])
+    batch = max(1, batch)
+
+    failed = []
+    for index in range(0, len(targets), batch):
+        group = targets[index:index + batch]
+        results = stop_processes(group, grace)
+        snapshot.refresh([proc['pid'] for proc in group])
+        failed.extend(result for result in results if not result.ok)
+
+        stopped = [proc['name'] for proc, result in zip(group, results) if result.ok]
+        for result in ManageProcessUseCase(len(stopped)).run(start_process, stopped):
+            print_start(result)
+            snapshot.track(result.name, read_pid(result.name))
+            if not result.ok:
+                failed.append(result)
+
+        not_ready = print_ready(wait_ready(stopped, ready_timeout, http_path))
+        if not_ready:
+            failed.extend(not_ready)
+            remaining = [proc['name'] for proc in targets[index + batch:]]
+            if remaining:
+                print(f"{term_color} AVISO! Reinício interrompido, serviços não reiniciados: {', '.join(remaining)}")
+            break
+    return failed
+
+
+def exit_on_failure(results):
+    """ Finaliza com código de saída 1 se alguma operação falhou"""
+    if any(not result.ok for result in results):
+        sys.exit(1)
 
 
 def basename():
     """Retorna uma lista com basename dos arquivos"""
-    list_services = []
-    for files in use_case_files.list_files():
-        service = os.path.basename(files)
-        list_services.append(service)
-    return list_services
+    return container.inventory.names()
 
 
 def copy_file(file_source, file_target):
@@ -336,14 +567,10 @@ def remove_file_or_linnk(file_or_link):
 
 def template_service(service_name):
     """ Retorna um template com base no serviço instalado"""
-    for service in basename():
-        if service.startswith(service_name):
-            try:
-                if os.path.isfile(os.path.join(PATH_INITD, service)):
-                    template = os.path.join(PATH_INITD, service)
-                    return template
-            except FileNotFoundError as err:
-                return err
+    for service in container.inventory.select(service_name):
+        template = os.path.join(PATH_INITD, service)
+        if os.path.isfile(template):
+            return template
 
 
 def list_range(n_range: list) -> list:
@@ -359,54 +586,47 @@ def list_range(n_range: list) -> list:
     return number_list
 
 
-def gen_port(service_name: str, script_path: str) -> str:
-    """ Gera porta dinamicamente para os serviços HTTP """
-    script_file = os.path.join(os.path.dirname(os.path.abspath(script_path)), service_name)
+def provisioner():
+    """ Retorna o caso de uso que cria os scripts de init a partir do template csinit"""
+    from usecases.provision import ProvisionServicesUseCase
+    return ProvisionServicesUseCase(PATH_SCRIPT, TEMPLATE, PATH_INITD, PATH_SBIN, ports=container.repo_ports)
 
-    sock = socket.socket()
-    sock.bind(('', 0))
 
-    new_port = sock.getsockname()[1]
+def print_provision(result):
+    """ Exibe o resultado da criação de um serviço"""
+    if not result.ok:
+        print(f"{term_color} Falha ao adicionar {colored(result.name, 'red')}: {result.detail}")
+        return
+    port = f" porta {colored(result.port, 'cyan')}" if result.port else ''
+    print(f"{term_color} Adicionando serviço {colored(result.name, 'green')}{port}")
+    if result.detail:
+        print(f"{term_color} AVISO! {result.detail}")
 
-    with open(script_file, 'r') as file:
-        file_content = file.read()
 
-    replace = file_content.replace('None', str(new_port))
+def taken_ports():
+    """ Portas em LISTEN no host e as gravadas nos scripts instalados antes do ledger"""
+    from repository.procfs_repo import listening_ports
 
-    with open(script_file, 'w') as file:
-        file.write(replace)
-    file.close()
-    return str(new_port)
+    taken = listening_ports()
+    taken.update(port for port in map(service_port, container.inventory) if port)
+    return taken
 
 
-def rendering(name, template_name=None, output_path=None, template_path=None, port=None):
-    """ Renderiza templates de scripts"""
-    try:
-        loader = FileSystemLoader('{}'.format(template_path))
-        env = Environment(loader=loader, autoescape=True)
-        template = env.get_template(TEMPLATE)
-        output_template = os.path.join(output_path, template_name)
-
-        with open(output_template, "w") as script:
-            render = template.render(name=name, port=port)
-            script.write(render)
-            script.close()
-    except FileExistsError as err:
-        return err
-
-
-def create_service(name, service_name):
-    """ Cria os serviços propriamente dito"""
-    print(f"{term_color} Adicionando serviço {colored(service_name, 'green')}")
+def create_services(name, service_names):
+    """ Cria os serviços em lote, BRAIN e RENDER recebem uma porta HTTP do ledger"""
+    from repository.port_ledger import PortsExhausted
 
-    rendering(name, template_name=service_name, output_path=PATH_INITD, template_path=PATH_SCRIPT)
-    script_basename = os.path.join(PATH_INITD, service_name)
-    os.chmod(script_basename, stat.S_IXUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IWGRP | stat.S_IROTH)
-    link = os.path.join(PATH_SBIN, service_name)
-    create_link(script_basename, link)
-
-    if name.startswith(BRAIN) or name.startswith(RENDER):
-        gen_port(service_name, script_basename)
+    http = name.startswith(BRAIN) or name.startswith(RENDER)
+    try:
+        results = provisioner().provision(name, service_names, http=http, taken=taken_ports() if http else set())
+    except PortsExhausted as err:
+        print(f"{term_color} AVISO! {err}, ajuste PORT_RANGES.")
+        sys.exit(1)
+    for result in results:
+        print_provision(result)
+        if result.ok:
+            container.inventory.add(result.name)
+    return results
 
 
 def normalize_name_service(name):
@@ -418,36 +638,37 @@ def normalize_name_service(name):
 
 def add_single_service(name):
     """ Adiciona serviços invidualmente"""
-    source = normalize_name_service(name)
-    for n in use_case_dirs.list_dirs:
-        if source.startswith(n):
-            if name in basename():
-                print(f"{term_color} Serviço {colored(name, 'green')} já existe!")
-                sys.exit(1)
-            create_service(n, name)
+    component = container.inventory.component(name)
+    if component:
+        if name in container.inventory:
+            print(f"{term_color} Serviço {colored(name, 'green')} já existe!")
+            sys.exit(1)
+        exit_on_failure(create_services(component, [name]))
 
 
 def add_mulple_service(name, between=None):
-    """Adiciona um range de serviço"""
+    """Adiciona um range de serviço, o template é compilado uma vez para todo o range"""
     full_name = name
     name = normalize_name_service(name)
 
     if name.startswith(BRAIN):
         name = re.findall(BRAIN, name)[0]
 
-    if name in use_case_dirs.list_dirs:
+    if name in container.inventory.components:
         if name and between:
+            installed = container.inventory
+            service_names = []
             for number in list_range(between):
                 service_name = PREFIX + name + "-" + str(number)
 
                 if name == BRAIN:
                     service_name = full_name + "-" + str(number)
 
-                if service_name in basename():
+                if service_name in installed:
                     print(f"{term_color} Serviço {colored(service_name, 'green')} já existe!")
                     continue
-                create_service(name, service_name)
-                time.sleep(0.2)
+                service_names.append(service_name)
+            exit_on_failure(create_services(name, service_names))
     return
 
 
@@ -465,6 +686,10 @@ def remove_single_or_more_service(service):
         print(f"{term_color} Removendo link {colored(dest, 'cyan')}")
         remove_file_or_linnk(dest)
 
+    for port in container.repo_ports.release([service]).values():
+        print(f"{term_color} Liberando porta {colored(port, 'cyan')}")
+    container.inventory.discard(service)
+
     return
 
 
@@ -473,89 +698,246 @@ def to_remove(name, between=None):
     if name and between:
         for number in list_range(between):
             service_name = name + "-" + str(number)
-            if service_name not in basename():
+            if service_name not in container.inventory:
                 print(f"{term_color} Serviço {colored(service_name, 'green')} não encontrado.")
                 continue
 
             remove_single_or_more_service(service_name)
             time.sleep(0.2)
 
-    if name and name in basename():
+    if name and name in container.inventory:
         remove_single_or_more_service(name)
     else:
         print(f"{term_color} Serviço {colored(name, 'green')} não encontrado.")
     return
 
 
+def params_rows(service):
+    """ Produz os parâmetros de execução do serviço com os seus valores"""
+    for p in container.use_case_process.list_process(PARAMS_FIELDS, service=service):
+        if p is None or service != p['name']:
+            continue
+
+        arguments = p['arguments'][2::]
+        for param, value in zip(p['parameters'], arguments):
+            yield {'kind': 'parameter', 'service': service, 'parameter': param, 'value': value}
+
+
 def view_params(service):
     """ Retorna os parametros de execução"""
     table = pretty_table(columns=SINGLE_BORDER, fields=['PARAMETER', 'VALUE'], title='PARÂMETROS DE EXECUÇÃO')
 
-    for p in use_case_process.list_process():
-        if p is None:
-            continue
-        
-        if service == p['name']:
-            argument = p['arguments']
-            arguments = argument[2::]
-            params = p['parameters']
-        
-            for i, param in enumerate(params):
-                if i < len(arguments):
-                    table.add_row([colored(param, 'cyan'), colored(arguments[i], 'green')])
+    for row in params_rows(service):
+        table.add_row([colored(row['parameter'], 'cyan'), colored(row['value'], 'green')])
     return table
 
 
+def connection_rows(service):
+    """ Produz as conexões do serviço, os sockets em LISTEN sem endereço remoto"""
+    for c in container.use_case_process.list_process(CONNECTIONS_FIELDS, service=service):
+        if c is None or service != c['name']:
+            continue
+
+        for i in c['connections']:
+            _status = i[5]
+            laddr, lport = i[3][0], i[3][1]
+            if laddr == '::':
+                continue
+            if _status == 'LISTEN':
+                yield {'kind': 'connection', 'service': service, 'laddr': laddr, 'lport': lport,
+                       'raddr': None, 'rport': None, 'status': _status}
+            if not i[4]:
+                continue
+            yield {'kind': 'connection', 'service': service, 'laddr': laddr, 'lport': lport,
+                   'raddr': i[4][0], 'rport': i[4][1], 'status': _status}
+
+
 def view_conectios(service):
     """ Responsável por exibir todas as conexões ativas de um serviço"""
     table = pretty_table(columns=SINGLE_BORDER, fields=['LADDR', 'LPORT', 'RADDR', 'RPORT', 'STATUS'],
                          title='CONEXÕES')
 
-    for c in use_case_process.list_process():
-        if c is None:
-            continue
-        
-        service_name = c['name']
-        if service == service_name:
-            connections = c['connections']
-            for i in connections:
-                _status = i[5]
-                laddr = i[3][0]
-                if laddr == '::':
-                    continue
-                if _status == 'LISTEN':
-                    laddr = i[3][0]
-                    lport = i[3][1]
-                    table.add_row([colored(laddr, 'green'), colored(lport, 'cyan'), '', '', colored(_status, 'cyan')])
-                laddr = i[3][0]
-                lport = i[3][1]
-                raddr = i[4]
-                if not raddr:
-                    continue
-                raddr = i[4][0]
-                rport = i[4][1]
-                table.add_row([colored(laddr, 'green'), colored(lport, 'cyan'), colored(raddr, 'green'),
-                               colored(rport, 'cyan'), colored(_status, 'yellow')])
+    for row in connection_rows(service):
+        if row['raddr'] is None:
+            table.add_row([colored(row['laddr'], 'green'), colored(row['lport'], 'cyan'), '', '',
+                           colored(row['status'], 'cyan')])
+        else:
+            table.add_row([colored(row['laddr'], 'green'), colored(row['lport'], 'cyan'),
+                           colored(row['raddr'], 'green'), colored(row['rport'], 'cyan'),
+                           colored(row['status'], 'yellow')])
     return table
 
 
+def environ_rows(service):
+    """ Produz as variáveis CS* do ambiente do serviço"""
+    for e in container.use_case_process.list_process(ENVIRON_FIELDS, service=service):
+        if e is None or service != e['name']:
+            continue
+
+        for k, v in (e['environ'] or {}).items():
+            if k.startswith('CS'):
+                yield {'kind': 'environ', 'service': service, 'name': k, 'value': v}
+
+
 def view_env(service):
     """ Responsável por exibir uma tabela com todas as variáveis carregadas"""
     table = pretty_table(columns=SINGLE_BORDER, fields=['ENVIRON', 'VALUE'], title='VARIÁVEIS DE AMBIENTE')
-    for e in use_case_process.list_process():
-        if e is None:
-            continue
-        
-        service_name = e['name']
-        environ = e['environ']
-
-        if service == service_name:
-            for k, v in environ.items():
-                if k.startswith('CS'):
-                    table.add_row([colored(k, 'cyan'), colored(v, 'green')])
+    for row in environ_rows(service):
+        table.add_row([colored(row['name'], 'cyan'), colored(row['value'], 'green')])
+    return table
+
+
+def show_rows(targets, env=False, params=False, conn=False):
+    """ Produz as linhas do show para cada serviço, na mesma ordem das tabelas"""
+    for target in targets:
+        if env:
+            yield from environ_rows(target)
+        if params:
+            yield from params_rows(target)
+        if conn:
+            yield from connection_rows(target)
+
+
+def print_status(name_service=None, interval=None, wait_ready_timeout=None, output='table'):
+    """ Exibe o status em tabela ou grava as linhas no formato `output`"""
+    if output == 'table':
+        print(do_status(name_service, interval=interval, wait_ready_timeout=wait_ready_timeout))
+        return
+    from infra.output import write_rows
+    write_rows(status_rows(name_service, interval, wait_ready_timeout), output)
+
+
+def top_lines(rows, name_service=None, sort='cpu', interval=2.0):
+    """ Monta o quadro do top, sem cores para que as linhas iguais não sejam redesenhadas"""
+    lines = ['csctl top  {}  {} serviços  grupo {}  ordem {}  intervalo {}s'.format(
+                 time.strftime('%H:%M:%S'), len(rows), name_service or '*', sort, interval),
+             '',
+             '{:<32} {:>8} {:>6} {:>6} {:>10} {:>7}  {}'.format('NAME', 'PID', 'CPU%', 'MEM%', 'RSS MB', 'THREADS',
+                                                                 'STARTED')]
+    for row in rows:
+        lines.append('{:<32} {:>8} {:>6.1f} {:>6.1f} {:>10.1f} {:>7}  {}'.format(
+            row.name, row.pid, row.cpu_percent, row.memory_percent, row.rss / 1048576, row.threads,
+            time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(row.create_time))))
+    return lines
+
+
+def do_top(name_service=None, sort='cpu', interval=2.0, iterations=0):
+    """ Exibe continuamente os processos dos serviços até Ctrl-C ou `iterations` atualizações"""
+    from entities.service_selector import ServiceSelector
+    from infra.terminal import DiffScreen
+    from usecases.top import ProcessTopUseCase
+
+    top_use_case = ProcessTopUseCase(container.repo_process, ServiceSelector(name_service).matches)
+    count = 0
+    with DiffScreen() as screen:
+        try:
+            while True:
+                screen.draw(top_lines(top_use_case.tick(sort), name_service, sort, interval))
+                count += 1
+                if iterations and count >= iterations:
+                    break
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+
+
+def supervisor_restarts():
+    """ Retorna os reinícios por serviço registrados pelo supervisor"""
+    from usecases.supervisor import Supervisor
+
+    state = Supervisor.load_state(SUPERVISOR_STATE) or {}
+    return {name: service['restarts'] for name, service in state.get('services', {}).items()}
+
+
+def installed_services():
+    """ Relê os scripts instalados, usado pelos comandos de longa duração"""
+    reload_inventory()
+    return list_files()
+
+
+def do_exporter(host, port, ttl):
+    """ Serve /metrics até Ctrl-C"""
+    from infra.exporter import make_server
+    from usecases.metrics import ServiceMetricsUseCase
+
+    metrics = ServiceMetricsUseCase(container.repo_process, installed_services, supervisor_restarts, ttl=ttl)
+    server = make_server(metrics, host, port)
+    print(f"{term_color} Exportando métricas em http://{host}:{server.server_address[1]}/metrics")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def parse_duration(value):
+    """ Converte 90, 30s, 10m, 2h ou 1d em segundos"""
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+    value = str(value).strip().lower()
+    if value and value[-1] in units:
+        return float(value[:-1]) * units[value[-1]]
+    return float(value)
+
+
+def history_rows(name_service, since, step=None):
+    """ Produz as janelas do histórico guardado pelo csctld para os serviços selecionados"""
+    from entities.service_selector import ServiceSelector
+
+    selector = ServiceSelector(name_service)
+    names = [name for name in container.history.services() if selector.matches(name)]
+    for row in container.history.query(names, since, step):
+        yield dict(row, time=time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(row['time'])))
+
+
+def do_history(name_service, since, step=None):
+    """ Retorna a tabela do histórico dos serviços"""
+    table = pretty_table(PLAIN_COLUMNS, ['SERVICE', 'TIME', 'CPU%', 'RSS MB', 'FDS', 'CONN'])
+    for row in history_rows(name_service, since, step):
+        table.add_row([colored(row['service'], 'cyan'), row['time'],
+                       '-' if row['cpu_percent'] is None else '{:.1f}'.format(row['cpu_percent']),
+                       '-' if row['rss_kb'] is None else '{:.1f}'.format(row['rss_kb'] / 1024),
+                       '-' if row['fds'] is None else row['fds'],
+                       '-' if row['connections'] is None else row['connections']])
+    return table
+
+
+def supervisor_status():
+    """ Retorna uma tabela com o estado e os contadores de reinício do supervisor"""
+    import psutil
+    from usecases.supervisor import Supervisor
+
+    table = pretty_table(columns=SINGLE_BORDER, fields=['SERVICE', 'STATE', 'PID', 'RESTARTS', 'LAST EXIT'],
+                         title='SUPERVISOR')
+    state = Supervisor.load_state(SUPERVISOR_STATE)
+    if state is None:
+        return f"{term_color} Supervisor sem estado registrado em {SUPERVISOR_STATE}."
+
+    if not psutil.pid_exists(state['pid']):
+        table.title = colored('SUPERVISOR (parado)', 'red')
+
+    colors = {'running': 'green', 'backoff': 'red', 'exited': 'red', 'stopped': 'yellow', 'pending': 'cyan'}
+    for name, service in sorted(state['services'].items()):
+        last_exit = '-'
+        if service['exited_at']:
+            last_exit = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(service['exited_at']))
+        table.add_row([colored(name, 'cyan'), colored(service['state'], colors.get(service['state'], 'white')),
+                       service['pid'] or '-', service['restarts'], last_exit])
     return table
 
 
+def do_supervise(name_service=None):
+    """ Supervisiona os serviços instalados, reiniciando os que terminarem"""
+    from usecases.supervisor import Supervisor
+
+    names = container.inventory.match(name_service)
+    os.makedirs(PATH_PID, exist_ok=True)
+    print(f"{term_color} Supervisionando {colored(len(names), 'green')} serviços, estado em {SUPERVISOR_STATE}")
+    Supervisor(names, start_process, PATH_PID, SUPERVISOR_STATE,
+               backoff_initial=settings.SUPERVISOR_BACKOFF_INITIAL, backoff_max=settings.SUPERVISOR_BACKOFF_MAX,
+               logger=logger).run()
+
+
 def documents(hostname=None, ipaddr=None, component=None, instance=None, _type=None):
     """ Retorna um dicionário com dados das instancias"""
     _repo_instance = DitcInstanceRepo(component=component, instance=instance, type=_type)
@@ -567,72 +949,99 @@ def documents(hostname=None, ipaddr=None, component=None, instance=None, _type=N
 
 
 def registry_service(instance=None, component=None, _type=None, flag=None):
-    """ Responsável por registrar instancias no mongodb"""
+    """ Responsável por registrar instancias no mongodb
+
+        Apenas a entrada do host é lida e as escritas são condicionais no próprio MongoDB: a
+        instância só é adicionada se ainda não estiver no host e o host só é cadastrado se o
+        ipaddr ainda não existir.
+    """
     warning = "AVISO! Não foi possível registrar a instância"
 
-    ipaddr = host_name.ip_addr_or_hostname[0]
-    hostname = host_name.ip_addr_or_hostname[1]
+    ipaddr = container.host_name.ip_addr_or_hostname[0]
+    hostname = container.host_name.ip_addr_or_hostname[1]
 
     fmt_instance, fmt_ipaddr = colored(instance, 'green'), colored(ipaddr, 'cyan')
 
-    data_list = []
+    servers = container.use_case_instances.list_host_instances(hostname, ipaddr)
+    host = next((server for server in servers if server['ipaddr'] == ipaddr), None)
+
+    # Atualiza um hostname cadastrado
+    if not flag:
+        if host is None:
+            print(f"{term_color} {warning} {fmt_instance}, host {fmt_ipaddr} não cadastrado.")
+            return
+
+        if instance in {inst['instance'] for inst in host['instances']}:
+            print(f"{term_color} {warning} {fmt_instance}, está instância já é rgistrada.")
+            print(f"{term_color} Exibindo registro de instâncias...")
+            print(list_instances())
+            return
+
+        print(f"{term_color} Registrando instância {fmt_instance}...")
+        data = documents(component=component, instance=instance, _type=_type)
+        registered = container.use_case_update.register_instance(ipaddr, data)
+        if registered is False:
+            print(f"{term_color} {warning} {fmt_instance}, está instância já é rgistrada.")
+        elif registered is None:
+            print(f"{term_color} Instancia {fmt_instance} registrada na cópia local, envio pendente.")
+        else:
+            print(f"{term_color} Instancia {fmt_instance} registrada com sucesso!")
+        print(f"{term_color} Exibindo registro de instâncias...")
+        print(list_instances())
 
-    for i in use_case_instances.list_instances({'nome': 'instances'}, {'_id': 0, 'nome': 0}):
-        for indx in i['servers']:
-            _index = i['servers'].index(indx)
-            _value = i['servers'][_index]
+    # Cadastra um hostname
+    if flag:
+        if host is not None:
+            print(f"{term_color} {warning} {fmt_instance} e host {fmt_ipaddr} já cadastrados.")
+            print(f"{term_color} Exibindo registro de instâncias...")
+            print(list_instances())
+            return
+
+        print(f"{term_color} Cadastrando instância {fmt_instance} e host {fmt_ipaddr}...")
+        data = documents(hostname=hostname, ipaddr=ipaddr,
+                         component=component, instance=instance, _type=_type)
+
+        registered = container.use_case_update.register_server(data)
+        if registered is False:
+            print(f"{term_color} {warning} {fmt_instance} e host {fmt_ipaddr} já cadastrados.")
+        elif registered is None:
+            print(f"{term_color} Instância {fmt_instance} e host {fmt_ipaddr} registrados na cópia local, "
+                  f"envio pendente.")
+        else:
+            print(f"{term_color} Instância {fmt_instance} e host {fmt_ipaddr} registrados com sucesso!")
+        print(f"{term_color} Exibindo registro de instâncias...")
+        print(list_instances())
 
-            data_ipaddr = _value['ipaddr']
-            data_list = [data_ipaddr]
 
-        # Atualiza um hostname cadastrado
-        if not flag:
-            print(data_ipaddr)
-            if ipaddr != data_ipaddr:
-                print(f"{term_color} {warning} {fmt_instance}, host {fmt_ipaddr} não cadastrado.")
-                break
+def component_name(service_name):
+    """ Deduz o componente pelo nome do serviço, ex.: csbrain-3 -> brain"""
+    return normalize_name_service(service_name).rsplit('-', 1)[0]
 
-            if ipaddr == data_ipaddr:
-                data_instances = _value['instances']
 
-                for inst in data_instances:
-                    idx = data_instances.index(inst)
-                    data_instance = _value["instances"][idx]['instance']
-                    data_list.append(data_instance)
+def print_registration(report):
+    """ Exibe o resumo do registro em lote, retorna False se houve conflito"""
+    rows = [('added', 'green', report.added), ('pending', 'yellow', report.pending),
+            ('skipped', 'cyan', report.skipped), ('conflicted', 'red', report.conflicted)]
+    for label, color, names in rows:
+        if names:
+            print(f"{term_color} {colored(label, color)} ({len(names)}): {', '.join(sorted(names))}")
+    print(f"{term_color} {len(report.added)} adicionadas, {len(report.pending)} pendentes, "
+          f"{len(report.skipped)} ignoradas, {len(report.conflicted)} em conflito.")
+    return not report.conflicted
 
-                if instance in data_list:
-                    print(f"{term_color} {warning} {fmt_instance}, está instância já é rgistrada.")
-                    print(f"{term_color} Exibindo registro de instâncias...")
-                    print(list_instances())
-                    break
 
-                if instance != data_instance:
-                    print(f"{term_color} Registrando instância {fmt_instance}...")
-                    data = documents(component=component, instance=instance, _type=_type)
-                    use_case_update.update_instances({'nome': 'instances'},
-                                                     {"$addToSet": {f"servers.{_index}.instances": data}})
-                    print(f"{term_color} Instancia {fmt_instance} registrada com sucesso!")
-                    print(f"{term_color} Exibindo registro de instâncias...")
-                    print(list_instances())
-
-        # Cadastra um hostname
-        if flag:
-            if ipaddr == data_ipaddr:
-                print(f"{term_color} {warning} {fmt_instance} e host {fmt_ipaddr} já cadastrados.")
-                print(f"{term_color} Exibindo registro de instâncias...")
-                print(list_instances())
-                break
+def registry_many(names, component=None, _type=None, add_host=False):
+    """ Registra as instâncias de `names` no host em um único bulk_write"""
+    ipaddr = container.host_name.ip_addr_or_hostname[0]
+    hostname = container.host_name.ip_addr_or_hostname[1]
 
-            if ipaddr != data_ipaddr:
-                print(f"{term_color} Cadastrando instância {fmt_instance} e host {fmt_ipaddr}...")
-                data = documents(hostname=hostname, ipaddr=ipaddr,
-                                 component=component, instance=instance, _type=_type)
-
-                use_case_update.update_instances({'nome': 'instances'}, {"$push": {'servers': data}})
-
-                print(f"{term_color} Instância {fmt_instance} e host {fmt_ipaddr} registrados com sucesso!")
-                print(f"{term_color} Exibindo registro de instâncias...")
-                print(list_instances())
+    instances = [documents(component=component or component_name(name), instance=name, _type=_type)
+                 for name in names]
+    report = container.use_case_register.register(hostname, ipaddr, instances, add_host=add_host)
+    if not report.host_registered and not add_host:
+        print(f"{term_color} AVISO! Host {colored(ipaddr, 'cyan')} não cadastrado, use -a para cadastrá-lo.")
+        return False
+    return print_registration(report)
 
 
 @click.group('cli')
@@ -642,36 +1051,55 @@ def cli():
 
 @cli.command('start')
 @click.option('-a', '--all', is_flag=True, help="Inicia todos os serviços")
-@click.option('-g', '--group', is_flag=True, help="Inicia um grupo serviços")
+@click.option('-g', '--group', is_flag=True, help="Inicia um grupo de serviços, NAME aceita glob, faixa [1-9] e re:")
+@click.option('-P', '--parallel', type=int, default=lambda: settings.PARALLEL_WORKERS, help="Número de serviços iniciados em paralelo")
+@click.option('-w', '--wait-ready', 'wait', is_flag=True, help="Aguarda os serviços iniciados ficarem prontos")
+@click.option('--ready-timeout', type=float, default=lambda: settings.READY_TIMEOUT, help="Segundos aguardando os serviços ficarem prontos")
+@click.option('--http-path', help="Caminho HTTP usado na verificação de prontidão")
 @click.argument('name', required=False)
-def start(all, group, name):
+def start(all, group, parallel, wait, ready_timeout, http_path, name):
+    results = []
     if all:
-        do_start(_all=True)
+        results = do_start(_all=True, workers=parallel)
     if group:
-        do_start(name)
+        results = do_start(name, workers=parallel)
+    if wait:
+        results += print_ready(wait_ready([r.name for r in results if r.ok], ready_timeout, http_path))
+    exit_on_failure(results)
 
 
 @cli.command('stop')
 @click.option('-a', '--all', is_flag=True, help="Para todos os serviços")
-@click.option('-g', '--group', is_flag=True, help="Para um grupo serviços")
+@click.option('-g', '--group', is_flag=True, help="Para um grupo de serviços, NAME aceita glob, faixa [1-9] e re:")
+@click.option('-t', '--timeout', type=float, default=lambda: settings.STOP_GRACE_TIMEOUT, help="Segundos até enviar SIGKILL, exceto os serviços em STOP_GRACE_OVERRIDES")
 @click.argument('name', required=False)
-def stop(all, group, name):
+def stop(all, group, timeout, name):
+    results = []
     if all:
-        do_stop(name)
+        results = do_stop(name, grace=timeout)
     if group:
-        do_stop(name)
+        results = do_stop(name, grace=timeout)
+    exit_on_failure(results)
 
 
 @cli.command('status')
 @click.option('-a', '--all', is_flag=True, help="Exibe o status de todos os serviços")
-@click.option('-g', '--group', is_flag=True, help="Exibe o status de um grupo serviços")
+@click.option('-g', '--group', is_flag=True, help="Exibe o status de um grupo de serviços, NAME aceita glob, faixa [1-9] e re:")
+@click.option('-i', '--interval', type=float, help="Intervalo em segundos da amostragem de CPU")
+@click.option('-w', '--wait-ready', 'wait', is_flag=True, help="Aguarda e exibe a prontidão dos serviços")
+@click.option('--ready-timeout', type=float, default=lambda: settings.READY_TIMEOUT, help="Segundos aguardando os serviços ficarem prontos")
+@click.option('-o', '--output', type=click.Choice(OUTPUT_FORMATS), default='table',
+              help="Formato da saída, ndjson sem -i entrega cada processo assim que é encontrado")
 @click.argument('name', required=False, type=str)
-def status(all, group, name):
+def status(all, group, interval, wait, ready_timeout, output, name):
+    ready_timeout = ready_timeout if wait else None
+    if output == 'ndjson' and interval is None:
+        interval = 0
     if all:
-        print(do_status())
+        print_status(None, interval, ready_timeout, output)
     if group:
         if isinstance(name, str):
-            print(do_status(name))
+            print_status(name, interval, ready_timeout, output)
         else:
             print(f"{term_color} AVISO! Argumento 'nome-do-serviço' obrigatório.")
             print(f"{term_color} Exemplo: csctl status -g cstasks")
@@ -681,13 +1109,28 @@ def status(all, group, name):
 
 @cli.command('restart')
 @click.option('-a', '--all', is_flag=True, help="Reinicia todos os serviços")
-@click.option('-g', '--group', is_flag=True, help="Reinicia um grupo serviços")
+@click.option('-g', '--group', is_flag=True, help="Reinicia um grupo de serviços, NAME aceita glob, faixa [1-9] e re:")
+@click.option('-P', '--parallel', type=int, default=lambda: settings.PARALLEL_WORKERS, help="Número de serviços reiniciados em paralelo")
+@click.option('-t', '--timeout', type=float, default=lambda: settings.STOP_GRACE_TIMEOUT, help="Segundos até enviar SIGKILL, exceto os serviços em STOP_GRACE_OVERRIDES")
+@click.option('-r', '--rolling', is_flag=True, help="Reinicia em lotes aguardando cada lote ficar pronto")
+@click.option('-b', '--batch', type=int, default=1, help="Tamanho do lote no reinício gradual")
+@click.option('-w', '--wait-ready', 'wait', is_flag=True, help="Aguarda os serviços reiniciados ficarem prontos")
+@click.option('--ready-timeout', type=float, default=lambda: settings.READY_TIMEOUT, help="Segundos aguardando os serviços ficarem prontos")
+@click.option('--http-path', help="Caminho HTTP usado na verificação de prontidão")
 @click.argument('name', required=False)
-def restart(all, group, name):
-    if all:
-        do_restart(name)
-    if group:
-        do_restart(name)
+def restart(all, group, parallel, timeout, rolling, batch, wait, ready_timeout, http_path, name):
+    results = []
+    if rolling and (all or group):
+        results = do_rolling_restart(name, batch=batch, grace=timeout, ready_timeout=ready_timeout,
+                                     http_path=http_path)
+    elif all or group:
+        snapshot = process_snapshot()
+        names = [proc['name'] for proc in snapshot.select(name)]
+        results = do_restart(name, snapshot=snapshot, workers=parallel, grace=timeout)
+        if wait:
+            failed = {result.name for result in results if not result.ok}
+            results += print_ready(wait_ready([n for n in names if n not in failed], ready_timeout, http_path))
+    exit_on_failure(results)
 
 
 @cli.command('add')
@@ -717,19 +1160,36 @@ def remove(name, between, single):
 @click.option('-p', '--params', is_flag=True, help="Exibe os parametros de execução")
 @click.option('-c', '--conn', is_flag=True, help="Exibe as conexões estabelecidas")
 @click.option('-r', '--registry', is_flag=True, help="Exibe o reistro das instâncias")
+@click.option('-o', '--output', type=click.Choice(OUTPUT_FORMATS), default='table', help="Formato da saída")
 @click.argument('name', required=False)
-def show(name, env, params, conn, registry):
+def show(name, env, params, conn, registry, output):
     if registry and not name:
-        print(list_instances())
+        from repository.cached_mongo_repo import RegistryUnavailable
+
+        try:
+            if output == 'table':
+                print(list_instances())
+            else:
+                from infra.output import write_rows
+                write_rows(instance_rows(), output)
+        except RegistryUnavailable as err:
+            print(f"{term_color} AVISO! MongoDB inacessível e registro sem cópia local: {err}")
+            sys.exit(1)
 
     if name:
-        if env:
-            print(view_env(name))
-        if params:
-            print(view_params(name))
-        if conn:
-            print(view_conectios(name))
-    elif not name:
+        targets = sorted({proc['name'] for proc in process_snapshot().select(name)}) or [name]
+        if output != 'table':
+            from infra.output import write_rows
+            write_rows(show_rows(targets, env, params, conn), output)
+            return
+        for target in targets:
+            if env:
+                print(view_env(target))
+            if params:
+                print(view_params(target))
+            if conn:
+                print(view_conectios(target))
+    elif not registry:
         print(f"{term_color} AVISO! Argumento obrigatório [nome-do-serviço].")
         sys.exit(1)
 
@@ -739,12 +1199,100 @@ def show(name, env, params, conn, registry):
 @click.option('-i', '--instance',  help="Nome da instancia ou serviço")
 @click.option('-t', '--type_service',  help="Tipo da instancia, MS ou REST")
 @click.option('-a', '--add_host', help="Indica sé é para cadastrar tudo incluindo hostname")
-def regystry(component, instance, type_service, add_host):
-    if add_host:
-        registry_service(instance=instance, component=component, _type=type_service, flag=add_host)
+@click.option('-s', '--sync', is_flag=True, help="Envia as escritas pendentes e atualiza o cache local")
+@click.option('-b', '--between', help="Registra um range de instâncias, ex.: -i csbrain -b 1-50")
+@click.option('-r', '--reconcile', is_flag=True, help="Registra todos os serviços instalados ainda não registrados")
+def regystry(component, instance, type_service, add_host, sync, between, reconcile):
+    from repository.cached_mongo_repo import RegistryRejected, RegistryUnavailable
+
+    if sync:
+        sync_registry()
+        return
+
+    try:
+        if between or reconcile:
+            if reconcile:
+                names = list_files()
+            elif instance:
+                names = ["{}-{}".format(instance, number) for number in list_range(between)]
+            else:
+                print(f"{term_color} AVISO! Argumento -i/--instance obrigatório com --between.")
+                sys.exit(1)
+            if not registry_many(names, component, type_service, add_host=bool(add_host)):
+                sys.exit(1)
+            return
+
+        if add_host:
+            registry_service(instance=instance, component=component, _type=type_service, flag=add_host)
+
+        if not add_host:
+            registry_service(instance=instance, component=component, _type=type_service)
+    except RegistryUnavailable as err:
+        print(f"{term_color} AVISO! MongoDB inacessível e registro sem cópia local: {err}")
+        sys.exit(1)
+    except RegistryRejected as err:
+        print(f"{term_color} AVISO! Registro recusado pelo MongoDB, alteração descartada da cópia local: {err}")
+        sys.exit(1)
 
-    if not add_host:
-        registry_service(instance=instance, component=component, _type=type_service)
+
+@cli.command('reconcile')
+@click.option('-o', '--output', type=click.Choice(['table', 'json']), default='table', help="Formato da saída")
+@click.option('-n', '--no-registry', is_flag=True, help="Não consulta o registro de instâncias")
+@click.option('--check', is_flag=True, help="Retorna 1 quando houver divergências, para uso no cron")
+def reconcile(output, no_registry, check):
+    report = do_reconcile(with_registry=not no_registry)
+    if output == 'json':
+        import json
+        print(json.dumps(report.as_dict(), indent=2))
+    else:
+        print(reconcile_table(report))
+    if check and any(report.discrepancies().values()):
+        sys.exit(1)
+
+
+@cli.command('top')
+@click.option('-s', '--sort', type=click.Choice(['cpu', 'mem', 'name', 'pid']), default='cpu', help="Ordenação dos processos")
+@click.option('-i', '--interval', type=float, default=lambda: settings.TOP_INTERVAL, help="Segundos entre atualizações")
+@click.option('-n', '--iterations', type=int, default=0, help="Encerra após N atualizações, 0 até Ctrl-C")
+@click.argument('name', required=False)
+def top(sort, interval, iterations, name):
+    do_top(name, sort=sort, interval=max(0.1, interval), iterations=iterations)
+
+
+@cli.command('exporter')
+@click.option('-H', '--host', default=lambda: settings.EXPORTER_HOST, help="Endereço do servidor de métricas")
+@click.option('-p', '--port', type=int, default=lambda: settings.EXPORTER_PORT, help="Porta do servidor de métricas")
+@click.option('--ttl', type=float, default=lambda: settings.EXPORTER_TTL, help="Segundos em que a coleta é reaproveitada")
+def exporter(host, port, ttl):
+    do_exporter(host, port, ttl)
+
+
+@cli.command('history')
+@click.option('-s', '--since', default='10m', help="Período consultado, ex.: 90s, 10m, 2h, 1d")
+@click.option('--step', type=int, help="Resolução em segundos (HISTORY_TIERS), a mais fina que cobre o período por padrão")
+@click.option('-o', '--output', type=click.Choice(OUTPUT_FORMATS), default='table', help="Formato da saída")
+@click.argument('name')
+def history(since, step, output, name):
+    if container.history is None:
+        print(f"{term_color} AVISO! Histórico disponível apenas com o csctld em execução (HISTORY_INTERVAL > 0).")
+        sys.exit(1)
+    since = parse_duration(since)
+    if output == 'table':
+        print(do_history(name, since, step))
+    else:
+        from infra.output import write_rows
+        write_rows(history_rows(name, since, step), output)
+
+
+@cli.command('supervise')
+@click.option('-g', '--group', is_flag=True, help="Supervisiona um grupo de serviços, NAME aceita glob, faixa [1-9] e re:")
+@click.option('-s', '--status', 'show_status', is_flag=True, help="Exibe os contadores de reinício do supervisor")
+@click.argument('name', required=False)
+def supervise(group, show_status, name):
+    if show_status:
+        print(supervisor_status())
+        return
+    do_supervise(name if group else None)
 
 
 def main():
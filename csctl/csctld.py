@@ -0,0 +1,242 @@
+""" csctld - processo residente que atende o csctl por um socket Unix.
+
+    Mantém importados os módulos pesados, a conexão com o MongoDB, a lista de scripts
+    instalados e a fotografia de processos, evitando o custo de inicialização a cada
+    chamada do csctl. Em segundo plano reenvia as escritas pendentes do registro e renova
+    a cópia local quando ela vence, e amostra os serviços para o `csctl history`.
+
+    Protocolo (uma linha JSON por mensagem, uma requisição por conexão):
+        cliente -> {"a": [argv...], "t": tty, "env": {ambiente}, "cwd": diretório}
+        daemon  -> {"o": "saída"} ... {"e": "erro"} ... {"c": código de saída}
+"""
+import contextlib
+import io
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+import click
+
+import csctl
+
+# Comandos que alteram processos ou scripts, invalidam o estado em cache
+MUTATING_COMMANDS = {'start', 'stop', 'restart', 'add', 'remove'}
+# Comandos de longa duração que não podem ocupar o daemon
+LOCAL_COMMANDS = {'supervise', 'top', 'exporter'}
+# Segundos aguardando a requisição de um cliente conectado
+REQUEST_TIMEOUT = 5.0
+
+
+class SocketWriter(io.TextIOBase):
+    """ Envia cada escrita ao cliente assim que é produzida"""
+
+    def __init__(self, conn, key):
+        self.conn = conn
+        self.key = key
+
+    encoding = 'utf-8'
+
+    def write(self, text):
+        if isinstance(text, (bytes, bytearray)):
+            text = text.decode(self.encoding, errors='replace')
+        if text:
+            self.conn.sendall(json.dumps({self.key: text}).encode() + b'\n')
+        return len(text)
+
+    def isatty(self):
+        return False
+
+
+class Daemon:
+    def __init__(self, socket_path, snapshot_ttl, sync_interval, history_interval=0, history_tiers=None):
+        self.socket_path = socket_path
+        self.snapshot_ttl = snapshot_ttl
+        self.sync_interval = sync_interval
+        self.history_interval = history_interval
+        self.history_tiers = history_tiers
+        self.running = False
+        self.stopped = threading.Event()
+        self.inventory_mtime = None
+        self.history_inventory = None
+        self.history_mtime = None
+
+    def serve(self):
+        """ Atende as requisições sequencialmente até receber SIGTERM ou SIGINT"""
+        csctl.container.use_case_process.cache_ttl = self.snapshot_ttl
+        os.makedirs(os.path.dirname(self.socket_path), exist_ok=True)
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.socket_path)
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        server.listen(16)
+        server.settimeout(1.0)
+
+        self.running = True
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *_: setattr(self, 'running', False))
+
+        if self.sync_interval > 0:
+            threading.Thread(target=self.sync_registry, name='registry-sync', daemon=True).start()
+        if self.history_interval > 0:
+            self.start_history()
+
+        csctl.logger.info('csctld listening on %s', self.socket_path)
+        try:
+            while self.running:
+                try:
+                    conn, _ = server.accept()
+                except socket.timeout:
+                    continue
+                with conn:
+                    self.handle(conn)
+        finally:
+            self.stopped.set()
+            server.close()
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self.socket_path)
+
+    def handle(self, conn):
+        conn.settimeout(REQUEST_TIMEOUT)
+        try:
+            request = json.loads(conn.makefile('rb').readline() or b'{}')
+            argv = [str(arg) for arg in request.get('a', [])]
+        except socket.timeout:
+            csctl.logger.warning('client sent no request in %.0fs, closing', REQUEST_TIMEOUT)
+            return
+        except ValueError:
+            conn.sendall(b'{"e": "invalid request\\n"}\n{"c": 2}\n')
+            return
+        conn.settimeout(None)
+
+        if argv and argv[0] in LOCAL_COMMANDS:
+            conn.sendall(json.dumps({'e': 'csctld: {} must run locally\n'.format(argv[0])}).encode() + b'\n{"c": 2}\n')
+            return
+
+        started = time.monotonic()
+        self.refresh_inventory()
+        code = self.execute(argv, conn, bool(request.get('t')), request.get('env'), request.get('cwd'))
+        if argv and argv[0] in MUTATING_COMMANDS:
+            csctl.container.use_case_process.invalidate()
+        with contextlib.suppress(OSError):
+            conn.sendall(json.dumps({'c': code}).encode() + b'\n')
+        csctl.logger.info('%s -> %s (%.3fs)', ' '.join(argv), code, time.monotonic() - started)
+
+    def execute(self, argv, conn, tty, environ=None, cwd=None):
+        """ Executa o comando click em processo, encaminhando stdout e stderr ao cliente
+
+            O ambiente e o diretório do cliente valem para os subprocessos do comando (scripts de
+            init) através do container, o os.environ do daemon não é alterado.
+        """
+        stdout, stderr = SocketWriter(conn, 'o'), SocketWriter(conn, 'e')
+        container = csctl.container
+        container.color = tty
+        container.environ = {str(k): str(v) for k, v in environ.items()} if isinstance(environ, dict) else None
+        container.cwd = cwd if isinstance(cwd, str) and os.path.isdir(cwd) else None
+        try:
+            with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+                code = csctl.cli.main(args=argv, prog_name='csctl', standalone_mode=False)
+            return code if isinstance(code, int) else 0
+        except click.exceptions.Exit as exit_:
+            return exit_.exit_code
+        except click.ClickException as err:
+            err.show(file=stderr)
+            return err.exit_code
+        except click.Abort:
+            return 1
+        except SystemExit as exit_:
+            return exit_.code if isinstance(exit_.code, int) else (0 if exit_.code is None else 1)
+        except BrokenPipeError:
+            return 1
+        except Exception as err:
+            csctl.logger.exception('command %s failed', argv)
+            with contextlib.suppress(OSError):
+                stderr.write('csctld: {}\n'.format(err))
+            return 1
+        finally:
+            container.color = container.environ = container.cwd = None
+
+    def sync_registry(self):
+        """ Sincroniza o registro enquanto houver escritas pendentes ou a cópia local estiver vencida"""
+        from repository.cached_mongo_repo import RegistryRejected, RegistryUnavailable
+
+        while not self.stopped.wait(self.sync_interval):
+            repo = csctl.container.repo_instance
+            state = repo.status()
+            expired = state['fetched_at'] is not None and time.time() - state['fetched_at'] > repo.max_age
+            if repo.offline or not (state['pending'] or expired):
+                continue
+            try:
+                state = repo.sync()
+                csctl.logger.info('registry synced, %s writes replayed, revision %s', state['applied'],
+                                  state['revision'])
+            except RegistryUnavailable as err:
+                csctl.logger.warning('registry sync failed, %s writes pending: %s', state['pending'], err)
+            except RegistryRejected as err:
+                csctl.logger.warning('registry rejected writes, dropped: %s', err)
+            except Exception:
+                csctl.logger.exception('registry sync failed')
+
+    def start_history(self):
+        """ Inicia a amostragem dos serviços consultada pelo csctl history"""
+        from entities.timeseries import parse_tiers
+        from usecases.history import HistoryRecorder
+        from usecases.metrics import ServiceMetricsUseCase
+
+        metrics = ServiceMetricsUseCase(csctl.container.repo_process, installed=self.installed_services)
+        # Conexões contadas cerca de uma vez por minuto, a leitura percorre os sockets do host
+        recorder = HistoryRecorder(metrics.collect, parse_tiers(self.history_tiers), interval=self.history_interval,
+                                   connections_every=max(1, round(60 / self.history_interval)))
+        csctl.container.history = recorder
+        threading.Thread(target=recorder.run, args=(self.stopped, csctl.logger), name='history',
+                         daemon=True).start()
+
+    def installed_services(self):
+        """ Scripts instalados para a amostragem, relidos apenas quando o diretório muda
+
+            A thread de histórico mantém o seu próprio ServiceInventory: o do container pertence
+            ao comando em atendimento e não é recriado no meio dele.
+        """
+        from entities.service_inventory import ServiceInventory
+        from repository.inmemory_repo import ListFilesRepo
+
+        try:
+            mtime = os.stat(csctl.PATH_INITD).st_mtime_ns
+        except OSError:
+            mtime = None
+        if self.history_inventory is None or mtime != self.history_mtime:
+            settings = csctl.settings
+            scripts = ListFilesRepo(settings.PREFIX, settings.PATH_INITD).list_files if mtime is not None else ()
+            self.history_inventory = ServiceInventory((os.path.basename(path) for path in scripts),
+                                                      prefix=settings.PREFIX)
+            self.history_mtime = mtime
+        return self.history_inventory.names()
+
+    def refresh_inventory(self):
+        """ Recarrega os scripts instalados apenas quando o diretório foi alterado"""
+        try:
+            mtime = os.stat(csctl.PATH_INITD).st_mtime_ns
+        except OSError:
+            return
+        if mtime != self.inventory_mtime:
+            csctl.reload_inventory()
+            self.inventory_mtime = mtime
+
+
+def main():
+    Daemon(csctl.settings.DAEMON_SOCKET, csctl.settings.DAEMON_SNAPSHOT_TTL,
+           csctl.settings.REGISTRY_SYNC_INTERVAL, csctl.settings.HISTORY_INTERVAL,
+           csctl.settings.HISTORY_TIERS).serve()
+
+
+if __name__ == '__main__':
+    if sys.version_info >= (3, 6):
+        main()
+    else:
+        print("Versão do Python {} não suportada!".format(sys.version.split('\n')[0]))
+        sys.exit(1)
@@ -0,0 +1,92 @@
+import os
+
+from entities.service_process import ServiceProcess
+from entities.service_selector import ServiceSelector, ServiceTrie
+
+
+class ProcessSnapshot:
+    """ Fotografia da tabela de processos dos serviços.
+
+        Tirada uma única vez por comando e indexada por nome do serviço e por pid, as consultas
+        são O(1) e as seleções de grupo descem por uma trie dos nomes em execução. Depois de
+        sinalizar ou iniciar serviços apenas os pids envolvidos são reavaliados através de
+        refresh() e track().
+    """
+
+    def __init__(self, records=()):
+        self.__by_name = {}
+        self.__by_pid = {}
+        self.__trie = ServiceTrie()
+        for record in records:
+            self.add(record)
+
+    def add(self, record):
+        """ Indexa um registro de processo"""
+        self.__by_pid[record['pid']] = record
+        if record['name'] not in self.__by_name:
+            self.__by_name[record['name']] = []
+            self.__trie.add(record['name'])
+        self.__by_name[record['name']].append(record)
+
+    def discard(self, pid):
+        """ Remove um processo do índice"""
+        record = self.__by_pid.pop(pid, None)
+        if record is None:
+            return None
+        records = self.__by_name[record['name']]
+        records.remove(record)
+        if not records:
+            del self.__by_name[record['name']]
+            self.__trie.discard(record['name'])
+        return record
+
+    def track(self, name, pid):
+        """ Registra um processo iniciado após a fotografia"""
+        if pid is not None and self.is_alive(pid):
+            self.add(ServiceProcess(name, pid))
+
+    def refresh(self, pids):
+        """ Reavalia apenas os pids informados, descartando os que não existem mais"""
+        gone = []
+        for pid in pids:
+            if pid in self.__by_pid and not self.is_alive(pid):
+                gone.append(self.discard(pid))
+        return gone
+
+    def get(self, name):
+        """ Retorna o registro do serviço ou None"""
+        records = self.__by_name.get(name)
+        return records[0] if records else None
+
+    def by_pid(self, pid):
+        """ Retorna o registro do pid ou None"""
+        return self.__by_pid.get(pid)
+
+    def names(self):
+        """ Retorna os nomes dos serviços em execução"""
+        return sorted(self.__by_name)
+
+    def select(self, expression=None):
+        """ Retorna os processos selecionados pela expressão (ver ServiceSelector), todos quando None"""
+        if not expression:
+            return list(self.__by_pid.values())
+        return [record for name in ServiceSelector(expression).select(self.__trie) for record in self.__by_name[name]]
+
+    @staticmethod
+    def is_alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def __contains__(self, name):
+        return name in self.__by_name
+
+    def __iter__(self):
+        return iter(list(self.__by_pid.values()))
+
+    def __len__(self):
+        return len(self.__by_pid)
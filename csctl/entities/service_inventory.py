@@ -0,0 +1,77 @@
+from typing import Callable, Dict, Iterable, List, Optional
+
+from entities.service_selector import ServiceSelector, ServiceTrie
+
+
+class ServiceInventory:
+    """ Índice dos serviços instalados em PATH_INITD.
+
+        Montado uma única vez por comando: a pertinência é O(1) por um set e as consultas por
+        prefixo e por seletor (`-g cstasks`, ver ServiceSelector) descem por uma trie. Os componentes
+        (diretórios de PATH_CORTEX) são lidos apenas na primeira consulta por componente. A
+        criação e a remoção de serviços atualizam o índice sem reler o diretório.
+    """
+
+    def __init__(self, names: Iterable[str] = (), components: Callable[[], Iterable[str]] = tuple,
+                 prefix: str = 'cs'):
+        self.prefix = prefix
+        self.__names = set(names)
+        self.__trie = ServiceTrie(self.__names)
+        self.__load_components = components
+        self.__components = None
+
+    def add(self, name: str):
+        """ Indexa um serviço criado após a montagem do inventário"""
+        if name not in self.__names:
+            self.__names.add(name)
+            self.__trie.add(name)
+
+    def discard(self, name: str):
+        """ Remove um serviço do índice"""
+        if name in self.__names:
+            self.__names.remove(name)
+            self.__trie.discard(name)
+
+    def names(self) -> List[str]:
+        """ Retorna os nomes dos serviços em ordem"""
+        return self.__trie.prefixed()
+
+    def select(self, prefix: Optional[str] = None) -> List[str]:
+        """ Retorna os serviços cujo nome começa com `prefix`, todos quando None"""
+        return self.__trie.prefixed(prefix or '')
+
+    def match(self, expression: Optional[str] = None) -> List[str]:
+        """ Retorna os serviços selecionados pela expressão (ver ServiceSelector), todos quando None"""
+        return ServiceSelector(expression).select(self.__trie)
+
+    @property
+    def components(self) -> List[str]:
+        """ Componentes conhecidos, do nome mais longo para o mais curto"""
+        if self.__components is None:
+            self.__components = sorted(self.__load_components(), key=len, reverse=True)
+        return self.__components
+
+    def component(self, name: str) -> Optional[str]:
+        """ Retorna o componente do serviço, o de nome mais longo que prefixa o serviço"""
+        source = name[len(self.prefix):] if name.startswith(self.prefix) else name
+        return next((component for component in self.components if source.startswith(component)), None)
+
+    def group(self, component: str) -> List[str]:
+        """ Retorna os serviços do componente"""
+        return [name for name in self.select(self.prefix + component) if self.component(name) == component]
+
+    def groups(self) -> Dict[Optional[str], List[str]]:
+        """ Agrupa todos os serviços por componente, None para os sem componente conhecido"""
+        grouped = {}
+        for name in self.names():
+            grouped.setdefault(self.component(name), []).append(name)
+        return grouped
+
+    def __contains__(self, name):
+        return name in self.__names
+
+    def __iter__(self):
+        return iter(self.names())
+
+    def __len__(self):
+        return len(self.__names)
@@ -0,0 +1,106 @@
+import re
+import time
+
+PARAMETER = re.compile('^(--[a-z].*)')
+ARGUMENT = re.compile('^([^\\-\\-])')
+
+_UNSET = object()
+
+
+class ServiceProcess:
+    """ Registro de um processo de serviço com __slots__.
+
+        Guarda apenas o que a descoberta já leu (nome, pid, início, memória, CPU e o cmdline em uma
+        única string); `started`, `parameters` e `arguments` são derivados na leitura e `environ` e
+        `connections` são lidos do repositório (`loader.load(pid, campo)`) no primeiro acesso e
+        mantidos no registro. O acesso por chave (record['pid']) continua disponível para os
+        chamadores que tratam o registro como dicionário.
+    """
+
+    __slots__ = ('name', 'pid', 'create_time', 'memory_percent', 'cpu_percent', '_cmdline',
+                 '_environ', '_connections', '_loader')
+
+    FIELDS = ('name', 'pid', 'started', 'memory_percent', 'cpu_percent', 'parameters', 'arguments', 'environ',
+              'connections')
+    WRITABLE = frozenset(('create_time', 'memory_percent', 'cpu_percent'))
+    CMDLINE_FIELDS = frozenset(('parameters', 'arguments'))
+    _KEYS = frozenset(FIELDS) | WRITABLE | {'cmdline'}
+
+    def __init__(self, name, pid, create_time=None, memory_percent=None, cpu_percent=None, cmdline=(),
+                 loader=None):
+        self.name = name
+        self.pid = pid
+        self.create_time = create_time
+        self.memory_percent = memory_percent
+        self.cpu_percent = cpu_percent
+        self._cmdline = '\x00'.join(cmdline)
+        self._environ = _UNSET
+        self._connections = _UNSET
+        self._loader = loader
+
+    @classmethod
+    def from_info(cls, name, info, loader=None, fields=None):
+        """ Monta o registro a partir do info do psutil ou do ProcFsProcessRepo
+
+            O cmdline só é mantido quando `fields` (todos quando None) inclui parameters ou arguments.
+        """
+        memory_percent = info.get('memory_percent')
+        cpu_percent = info.get('cpu_percent')
+        return cls(name, info['pid'], info.get('create_time'),
+                   None if memory_percent is None else round(memory_percent),
+                   None if cpu_percent is None else round(cpu_percent),
+                   info.get('cmdline') or () if fields is None or cls.CMDLINE_FIELDS.intersection(fields) else (),
+                   loader)
+
+    @property
+    def started(self):
+        if self.create_time is None:
+            return None
+        return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.create_time))
+
+    @property
+    def cmdline(self):
+        return self._cmdline.split('\x00') if self._cmdline else []
+
+    @property
+    def parameters(self):
+        return [v for v in self.cmdline if PARAMETER.match(v)]
+
+    @property
+    def arguments(self):
+        return [v for v in self.cmdline if ARGUMENT.match(v)]
+
+    @property
+    def environ(self):
+        if self._environ is _UNSET:
+            self._environ = self.load('environ') or {}
+        return self._environ
+
+    @property
+    def connections(self):
+        if self._connections is _UNSET:
+            self._connections = self.load('connections') or []
+        return self._connections
+
+    def load(self, field):
+        return self._loader.load(self.pid, field) if self._loader is not None else None
+
+    def __getitem__(self, key):
+        if key not in self._KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.WRITABLE:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self._KEYS else default
+
+    def as_dict(self, fields=None):
+        """ Retorna os campos como dicionário, todos quando None"""
+        return {field: getattr(self, field) for field in (fields or self.FIELDS)}
+
+    def __repr__(self):
+        return 'ServiceProcess(name={!r}, pid={!r})'.format(self.name, self.pid)
@@ -0,0 +1,179 @@
+import re
+from typing import Iterable, List, Optional, Tuple
+
+# Marca de fim de nome no nó da trie, as demais chaves são caracteres
+END = ''
+GLOB_CHARS = '*?['
+REGEX_CHARS = '.^$*+?{}[]\\|()'
+
+
+class ServiceTrie:
+    """ Trie de nomes de serviços.
+
+        Uma consulta por prefixo desce apenas pelos caracteres do prefixo e percorre somente a
+        subárvore dos nomes encontrados, o custo acompanha o número de resultados e não o total
+        de serviços. Os nomes são devolvidos em ordem alfabética.
+    """
+
+    def __init__(self, names: Iterable[str] = ()):
+        self.__root = {}
+        self.__size = 0
+        for name in names:
+            self.add(name)
+
+    def add(self, name: str):
+        node = self.__root
+        for char in name:
+            node = node.setdefault(char, {})
+        if END not in node:
+            node[END] = name
+            self.__size += 1
+
+    def discard(self, name: str):
+        path = [self.__root]
+        for char in name:
+            node = path[-1].get(char)
+            if node is None:
+                return
+            path.append(node)
+        if path[-1].pop(END, None) is None:
+            return
+        self.__size -= 1
+        # Remove os nós que ficaram sem descendentes
+        for depth in range(len(name), 0, -1):
+            if path[depth]:
+                break
+            del path[depth - 1][name[depth - 1]]
+
+    def prefixed(self, prefix: str = '') -> List[str]:
+        """ Retorna os nomes que começam com `prefix`"""
+        node = self.__root
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return []
+        names, stack = [], [node]
+        while stack:
+            node = stack.pop()
+            for key in sorted(node, reverse=True):
+                if key == END:
+                    names.append(node[END])
+                else:
+                    stack.append(node[key])
+        return names
+
+    def __contains__(self, name):
+        node = self.__root
+        for char in name:
+            node = node.get(char)
+            if node is None:
+                return False
+        return END in node
+
+    def __len__(self):
+        return self.__size
+
+
+class ServiceSelector:
+    """ Seleção de serviços usada pelos comandos de ciclo de vida e pelo show.
+
+        Termos separados por vírgula, a seleção é a união deles:
+            csbrain-1           nome exato ou grupo, casa csbrain-1 e csbrain-1-*, não csbrain-10
+            cstasks*            prefixo ou glob (*, ? e classes [abc])
+            csbrain-[3-12]      faixa numérica, casa csbrain-3 até csbrain-12
+            re:csbrain-\\d+      expressão regular sobre o nome inteiro, sempre o termo único
+
+        Cada termo é resolvido na trie a partir do seu prefixo literal e apenas os nomes sob esse
+        prefixo são testados.
+    """
+
+    def __init__(self, expression: Optional[str] = None):
+        self.expression = expression
+        self.terms = self.parse(expression) if expression else []
+
+    @classmethod
+    def parse(cls, expression: str) -> List[Tuple[str, Optional[re.Pattern], List[Tuple[int, int]]]]:
+        """ Retorna (prefixo literal, regex ou None para nome/grupo, faixas numéricas) de cada termo"""
+        if expression.startswith('re:'):
+            pattern = expression[3:]
+            return [(cls.literal_prefix(pattern, REGEX_CHARS, regex=True), re.compile(pattern), [])]
+        terms = []
+        for term in filter(None, (part.strip() for part in expression.split(','))):
+            if any(char in term for char in GLOB_CHARS):
+                regex, ranges = cls.translate(term)
+                terms.append((cls.literal_prefix(term, GLOB_CHARS), regex, ranges))
+            else:
+                terms.append((term, None, []))
+        return terms
+
+    @staticmethod
+    def literal_prefix(pattern: str, special: str, regex: bool = False) -> str:
+        if regex:
+            # Uma alternativa pode começar com qualquer prefixo
+            if '|' in pattern:
+                return ''
+            pattern = pattern[1:] if pattern.startswith('^') else pattern
+        prefix = []
+        for char in pattern:
+            if char in special:
+                # Em uma regex o caractere antes de um quantificador é opcional
+                if regex and char in '?*{' and prefix:
+                    prefix.pop()
+                break
+            prefix.append(char)
+        return ''.join(prefix)
+
+    @staticmethod
+    def translate(glob: str) -> Tuple[re.Pattern, List[Tuple[int, int]]]:
+        """ Converte o glob em regex, cada [N-M] numérico vira um grupo validado à parte"""
+        parts, ranges, index = [], [], 0
+        while index < len(glob):
+            char = glob[index]
+            if char == '*':
+                parts.append('.*')
+            elif char == '?':
+                parts.append('.')
+            elif char == '[' and ']' in glob[index:]:
+                end = glob.index(']', index)
+                body = glob[index + 1:end]
+                numeric = re.fullmatch(r'(\d+)-(\d+)', body)
+                if numeric:
+                    parts.append(r'(\d+)')
+                    ranges.append((int(numeric.group(1)), int(numeric.group(2))))
+                else:
+                    body = '^' + body[1:] if body.startswith('!') else body
+                    parts.append('[{}]'.format(body.replace('\\', '\\\\')))
+                index = end
+            else:
+                parts.append(re.escape(char))
+            index += 1
+        return re.compile(''.join(parts)), ranges
+
+    @staticmethod
+    def term_matches(term, name: str) -> bool:
+        prefix, regex, ranges = term
+        if regex is None:
+            return name == prefix or name.startswith(prefix + '-')
+        match = regex.fullmatch(name)
+        if match is None:
+            return False
+        return all(low <= int(value) <= high for value, (low, high) in zip(match.groups(), ranges))
+
+    def matches(self, name: str) -> bool:
+        """ Testa um único nome, sem trie"""
+        return not self.terms or any(self.term_matches(term, name) for term in self.terms)
+
+    def select(self, trie: ServiceTrie) -> List[str]:
+        """ Retorna os nomes da trie selecionados, em ordem alfabética"""
+        if not self.terms:
+            return trie.prefixed()
+        selected = set()
+        for term in self.terms:
+            prefix, regex, _ = term
+            if regex is None:
+                if prefix in trie:
+                    selected.add(prefix)
+                selected.update(trie.prefixed(prefix + '-'))
+            else:
+                selected.update(name for name in trie.prefixed(prefix) if self.term_matches(term, name))
+        return sorted(selected)
@@ -0,0 +1,149 @@
+""" Séries temporais em memória com tamanho fixo, armazenadas em array.array.
+
+    Cada resolução (SeriesTier) guarda `capacity` janelas de `step` segundos em um buffer
+    circular por métrica; o instante de cada janela é implícito (última janela gravada menos a
+    distância até ela), nenhum timestamp é armazenado. Uma janela sem amostras fica com o valor
+    máximo do tipo, lido como None.
+
+    Custo por janela, somando as quatro métricas de FIELDS: 2 (cpu) + 4 (rss) + 2 (fds) +
+    2 (conexões) = 10 bytes. Com as resoluções padrão (10s x 360, 60s x 1440, amostras a cada
+    10s) cada serviço ocupa 1800 janelas = 18000 bytes de dados, mais cerca de 1 KB de objetos
+    python, independente do tempo em execução: 3,6 KB por hora de histórico a cada 10s. Uma
+    resolução de 1s (1:600, mais 6000 bytes) só tem sentido com HISTORY_INTERVAL=1.
+"""
+import array
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# nome: (typecode, escala gravada por unidade, agregação ao reduzir a resolução)
+FIELDS = {'cpu_percent': ('H', 10, 'mean'),
+          'rss_kb': ('I', 1, 'max'),
+          'fds': ('H', 1, 'max'),
+          'connections': ('H', 1, 'max')}
+
+
+class SeriesTier:
+    """ Uma resolução do histórico: buffers circulares de `capacity` janelas de `step` segundos"""
+
+    def __init__(self, step: int, capacity: int, fields: Dict = None):
+        self.step = step
+        self.capacity = capacity
+        self.fields = fields or FIELDS
+        self.missing = {}
+        self.arrays = {}
+        for name, (typecode, _, _) in self.fields.items():
+            self.missing[name] = (1 << (8 * array.array(typecode).itemsize)) - 1
+            self.arrays[name] = array.array(typecode, [self.missing[name]]) * capacity
+        self.head = 0
+        self.count = 0
+        self.bucket = None
+        self.pending_bucket = None
+        self.pending = {}
+
+    def add(self, timestamp: float, values: Dict[str, Optional[float]]):
+        """ Acumula uma amostra, a janela anterior é gravada quando a amostra já é da seguinte"""
+        bucket = int(timestamp // self.step)
+        if self.pending_bucket is not None and bucket > self.pending_bucket:
+            self.flush()
+        if self.pending_bucket is None:
+            self.pending_bucket = bucket
+            self.pending = {name: [0.0, None, 0] for name in self.fields}
+        for name, value in values.items():
+            if value is None or name not in self.pending:
+                continue
+            acc = self.pending[name]
+            acc[0] += value
+            acc[1] = value if acc[1] is None else max(acc[1], value)
+            acc[2] += 1
+
+    def flush(self):
+        """ Grava a janela acumulada, preenchendo como ausentes as janelas sem amostras"""
+        if self.pending_bucket is None:
+            return
+        if self.bucket is not None:
+            for _ in range(min(self.pending_bucket - self.bucket - 1, self.capacity)):
+                self.write({})
+        self.write({name: self.aggregate(name, acc) for name, acc in self.pending.items()})
+        self.bucket = self.pending_bucket
+        self.pending_bucket = None
+        self.pending = {}
+
+    def aggregate(self, name: str, acc: List) -> Optional[float]:
+        total, peak, samples = acc
+        if not samples:
+            return None
+        return total / samples if self.fields[name][2] == 'mean' else peak
+
+    def write(self, values: Dict[str, Optional[float]]):
+        for name, (_, scale, _) in self.fields.items():
+            value = values.get(name)
+            missing = self.missing[name]
+            self.arrays[name][self.head] = missing if value is None else min(max(int(round(value * scale)), 0),
+                                                                             missing - 1)
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def points(self, since: float = 0.0) -> Iterator[Tuple[int, Dict[str, Optional[float]]]]:
+        """ Produz (início da janela, valores) da mais antiga para a mais recente, a partir de `since`"""
+        for offset in range(self.count, 0, -1):
+            start = (self.bucket - offset + 1) * self.step
+            if start + self.step <= since:
+                continue
+            index = (self.head - offset) % self.capacity
+            yield start, {name: self.read(name, index) for name in self.fields}
+        if self.pending_bucket is not None and (self.pending_bucket + 1) * self.step > since:
+            yield self.pending_bucket * self.step, {name: self.aggregate(name, acc) for name, acc in self.pending.items()}
+
+    def read(self, name: str, index: int) -> Optional[float]:
+        value = self.arrays[name][index]
+        if value == self.missing[name]:
+            return None
+        scale = self.fields[name][1]
+        return value / scale if scale != 1 else value
+
+    @property
+    def span(self) -> int:
+        """ Segundos cobertos pelo buffer"""
+        return self.step * self.capacity
+
+    @property
+    def nbytes(self) -> int:
+        return sum(values.itemsize * len(values) for values in self.arrays.values())
+
+
+class ServiceHistory:
+    """ Histórico de um serviço em várias resoluções, cada amostra alimenta todas elas"""
+
+    def __init__(self, tiers: List[Tuple[int, int]]):
+        self.tiers = [SeriesTier(step, capacity) for step, capacity in sorted(tiers)]
+
+    def add(self, timestamp: float, values: Dict[str, Optional[float]]):
+        for tier in self.tiers:
+            tier.add(timestamp, values)
+
+    def tier(self, since_seconds: float, step: Optional[int] = None) -> SeriesTier:
+        """ A resolução pedida ou a mais fina que cobre os últimos `since_seconds`"""
+        if step is not None:
+            return next((tier for tier in self.tiers if tier.step == step), self.tiers[-1])
+        return next((tier for tier in self.tiers if tier.span >= since_seconds), self.tiers[-1])
+
+    @property
+    def span(self) -> int:
+        """ Segundos cobertos pela maior resolução"""
+        return max(tier.span for tier in self.tiers)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(tier.nbytes for tier in self.tiers)
+
+
+def parse_tiers(tiers: str) -> List[Tuple[int, int]]:
+    """ Converte '1:600,10:360,60:1440' em [(1, 600), (10, 360), (60, 1440)]"""
+    parsed = []
+    for item in filter(None, (part.strip() for part in str(tiers).split(','))):
+        step, _, capacity = item.partition(':')
+        if int(step) <= 0 or int(capacity) <= 0:
+            raise ValueError('invalid history tier: {}'.format(item))
+        parsed.append((int(step), int(capacity)))
+    if not parsed:
+        raise ValueError('no history tier configured')
+    return parsed
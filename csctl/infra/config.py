@@ -1,6 +1,43 @@
-from dynaconf import Dynaconf
+_settings = None
 
-settings = Dynaconf(envvar_prefix=False)
+
+def dynaconf_settings():
+    """ Retorna o Dynaconf, importado e carregado apenas no primeiro uso"""
+    global _settings
+    if _settings is None:
+        from dynaconf import Dynaconf
+        _settings = Dynaconf(envvar_prefix=False)
+    return _settings
+
+
+class _Setting:
+    """ Configuração lida do Dynaconf no primeiro acesso e guardada na classe
+
+        Sem `default` a configuração é obrigatória e a ausência gera AttributeError, como no
+        acesso direto ao Dynaconf.
+    """
+
+    _REQUIRED = object()
+
+    def __init__(self, key, default=_REQUIRED, cast=None):
+        self.key = key
+        self.default = default
+        self.cast = cast
+        self.name = key
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        settings = dynaconf_settings()
+        if self.default is self._REQUIRED:
+            value = getattr(settings, self.key)
+        else:
+            value = settings.get(self.key, self.default)
+        if self.cast is not None and value is not None:
+            value = self.cast(value)
+        setattr(owner, self.name, value)
+        return value
 
 
 class Config:
@@ -15,6 +52,30 @@ class Config:
     BRAIN = 'brain'
     DB_NAME = '__prime__'
     COLLECTION = 'devops'
+    REGISTRY_COLLECTION = 'registry'
     HTTP_DEFAULT_PORT = 6480
-    MONGODB_URL = settings.MONGODB_URL
-
+    MONGODB_URL = _Setting('MONGODB_URL')
+    PROCESS_BACKEND = _Setting('PROCESS_BACKEND', 'psutil')  # psutil ou procfs
+    PARALLEL_WORKERS = _Setting('PARALLEL_WORKERS', 1, int)
+    STOP_GRACE_TIMEOUT = _Setting('STOP_GRACE_TIMEOUT', 10, float)  # segundos até o SIGKILL
+    STOP_GRACE_OVERRIDES = _Setting('STOP_GRACE_OVERRIDES', '')  # por serviço, ex.: csbrain-1=30,cstasks-2=60
+    READY_TIMEOUT = _Setting('READY_TIMEOUT', 60, float)  # segundos aguardando um serviço ficar pronto
+    READY_HTTP_PATH = _Setting('READY_HTTP_PATH', None)  # ex.: /health, None testa apenas TCP
+    SUPERVISOR_BACKOFF_INITIAL = _Setting('SUPERVISOR_BACKOFF_INITIAL', 1, float)  # segundos
+    SUPERVISOR_BACKOFF_MAX = _Setting('SUPERVISOR_BACKOFF_MAX', 60, float)  # segundos
+    DAEMON_SOCKET = _Setting('CSCTLD_SOCKET', '/var/run/cs/csctld.sock')
+    DAEMON_SNAPSHOT_TTL = _Setting('CSCTLD_SNAPSHOT_TTL', 1, float)  # segundos
+    CPU_SAMPLE_INTERVAL = _Setting('CPU_SAMPLE_INTERVAL', 0.5, float)  # segundos, 0 desativa
+    REGISTRY_LAYOUT = _Setting('REGISTRY_LAYOUT', 'document')  # document ou collection (ver migrations)
+    REGISTRY_CACHE_PATH = _Setting('REGISTRY_CACHE_PATH', '/var/run/cs/registry.db')
+    REGISTRY_CACHE_MAX_AGE = _Setting('REGISTRY_CACHE_MAX_AGE', 60, float)  # segundos servindo a cópia local
+    REGISTRY_OFFLINE = _Setting('REGISTRY_OFFLINE', False)  # não consulta o MongoDB, escritas ficam na fila
+    REGISTRY_SYNC_INTERVAL = _Setting('REGISTRY_SYNC_INTERVAL', 30, float)  # segundos, sync do csctld
+    PORT_LEDGER_PATH = _Setting('PORT_LEDGER_PATH', '/var/lib/cs/ports.json')
+    PORT_RANGES = _Setting('PORT_RANGES', '20000-29999')  # faixas separadas por vírgula, fora da efêmera
+    TOP_INTERVAL = _Setting('TOP_INTERVAL', 2, float)  # segundos entre atualizações do csctl top
+    EXPORTER_HOST = _Setting('EXPORTER_HOST', '127.0.0.1')
+    EXPORTER_PORT = _Setting('EXPORTER_PORT', 9464, int)
+    EXPORTER_TTL = _Setting('EXPORTER_TTL', 5, float)  # segundos em que a coleta é reaproveitada entre scrapes
+    HISTORY_INTERVAL = _Setting('HISTORY_INTERVAL', 10, float)  # segundos entre amostras do csctld, 0 desativa
+    HISTORY_TIERS = _Setting('HISTORY_TIERS', '10:360,60:1440')  # segundos por janela:janelas, 1:600 com intervalo 1
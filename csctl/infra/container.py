@@ -0,0 +1,129 @@
+""" Montagem preguiçosa dos repositórios e casos de uso do csctl.
+
+    Cada dependência é construída, e o seu módulo importado, apenas no primeiro acesso: um
+    `csctl stop` não importa o pymongo nem o jinja2 e um `csctl --help` não constrói nada.
+"""
+
+
+class lazy:
+    """ Propriedade calculada no primeiro acesso e guardada na instância"""
+
+    def __init__(self, factory):
+        self.factory = factory
+        self.name = factory.__name__
+        self.__doc__ = factory.__doc__
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        value = self.factory(instance)
+        instance.__dict__[self.name] = value
+        return value
+
+
+class Container:
+    def __init__(self, settings):
+        self.settings = settings
+        # HistoryRecorder mantido pelo csctld, None fora do daemon
+        self.history = None
+        # Cliente atendido pelo csctld: ambiente e diretório dos subprocessos e saída colorida,
+        # None fora do daemon (valem o ambiente, o diretório e o terminal do próprio processo)
+        self.environ = None
+        self.cwd = None
+        self.color = None
+
+    def reset(self, *names):
+        """ Descarta as dependências construídas para que sejam recriadas no próximo acesso"""
+        for name in names:
+            self.__dict__.pop(name, None)
+
+    @lazy
+    def host_name(self):
+        from infra.config_hostname import IpAddrOrHostname
+        return IpAddrOrHostname()
+
+    @lazy
+    def repo_fields(self):
+        from repository.inmemory_repo import ListFieldsRepo
+        return ListFieldsRepo()
+
+    @lazy
+    def repo_mongo(self):
+        if self.settings.REGISTRY_LAYOUT == 'collection':
+            from repository.mongo_repo import MongoRegistryRepo
+            return MongoRegistryRepo(url=self.settings.MONGODB_URL, db=self.settings.DB_NAME,
+                                     collection=self.settings.REGISTRY_COLLECTION)
+        from repository.mongo_repo import MongoRepo
+        return MongoRepo(url=self.settings.MONGODB_URL, db=self.settings.DB_NAME,
+                         collection=self.settings.COLLECTION)
+
+    @lazy
+    def repo_instance(self):
+        from repository.cached_mongo_repo import CachedMongoRepo
+        return CachedMongoRepo(lambda: self.repo_mongo, self.settings.REGISTRY_CACHE_PATH,
+                               max_age=self.settings.REGISTRY_CACHE_MAX_AGE, offline=self.settings.REGISTRY_OFFLINE)
+
+    @lazy
+    def repo_process(self):
+        if self.settings.PROCESS_BACKEND == 'procfs':
+            from repository.procfs_repo import ProcFsProcessRepo
+            return ProcFsProcessRepo(self.repo_fields.fields)
+        from repository.inmemory_repo import ListProcessRepo
+        return ListProcessRepo(self.repo_fields.fields)
+
+    @lazy
+    def repo_files(self):
+        from repository.inmemory_repo import ListFilesRepo
+        return ListFilesRepo(self.settings.PREFIX, self.settings.PATH_INITD)
+
+    @lazy
+    def repo_dirs(self):
+        from repository.inmemory_repo import ListDirRepo
+        return ListDirRepo(self.settings.PATH_CORTEX)
+
+    @lazy
+    def repo_ports(self):
+        from repository.port_ledger import PortLedgerRepo
+        return PortLedgerRepo(self.settings.PORT_LEDGER_PATH, self.settings.PORT_RANGES)
+
+    @lazy
+    def use_case_files(self):
+        from usecases.list_files import ListFileUseCase
+        return ListFileUseCase(self.repo_files)
+
+    @lazy
+    def inventory(self):
+        import os
+        from entities.service_inventory import ServiceInventory
+        return ServiceInventory((os.path.basename(path) for path in self.use_case_files.list_files()),
+                                components=lambda: self.use_case_dirs.list_dirs, prefix=self.settings.PREFIX)
+
+    @lazy
+    def use_case_dirs(self):
+        from usecases.list_dirs import ListDirUseCase
+        return ListDirUseCase(self.repo_dirs)
+
+    @lazy
+    def use_case_process(self):
+        from usecases.list_process import ListProcessUseCase
+        return ListProcessUseCase(self.repo_process)
+
+    @lazy
+    def use_case_instances(self):
+        from usecases.list_istance import ListInstanceUseCase
+        return ListInstanceUseCase(self.repo_instance)
+
+    @lazy
+    def use_case_update(self):
+        from usecases.list_istance import UpdateInstanceUseCase
+        return UpdateInstanceUseCase(self.repo_instance)
+
+    @lazy
+    def use_case_register(self):
+        from usecases.list_istance import RegisterInstancesUseCase
+        return RegisterInstancesUseCase(self.repo_instance)
+
+    @lazy
+    def use_case_reconcile(self):
+        from usecases.reconcile import ReconcileUseCase
+        return ReconcileUseCase(self.repo_files, self.repo_process, self.repo_instance)
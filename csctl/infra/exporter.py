@@ -0,0 +1,38 @@
+""" Servidor HTTP do csctl exporter, expõe /metrics para o Prometheus.
+
+    Cada requisição é atendida em uma thread; o texto das métricas vem do
+    ServiceMetricsUseCase, que compartilha a mesma coleta entre scrapes próximos.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    metrics = None
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        try:
+            body = self.metrics.render().encode()
+        except Exception as err:
+            self.send_error(500, explain=str(err))
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(metrics, host: str = '127.0.0.1', port: int = 9464) -> ThreadingHTTPServer:
+    """ Cria o servidor sem iniciá-lo, port 0 escolhe uma porta livre"""
+    handler = type('Handler', (MetricsHandler,), {'metrics': metrics})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
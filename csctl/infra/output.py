@@ -0,0 +1,81 @@
+""" Saída para máquinas dos comandos status e show.
+
+    Os comandos produzem linhas como dicionários e os writers gravam cada linha assim que ela
+    chega, sem montar tabela nem carregar prettytable/termcolor: a memória não cresce com o
+    número de linhas.
+
+        json    um único array, aberto na primeira linha e fechado no final
+        ndjson  um objeto JSON por linha, com flush a cada linha
+        tsv     valores separados por tab, o cabeçalho é repetido quando os campos mudam
+"""
+import json
+import sys
+from typing import Dict, Iterable
+
+
+class NdjsonWriter:
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, row: Dict):
+        self.stream.write(json.dumps(row, default=str, ensure_ascii=False) + '\n')
+        self.stream.flush()
+
+    def close(self):
+        pass
+
+
+class JsonWriter:
+    def __init__(self, stream):
+        self.stream = stream
+        self.count = 0
+
+    def write(self, row: Dict):
+        self.stream.write('[\n  ' if not self.count else ',\n  ')
+        self.stream.write(json.dumps(row, default=str, ensure_ascii=False))
+        self.count += 1
+
+    def close(self):
+        self.stream.write('\n]\n' if self.count else '[]\n')
+        self.stream.flush()
+
+
+class TsvWriter:
+    ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.fields = None
+
+    def write(self, row: Dict):
+        fields = list(row)
+        if fields != self.fields:
+            self.fields = fields
+            self.stream.write('\t'.join(fields) + '\n')
+        self.stream.write('\t'.join(self.value(row[field]) for field in fields) + '\n')
+
+    def value(self, value) -> str:
+        if value is None:
+            return ''
+        if isinstance(value, (list, dict)):
+            value = json.dumps(value, default=str, ensure_ascii=False)
+        return str(value).translate(self.ESCAPES)
+
+    def close(self):
+        self.stream.flush()
+
+
+WRITERS = {'json': JsonWriter, 'ndjson': NdjsonWriter, 'tsv': TsvWriter}
+
+
+def write_rows(rows: Iterable[Dict], output: str, stream=None) -> int:
+    """ Grava as linhas no formato `output` à medida que são produzidas, retorna quantas foram gravadas"""
+    writer = WRITERS[output](stream or sys.stdout)
+    count = 0
+    try:
+        for row in rows:
+            writer.write(row)
+            count += 1
+    finally:
+        writer.close()
+    return count
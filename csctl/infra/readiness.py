@@ -0,0 +1,96 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+
+@dataclass
+class ProbeResult:
+    """ Resultado da verificação de prontidão de um serviço"""
+    name: str
+    port: Optional[int]
+    ready: bool
+    attempts: int
+    elapsed: float
+    detail: str = ''
+
+
+class ReadinessProbe:
+    """ Verifica a prontidão de vários serviços em paralelo em um único loop asyncio.
+
+        Cada serviço é testado com conexão TCP na sua porta e, se `http_path` for informado,
+        com um GET HTTP que precisa responder 2xx ou 3xx. As tentativas seguem backoff
+        exponencial até o prazo final, sem uma thread por serviço; `concurrency` limita o
+        número de sockets abertos ao mesmo tempo.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', http_path: Optional[str] = None, timeout: float = 60.0,
+                 initial_delay: float = 0.1, max_delay: float = 5.0, connect_timeout: float = 1.0,
+                 concurrency: int = 256, alive: Optional[Callable[[str], bool]] = None):
+        self.host = host
+        self.http_path = http_path
+        self.timeout = timeout
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.connect_timeout = connect_timeout
+        self.concurrency = concurrency
+        self.alive = alive
+
+    def probe(self, services: Dict[str, Optional[int]]) -> List[ProbeResult]:
+        """ Verifica {serviço: porta} e retorna os resultados na ordem recebida"""
+        if not services:
+            return []
+        return asyncio.run(self._probe_all(services))
+
+    async def _probe_all(self, services: Dict[str, Optional[int]]) -> List[ProbeResult]:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        deadline = time.monotonic() + self.timeout
+        return list(await asyncio.gather(*(self._probe_one(name, port, deadline, semaphore)
+                                           for name, port in services.items())))
+
+    async def _probe_one(self, name: str, port: Optional[int], deadline: float,
+                         semaphore: asyncio.Semaphore) -> ProbeResult:
+        started = time.monotonic()
+        delay = self.initial_delay
+        attempts = 0
+        detail = ''
+
+        while True:
+            attempts += 1
+            if self.alive is not None and not self.alive(name):
+                ready, detail = False, 'process not running'
+            elif port is None:
+                ready, detail = True, ''
+            else:
+                async with semaphore:
+                    ready, detail = await self._check(port)
+
+            remaining = deadline - time.monotonic()
+            if ready or remaining <= 0:
+                return ProbeResult(name, port, ready, attempts, time.monotonic() - started, detail)
+
+            await asyncio.sleep(min(delay, remaining))
+            delay = min(delay * 2, self.max_delay)
+
+    async def _check(self, port: int):
+        """ Conecta na porta e, se configurado, executa o GET HTTP"""
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, port), self.connect_timeout)
+        except (OSError, asyncio.TimeoutError) as err:
+            return False, 'connect: {}'.format(str(err) or type(err).__name__)
+
+        try:
+            if not self.http_path:
+                return True, ''
+            writer.write('GET {} HTTP/1.0\r\nHost: {}:{}\r\nConnection: close\r\n\r\n'.format(
+                self.http_path, self.host, port).encode())
+            await writer.drain()
+            status_line = await asyncio.wait_for(reader.readline(), self.connect_timeout)
+            parts = status_line.split()
+            if len(parts) >= 2 and parts[1][:1] in (b'2', b'3'):
+                return True, ''
+            return False, 'http: {}'.format(status_line.decode(errors='replace').strip() or 'empty response')
+        except (OSError, asyncio.TimeoutError) as err:
+            return False, 'http: {}'.format(str(err) or type(err).__name__)
+        finally:
+            writer.close()
@@ -0,0 +1,56 @@
+""" Tela de atualização contínua com redesenho apenas das linhas alteradas.
+
+    A tela guarda as linhas exibidas no último quadro; no seguinte o cursor é posicionado com
+    sequências ANSI somente nas linhas que mudaram e o que sobrar do quadro anterior é apagado.
+    Fora de um terminal cada quadro é escrito inteiro, sem sequências de controle.
+"""
+import shutil
+import sys
+from typing import List
+
+CLEAR = '\x1b[2J'
+HOME = '\x1b[H'
+CLEAR_LINE = '\x1b[K'
+CLEAR_BELOW = '\x1b[J'
+HIDE_CURSOR = '\x1b[?25l'
+SHOW_CURSOR = '\x1b[?25h'
+
+
+class DiffScreen:
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.ansi = self.stream.isatty()
+        self.lines: List[str] = []
+
+    def __enter__(self):
+        if self.ansi:
+            self.stream.write(HIDE_CURSOR + CLEAR + HOME)
+            self.stream.flush()
+        return self
+
+    def __exit__(self, *exc):
+        if self.ansi:
+            self.stream.write('\x1b[{};1H'.format(len(self.lines) + 1) + SHOW_CURSOR)
+            self.stream.flush()
+
+    def draw(self, lines: List[str]) -> int:
+        """ Exibe o quadro, retorna o número de linhas reescritas"""
+        if not self.ansi:
+            self.stream.write('\n'.join(lines) + '\n\n')
+            self.stream.flush()
+            return len(lines)
+        columns, rows = shutil.get_terminal_size()
+        lines = [line[:columns] for line in lines[:rows - 1]]
+        out, changed = [], 0
+        for index, line in enumerate(lines):
+            if index < len(self.lines) and self.lines[index] == line:
+                continue
+            out.append('\x1b[{};1H{}{}'.format(index + 1, line, CLEAR_LINE))
+            changed += 1
+        if len(lines) < len(self.lines):
+            out.append('\x1b[{};1H{}'.format(len(lines) + 1, CLEAR_BELOW))
+        self.lines = lines
+        if out:
+            self.stream.write(''.join(out))
+            self.stream.flush()
+        return changed
@@ -0,0 +1,25 @@
+""" Cria os índices usados pelas consultas filtradas do registro de instâncias.
+
+    Executado uma única vez por banco, repetir é inofensivo: create_index não recria um
+    índice já existente com a mesma definição.
+
+    Uso: python csctl/migrations/registry_indexes.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from infra.config import Config  # noqa: E402
+from repository.mongo_repo import MongoRepo  # noqa: E402
+
+
+def main():
+    settings = Config()
+    repo = MongoRepo(url=settings.MONGODB_URL, db=settings.DB_NAME, collection=settings.COLLECTION)
+    for name in repo.create_indexes():
+        print('index {} ok'.format(name))
+
+
+if __name__ == '__main__':
+    main()
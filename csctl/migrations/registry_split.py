@@ -0,0 +1,63 @@
+""" Migra o registro do documento único `instances` para um documento por (host, instância).
+
+    Lê {'nome': 'instances'} da coleção Config.COLLECTION e grava cada instância de cada host em
+    Config.REGISTRY_COLLECTION com upsert, pode ser repetido sem duplicar registros. O documento
+    antigo não é removido. Depois da migração use REGISTRY_LAYOUT=collection.
+
+    Uso: python csctl/migrations/registry_split.py [--dry-run]
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from pymongo import UpdateOne  # noqa: E402
+
+from infra.config import Config  # noqa: E402
+from repository.mongo_repo import MongoRegistryRepo, MongoRepo, REGISTRY_NAME  # noqa: E402
+
+
+def split(legacy):
+    """ Retorna os documentos por instância e as instâncias repetidas no formato antigo"""
+    documents, duplicated, seen = [], [], set()
+    for registry in legacy:
+        for server in registry.get('servers', []):
+            for instance in server.get('instances', []):
+                key = (server['ipaddr'], instance.get('instance'))
+                if key in seen:
+                    duplicated.append(key)
+                    continue
+                seen.add(key)
+                documents.append(MongoRegistryRepo.document(server['hostname'], server['ipaddr'], instance))
+    return documents, duplicated
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dry-run', action='store_true', help="Apenas exibe o que seria migrado")
+    args = parser.parse_args()
+
+    settings = Config()
+    legacy = MongoRepo(url=settings.MONGODB_URL, db=settings.DB_NAME, collection=settings.COLLECTION)
+    target = MongoRegistryRepo(url=settings.MONGODB_URL, db=settings.DB_NAME,
+                               collection=settings.REGISTRY_COLLECTION)
+
+    documents, duplicated = split(legacy.find_all_services_object({'nome': REGISTRY_NAME}, {'_id': 0}))
+    print('{} instances in {} hosts, {} duplicated entries ignored'.format(
+        len(documents), len({d['ipaddr'] for d in documents}), len(duplicated)))
+    for ipaddr, instance in duplicated:
+        print('  duplicated: {} {}'.format(ipaddr, instance))
+    if args.dry_run or not documents:
+        return
+
+    target.create_indexes()
+    result = target.registry.bulk_write(
+        [UpdateOne({'ipaddr': d['ipaddr'], 'instance': d['instance']}, {'$setOnInsert': d}, upsert=True)
+         for d in documents], ordered=False)
+    print('{} migrated, {} already present'.format(result.upserted_count, len(documents) - result.upserted_count))
+    print('set REGISTRY_LAYOUT=collection to use the new layout')
+
+
+if __name__ == '__main__':
+    main()
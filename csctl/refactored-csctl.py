@@ -6,7 +6,6 @@ import click
 import sys
 import subprocess
 import psutil
-import signal
 import shutil
 import stat
 import socket
@@ -22,10 +21,13 @@ from repository.inmemory_repo import (
     ListProcessRepo, ListFilesRepo, ListFieldsRepo, 
     ListDirRepo, DitcInstanceRepo
 )
+from repository.procfs_repo import ProcFsProcessRepo
 from usecases.list_istance import ListInstanceUseCase, UpdateInstanceUseCase
 from usecases.list_process import ListProcessUseCase
+from entities.process_snapshot import ProcessSnapshot
 from usecases.list_files import ListFileUseCase
 from usecases.list_dirs import ListDirUseCase
+from usecases.manage_process import ManageProcessUseCase, ServiceResult, StopProcessUseCase, parse_grace_overrides
 from infra.config import Config
 from infra.config_hostname import IpAddrOrHostname
 
@@ -66,6 +68,8 @@ class ServiceManager:
             collection=self.settings.COLLECTION
         )
         self.repo_process = ListProcessRepo(self.repo_fields.fields)
+        if self.settings.PROCESS_BACKEND == 'procfs':
+            self.repo_process = ProcFsProcessRepo(self.repo_fields.fields)
         self.repo_files = ListFilesRepo(self.settings.PREFIX, self.settings.PATH_INITD)
         self.repo_dirs = ListDirRepo(self.settings.PATH_CORTEX)
         
@@ -85,15 +89,13 @@ class ServiceManager:
         table.align = "l"
         return table
 
-    def get_running_processes(self) -> Dict[str, int]:
-        """Get dictionary of running processes with their PIDs"""
-        processes = {}
-        for proc in self.use_case_process.list_process():
-            processes[proc['name']] = proc['pid']
-        return processes
+    def get_running_processes(self) -> ProcessSnapshot:
+        """Get a snapshot of running processes indexed by name and PID"""
+        return self.use_case_process.snapshot(['pid'])
 
-    def manage_process(self, action: str, name: Optional[str] = None, all_services: bool = False):
-        """Unified process management method"""
+    def manage_process(self, action: str, name: Optional[str] = None, all_services: bool = False,
+                       parallel: int = 1) -> List[ServiceResult]:
+        """Unified process management method, runs at most `parallel` services at once"""
         running_processes = self.get_running_processes()
         
         if action not in ['start', 'stop', 'restart']:
@@ -101,8 +103,9 @@ class ServiceManager:
             
         services = [name] if name else self.list_files()
         if not all_services and not name:
-            return
-            
+            return []
+
+        targets = []
         for service in services:
             if not service.startswith(name) and name:
                 continue
@@ -111,43 +114,69 @@ class ServiceManager:
                 if service in running_processes:
                     self.logger.info(f"🟢 Process {service} is already running")
                 else:
-                    self._start_single_process(service)
-                    
-            elif action == 'stop':
-                if service in running_processes:
-                    self._stop_single_process(service, running_processes[service])
-                    
-            elif action == 'restart':
-                if service in running_processes:
-                    self._stop_single_process(service, running_processes[service])
-                    time.sleep(0.1)
-                    self._start_single_process(service)
+                    targets.append(service)
+            elif service in running_processes:
+                targets.append(service)
+
+        results = []
+        if action in ('stop', 'restart'):
+            results = self._stop_processes([running_processes.get(service) for service in targets])
+            targets = [result.name for result in results if result.ok]
+            if action == 'stop':
+                targets = []
 
-    def _start_single_process(self, service: str):
+        results.extend(ManageProcessUseCase(parallel).run(self._start_single_process, targets))
+        for result in results:
+            if not result.ok:
+                self.logger.error(f"Failed to {action} {result.name}: {result.detail or result.returncode}")
+        return results
+
+    def _start_single_process(self, service: str) -> ServiceResult:
         """Start a single service process"""
         self.logger.info(f"🟡 Starting process: {service}")
         try:
-            subprocess.run([service, "start"], stdout=subprocess.DEVNULL)
-        except subprocess.CalledProcessError as err:
-            self.logger.error(f"Failed to start {service}: {err}")
+            completed = subprocess.run([service, "start"], stdout=subprocess.DEVNULL)
+        except OSError as err:
+            return ServiceResult(service, False, detail=str(err))
+        return ServiceResult(service, completed.returncode == 0, completed.returncode)
 
-    def _stop_single_process(self, service: str, pid: int):
-        """Stop a single service process"""
-        self.logger.info(f"🔴 Stopping process: {service} (PID: {pid})")
-        try:
-            os.kill(pid, signal.SIGTERM)
-            self._remove_pid_file(service)
-        except ProcessLookupError:
-            self.logger.warning(f"Process {pid} not found")
+    def _stop_processes(self, targets: List[Dict]) -> List[ServiceResult]:
+        """Signal every target, wait for all of them together and escalate to SIGKILL after the grace timeout"""
+        for target in targets:
+            self.logger.info(f"🔴 Stopping process: {target['name']} (PID: {target['pid']})")
+
+        # PID files go away before SIGTERM so `csctl supervise` reads the exit as an operator stop
+        pid_files = {target['name']: self._take_pid_file(target['name']) for target in targets}
+        overrides = parse_grace_overrides(self.settings.STOP_GRACE_OVERRIDES)
+        results = StopProcessUseCase(self.settings.STOP_GRACE_TIMEOUT, overrides=overrides).stop(targets)
+        for result in results:
+            if result.ok:
+                self.logger.info(f"Process {result.name} {result.detail}")
+            elif pid_files.get(result.name) is not None:
+                self._restore_pid_file(result.name, pid_files[result.name])
+        return results
 
-    def _remove_pid_file(self, service: str):
-        """Remove PID file for a service"""
+    def _take_pid_file(self, service: str) -> Optional[str]:
+        """Remove the PID file of a service, returning its content"""
         pid_path = os.path.join(self.settings.PATH_PID, f"{service}.pid")
         try:
-            if os.path.exists(pid_path):
-                os.remove(pid_path)
+            with open(pid_path) as pid_file:
+                content = pid_file.read()
+            os.remove(pid_path)
+        except FileNotFoundError:
+            return None
         except OSError as err:
             self.logger.error(f"Failed to remove PID file: {err}")
+            return None
+        return content
+
+    def _restore_pid_file(self, service: str, content: str):
+        """Write back a PID file taken before a stop that failed"""
+        try:
+            with open(os.path.join(self.settings.PATH_PID, f"{service}.pid"), 'x') as pid_file:
+                pid_file.write(content)
+        except OSError:
+            pass
 
     def create_service(self, name: str, service_type: str = 'single', range_str: Optional[str] = None):
         """Create new service(s)"""
@@ -217,10 +246,13 @@ def cli(ctx):
 @cli.command()
 @click.option('-a', '--all', is_flag=True, help="Start all services")
 @click.option('-g', '--group', help="Start a group of services")
+@click.option('-P', '--parallel', type=int, default=1, help="Number of services handled concurrently")
 @click.pass_obj
-def start(manager: ServiceManager, all: bool, group: Optional[str]):
+def start(manager: ServiceManager, all: bool, group: Optional[str], parallel: int):
     """Start services command"""
-    manager.manage_process('start', name=group, all_services=all)
+    results = manager.manage_process('start', name=group, all_services=all, parallel=parallel)
+    if any(not result.ok for result in results):
+        sys.exit(1)
 
 @cli.command()
 @click.option('-a', '--all', is_flag=True, help="Stop all services")
@@ -228,15 +260,20 @@ def start(manager: ServiceManager, all: bool, group: Optional[str]):
 @click.pass_obj
 def stop(manager: ServiceManager, all: bool, group: Optional[str]):
     """Stop services command"""
-    manager.manage_process('stop', name=group, all_services=all)
+    results = manager.manage_process('stop', name=group, all_services=all)
+    if any(not result.ok for result in results):
+        sys.exit(1)
 
 @cli.command()
 @click.option('-a', '--all', is_flag=True, help="Restart all services")
 @click.option('-g', '--group', help="Restart a group of services")
+@click.option('-P', '--parallel', type=int, default=1, help="Number of services handled concurrently")
 @click.pass_obj
-def restart(manager: ServiceManager, all: bool, group: Optional[str]):
+def restart(manager: ServiceManager, all: bool, group: Optional[str], parallel: int):
     """Restart services command"""
-    manager.manage_process('restart', name=group, all_services=all)
+    results = manager.manage_process('restart', name=group, all_services=all, parallel=parallel)
+    if any(not result.ok for result in results):
+        sys.exit(1)
 
 def main():
     """Main entry point"""
@@ -0,0 +1,333 @@
+""" Cache local em SQLite do registro de instâncias.
+
+    As leituras são atendidas pelo arquivo local enquanto a cópia tiver até `max_age` segundos;
+    depois disso a consulta é repetida no MongoDB e, se ele estiver inacessível, a última cópia
+    é servida mesmo vencida (modo offline). As escritas são aplicadas nas cópias locais,
+    enfileiradas e reenviadas ao MongoDB na ordem em que foram feitas assim que ele responder.
+    Cada alteração de uma cópia local incrementa o seu contador de revisão.
+
+    Cada cópia é identificada pelo método do repositório remoto e pelos seus argumentos, assim
+    as consultas filtradas no servidor (find_host_servers) também são guardadas localmente.
+"""
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from bson import json_util
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    query TEXT PRIMARY KEY,
+    body TEXT NOT NULL,
+    revision INTEGER NOT NULL,
+    fetched_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pending (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    query TEXT NOT NULL,
+    body TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+
+class RegistryUnavailable(Exception):
+    """ MongoDB inacessível e sem cópia local do registro"""
+
+
+class RegistryRejected(Exception):
+    """ Escritas recusadas pelo MongoDB, descartadas da fila e das cópias locais
+
+        rejected: lista de (método, mensagem de erro) de cada escrita recusada.
+    """
+
+    def __init__(self, rejected: List[tuple]):
+        super().__init__('; '.join('{}: {}'.format(method, error) for method, error in rejected))
+        self.rejected = rejected
+
+
+class CachedMongoRepo:
+    """ Mesma interface do MongoRepo com leitura local e fila de escritas
+
+        remote: fábrica do repositório remoto (MongoRepo ou um substituto em memória com os
+            mesmos métodos), chamada apenas quando necessário.
+        path: arquivo SQLite do cache.
+        max_age: segundos em que a cópia local é servida sem consultar o MongoDB.
+        offline: nunca consulta o MongoDB, as escritas ficam na fila até um sync.
+    """
+
+    def __init__(self, remote: Callable[[], object], path: str, max_age: float = 60.0, offline: bool = False):
+        self.remote_factory = remote
+        self.path = path
+        self.max_age = max_age
+        self.offline = offline
+        self.last_source = None
+        self.__remote = None
+        self.__lock = threading.Lock()
+        self.__results = {}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as db:
+            db.executescript(SCHEMA)
+
+    def _connect(self):
+        """ Conexão em modo autocommit, as transações são abertas explicitamente"""
+        return contextlib.closing(sqlite3.connect(self.path, timeout=30, isolation_level=None))
+
+    @property
+    def remote(self):
+        if self.__remote is None:
+            self.__remote = self.remote_factory()
+        return self.__remote
+
+    @staticmethod
+    def _key(method: str, *args) -> str:
+        return json.dumps([method, args], sort_keys=True, default=str)
+
+    def find_all_services_object(self, one_object, two_object=None) -> List[Dict]:
+        """ Pesquisa documentos, a projeção é aplicada sobre a cópia local do documento inteiro"""
+        return [self._project(doc, two_object) for doc in self._read('find_all_services_object', one_object)]
+
+    def find_host_servers(self, hostname, ipaddr) -> List[Dict]:
+        """ Retorna as entradas de servers do host, filtradas no MongoDB quando a cópia vence"""
+        return self._read('find_host_servers', hostname, ipaddr)
+
+    def update_services_object(self, object_one, object_two):
+        """ Aplica a alteração na cópia local, enfileira e tenta enviar ao MongoDB"""
+        return self._write('update_services_object', object_one, object_two)
+
+    def add_instance(self, ipaddr, instance) -> Optional[bool]:
+        """ Registra a instância no host, None quando a escrita ficou na fila"""
+        return self._write('add_instance', ipaddr, instance)
+
+    def add_server(self, server) -> Optional[bool]:
+        """ Registra o host, None quando a escrita ficou na fila"""
+        return self._write('add_server', server)
+
+    def add_instances(self, hostname, ipaddr, instances, create_host=False) -> Optional[List[str]]:
+        """ Registra várias instâncias do host, None quando a escrita ficou na fila"""
+        return self._write('add_instances', hostname, ipaddr, list(instances), create_host)
+
+    def _read(self, method: str, *args) -> List[Dict]:
+        key = self._key(method, *args)
+        cached = self._load(key)
+        if cached is not None and (self.offline or time.time() - cached[2] <= self.max_age):
+            self.last_source = 'cache'
+            return cached[0]
+        if self.offline:
+            raise RegistryUnavailable('registry in offline mode and not cached locally')
+
+        try:
+            documents = self._refresh(key)
+        except RegistryUnavailable:
+            if cached is None:
+                raise
+            self.last_source = 'stale'
+            return cached[0]
+        self.last_source = 'remote'
+        return documents
+
+    def _write(self, method: str, *args):
+        """ Grava a escrita na fila e nas cópias locais afetadas, depois tenta esvaziar a fila"""
+        with self._connect() as db:
+            db.execute('BEGIN IMMEDIATE')
+            for key, body, revision in db.execute('SELECT query, body, revision FROM documents').fetchall():
+                read_method, read_args = json.loads(key)
+                documents = json_util.loads(body)
+                applied = self._apply(read_method, read_args, documents, method, args)
+                if applied:
+                    db.execute('UPDATE documents SET body = ?, revision = ? WHERE query = ?',
+                               (json_util.dumps(documents), revision + 1, key))
+                elif applied is None:
+                    # Alteração sem equivalente local, a cópia é relida no próximo acesso
+                    db.execute('UPDATE documents SET fetched_at = 0, revision = ? WHERE query = ?',
+                               (revision + 1, key))
+            cursor = db.execute('INSERT INTO pending (query, body, created_at) VALUES (?, ?, ?)',
+                                (self._key(method), json_util.dumps([method, args]), time.time()))
+            pending_id = cursor.lastrowid
+            db.execute('COMMIT')
+
+        if not self.offline:
+            try:
+                self.flush()
+            except RegistryUnavailable:
+                pass
+        return self.__results.pop(pending_id, None)
+
+    def flush(self) -> int:
+        """ Reenvia as escritas pendentes em ordem, retorna quantas foram aplicadas no MongoDB
+
+            Cada escrita é removida da fila na mesma transação em que é enviada, evitando que dois
+            processos reenviem a mesma alteração. Uma escrita recusada pelo MongoDB é descartada
+            para não bloquear a fila e, como já foi aplicada nas cópias locais, todas as cópias
+            são marcadas como vencidas para serem relidas do MongoDB; as demais escritas seguem e
+            ao final as recusadas são informadas em RegistryRejected.
+        """
+        applied = 0
+        rejected = []
+        with self.__lock, self._connect() as db:
+            while True:
+                db.execute('BEGIN IMMEDIATE')
+                row = db.execute('SELECT id, body FROM pending ORDER BY id LIMIT 1').fetchone()
+                if row is None:
+                    db.execute('COMMIT')
+                    break
+                method, args = json_util.loads(row[1])
+                try:
+                    result = self._remote_call(getattr(self.remote, method), *args)
+                except RegistryUnavailable:
+                    db.execute('ROLLBACK')
+                    raise
+                except Exception as err:
+                    db.execute('DELETE FROM pending WHERE id = ?', (row[0],))
+                    db.execute('UPDATE documents SET fetched_at = 0, revision = revision + 1')
+                    db.execute('COMMIT')
+                    rejected.append((method, str(err) or type(err).__name__))
+                    continue
+                db.execute('DELETE FROM pending WHERE id = ?', (row[0],))
+                db.execute('COMMIT')
+                self.__results[row[0]] = result
+                applied += 1
+        if rejected:
+            raise RegistryRejected(rejected)
+        return applied
+
+    def sync(self) -> Dict:
+        """ Reenvia a fila e relê do MongoDB todas as consultas em cache, inclusive no modo offline
+
+            As cópias são relidas mesmo com escritas recusadas, RegistryRejected é propagado depois.
+        """
+        rejected = None
+        try:
+            applied = self.flush()
+        except RegistryRejected as err:
+            rejected, applied = err, None
+        self.__results.clear()
+        with self._connect() as db:
+            queries = [row[0] for row in db.execute('SELECT query FROM documents')]
+        for key in queries:
+            self._refresh(key, flush=False)
+        if rejected is not None:
+            raise rejected
+        return dict(self.status(), applied=applied)
+
+    def status(self) -> Dict:
+        """ Retorna a revisão, a idade da cópia mais antiga e o tamanho da fila"""
+        with self._connect() as db:
+            revision, fetched_at = db.execute(
+                'SELECT COALESCE(MAX(revision), 0), MIN(fetched_at) FROM documents').fetchone()
+            pending = db.execute('SELECT COUNT(*) FROM pending').fetchone()[0]
+        return {'revision': revision, 'fetched_at': fetched_at, 'pending': pending}
+
+    def _refresh(self, key: str, flush: bool = True) -> List[Dict]:
+        """ Repete a consulta no MongoDB e grava a cópia local, as escritas pendentes vão antes"""
+        if flush:
+            self.flush()
+        method, args = json.loads(key)
+        documents = self._remote_call(lambda: list(getattr(self.remote, method)(*args)))
+        for doc in documents:
+            doc.pop('_id', None)
+        with self._connect() as db:
+            db.execute('INSERT OR REPLACE INTO documents (query, body, revision, fetched_at) VALUES '
+                       '(?, ?, COALESCE((SELECT revision FROM documents WHERE query = ?), 0) + 1, ?)',
+                       (key, json_util.dumps(documents), key, time.time()))
+        return documents
+
+    @staticmethod
+    def _remote_call(func, *args):
+        from pymongo.errors import ConnectionFailure
+        try:
+            return func(*args)
+        except ConnectionFailure as err:
+            raise RegistryUnavailable(str(err)) from err
+
+    def _load(self, key: str) -> Optional[tuple]:
+        with self._connect() as db:
+            row = db.execute('SELECT body, revision, fetched_at FROM documents WHERE query = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        return json_util.loads(row[0]), row[1], row[2]
+
+    @staticmethod
+    def _project(document: Dict, projection: Optional[Dict]) -> Dict:
+        """ Aplica uma projeção de primeiro nível, de inclusão ou de exclusão"""
+        if not projection:
+            return dict(document)
+        included = [field for field, flag in projection.items() if flag and field != '_id']
+        if included:
+            return {field: document[field] for field in included if field in document}
+        return {field: value for field, value in document.items() if projection.get(field, 1)}
+
+    @classmethod
+    def _apply(cls, read_method: str, read_args: List, documents: List[Dict], method: str, args) -> Optional[bool]:
+        """ Reproduz a escrita na cópia de uma consulta
+
+            Retorna True se a cópia mudou, False se a escrita não a afeta e None quando não há
+            como reproduzi-la localmente.
+        """
+        if method == 'add_instances':
+            hostname, ipaddr, instances, create_host = args
+            if create_host:
+                server = {'hostname': hostname, 'ipaddr': ipaddr, 'instances': list(instances)}
+                return cls._apply(read_method, read_args, documents, 'add_server', [server])
+            changed = [cls._apply(read_method, read_args, documents, 'add_instance', [ipaddr, instance])
+                       for instance in instances]
+            return None if None in changed else any(changed)
+
+        if read_method == 'find_all_services_object':
+            if method == 'update_services_object':
+                return cls._apply_update(documents, args[1]) if args[0] == read_args[0] else False
+            if read_args[0].get('nome') != 'instances':
+                return False
+            servers = [server for doc in documents for server in doc.get('servers', [])]
+            if method == 'add_server':
+                if not documents or any(server['ipaddr'] == args[0]['ipaddr'] for server in servers):
+                    return False
+                documents[0].setdefault('servers', []).append(args[0])
+                return True
+        elif read_method == 'find_host_servers':
+            if method == 'update_services_object':
+                return None
+            servers = documents
+            if method == 'add_server':
+                hostname, ipaddr = read_args
+                if args[0]['hostname'] != hostname and args[0]['ipaddr'] != ipaddr:
+                    return False
+                if any(server['ipaddr'] == args[0]['ipaddr'] for server in servers):
+                    return False
+                servers.append(args[0])
+                return True
+        else:
+            return None
+
+        if method == 'add_instance':
+            ipaddr, instance = args
+            for server in servers:
+                if server['ipaddr'] == ipaddr and all(i['instance'] != instance['instance']
+                                                      for i in server['instances']):
+                    server['instances'].append(instance)
+                    return True
+            return False
+        return None
+
+    @staticmethod
+    def _apply_update(documents: List[Dict], update: Dict) -> Optional[bool]:
+        """ Aplica $addToSet e $push, retorna None para operadores não suportados"""
+        if any(operator not in ('$addToSet', '$push') for operator in update):
+            return None
+        for document in documents:
+            for operator, changes in update.items():
+                for path, value in changes.items():
+                    target = document
+                    *parents, field = path.split('.')
+                    for part in parents:
+                        target = target[int(part)] if isinstance(target, list) else target.setdefault(part, {})
+                    values = value['$each'] if isinstance(value, dict) and '$each' in value else [value]
+                    array = target.setdefault(field, [])
+                    for item in values:
+                        if operator == '$push' or item not in array:
+                            array.append(item)
+        return True
@@ -2,9 +2,9 @@ from abc import ABC, abstractmethod
 from collections.abc import MutableMapping
 from glob import glob
 import os
-import psutil
 import re
-import time
+
+from entities.service_process import ServiceProcess
 
 
 class InMemoryProcessRepo(ABC):
@@ -109,19 +109,22 @@ class ListFilesRepo(InMemoryRepo):
 
 
 class ListProcessRepo(InMemoryProcessRepo):
+    # Atributos do psutil necessários para montar cada campo do registro
+    RECORD_ATTRS = {'name': [],
+                    'pid': [],
+                    'started': ['create_time'],
+                    'memory_percent': ['memory_percent'],
+                    'cpu_percent': ['cpu_percent'],
+                    'parameters': [],
+                    'arguments': [],
+                    'environ': ['environ'],
+                    'connections': ['connections']}
+    # Atributos custosos, lidos por ServiceProcess apenas quando acessados (ver load)
+    EXPENSIVE_ATTRS = ('environ', 'connections')
+
     def __init__(self, filters):
         self.__filters = filters
         self.__version = 'python3'
-        self.__process_name = None
-        self.__process_pid = None
-        self.__process_started = None
-        self.__process_memory = None
-        self.__process_cpu = None
-        self.__selected_process = None
-        self.__parameters = None
-        self.__arguments = None
-        self.__environ = None
-        self.__connections = None
 
     @property
     def filters(self):
@@ -131,30 +134,49 @@ class ListProcessRepo(InMemoryProcessRepo):
     def filters(self, value):
         self.__filters = value
 
-    def list_process(self):
-        for proc in psutil.process_iter(attrs=self.filters):
-            if proc.info[self.filters[0]].startswith(self.__version):
-                self.__process_name = list(filter(lambda v: re.match('^(cs[a-z].*)', v), proc.info[self.filters[6]]))
-                self.__process_pid = proc.info[self.filters[2]]
-                self.__process_started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(proc.info[self.filters[1]]))
-                self.__process_memory = round(proc.info[self.filters[4]])
-                self.__process_cpu = round(proc.info[self.filters[3]])
-                self.__parameters = list(filter(lambda v: re.match('^(--[a-z].*)', v), proc.info['cmdline']))
-                self.__arguments = list(filter(lambda v: re.match('^([^\-\-])', v), proc.info['cmdline']))
-                self.__environ = proc.info['environ']
-                self.__connections = proc.info['connections']
-                if (0 <= 0 < len(self.__process_name)) or (-len(self.__process_name) <= 0 < 0):
-                    self.__selected_process = {'name': self.__process_name[0],
-                                            'pid': self.__process_pid,
-                                            'started': self.__process_started,
-                                            'memory_percent': self.__process_memory,
-                                            'cpu_percent': self.__process_cpu,
-                                            'parameters': self.__parameters,
-                                            'environ': self.__environ,
-                                            'connections': self.__connections,
-                                            'arguments': self.__arguments}
-
-                yield self.__selected_process
+    def list_process(self, fields=None, service=None):
+        """ Retorna os processos dos serviços (ServiceProcess) coletando apenas os campos solicitados.
+
+            fields: campos do registro (ver RECORD_ATTRS), todos quando None.
+            service: nome exato do serviço, restringe os processos retornados.
+        """
+        import psutil
+
+        fields = list(self.RECORD_ATTRS) if fields is None else fields
+
+        for proc in psutil.process_iter(attrs=self.__projection(fields)):
+            if not (proc.info['name'] or '').startswith(self.__version):
+                continue
+
+            process_name = list(filter(lambda v: re.match('^(cs[a-z].*)', v), proc.info['cmdline'] or []))
+            if not process_name:
+                continue
+            if service and process_name[0] != service:
+                continue
+
+            yield ServiceProcess.from_info(process_name[0], proc.info, self, fields)
+
+    def load(self, pid, attr):
+        """ Lê um atributo custoso do processo, None se não permitido ou se o processo não existir mais"""
+        import psutil
+
+        if attr not in self.EXPENSIVE_ATTRS or attr not in self.filters:
+            return None
+        try:
+            proc = psutil.Process(pid)
+            if attr == 'connections':
+                return (getattr(proc, 'net_connections', None) or proc.connections)()
+            return proc.environ()
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            return None
+
+    def __projection(self, fields):
+        """ Atributos baratos do psutil necessários para os campos, os custosos ficam para load()"""
+        attrs = ['name', 'pid', 'cmdline']
+        for field in fields:
+            attrs.extend(a for a in self.RECORD_ATTRS[field]
+                         if a in self.filters and a not in attrs and a not in self.EXPENSIVE_ATTRS)
+        return attrs
 
 
 class ListFieldsRepo(InMemoryFieldsRepo):
@@ -5,6 +5,9 @@ from infra.config import Config
 
 settings = Config()
 
+# Documento único que guarda o registro de instâncias
+REGISTRY_NAME = 'instances'
+
 
 class MongoRepo:
     def __init__(self, db=None, collection=None, url=None):
@@ -44,3 +47,222 @@ class MongoRepo:
         except FailureOperation as err:
             raise err
         return
+
+    def find_host_servers(self, hostname, ipaddr):
+        """ Retorna apenas as entradas de servers do host, filtradas no próprio MongoDB"""
+        match_host = {'$or': [{'$eq': ['$$server.hostname', hostname]}, {'$eq': ['$$server.ipaddr', ipaddr]}]}
+        pipeline = [{'$match': {'nome': REGISTRY_NAME,
+                                '$or': [{'servers.hostname': hostname}, {'servers.ipaddr': ipaddr}]}},
+                    {'$project': {'_id': 0, 'servers': {'$filter': {'input': '$servers', 'as': 'server',
+                                                                    'cond': match_host}}}},
+                    {'$unwind': '$servers'},
+                    {'$replaceRoot': {'newRoot': '$servers'}}]
+        try:
+            servers = self.cursor[self.db][self.collection].aggregate(pipeline)
+        except FailureOperation as err:
+            raise err
+        return servers
+
+    def add_instance(self, ipaddr, instance):
+        """ Registra a instância no host pelo operador posicional, retorna False se já registrada
+
+            O filtro só casa com a entrada do host que ainda não tem a instância, a verificação e a
+            escrita acontecem em uma única operação atômica no MongoDB.
+        """
+        query = {'nome': REGISTRY_NAME,
+                 'servers': {'$elemMatch': {'ipaddr': ipaddr, 'instances.instance': {'$ne': instance['instance']}}}}
+        update = {'$push': {'servers.$.instances': instance}}
+        try:
+            result = self.cursor[self.db][self.collection].update_one(query, update)
+        except FailureOperation as err:
+            raise err
+        return result.modified_count == 1
+
+    def add_server(self, server):
+        """ Registra um host com as suas instâncias, retorna False se o ipaddr já estiver registrado"""
+        query = {'nome': REGISTRY_NAME, 'servers.ipaddr': {'$ne': server['ipaddr']}}
+        try:
+            result = self.cursor[self.db][self.collection].update_one(query, {'$push': {'servers': server}})
+        except FailureOperation as err:
+            raise err
+        return result.modified_count == 1
+
+    def add_instances(self, hostname, ipaddr, instances, create_host=False):
+        """ Registra várias instâncias do host em um único bulk_write, retorna as efetivadas
+
+            Cada instância é uma atualização condicional (ver add_instance), com `create_host` o host
+            é cadastrado já com todas elas. Se alguma escrita não for aplicada por concorrência a
+            entrada do host é relida para saber quais instâncias estão registradas.
+        """
+        from pymongo import UpdateOne
+
+        if create_host:
+            server = {'hostname': hostname, 'ipaddr': ipaddr, 'instances': list(instances)}
+            operations = [UpdateOne({'nome': REGISTRY_NAME, 'servers.ipaddr': {'$ne': ipaddr}},
+                                    {'$push': {'servers': server}})]
+        else:
+            operations = [UpdateOne({'nome': REGISTRY_NAME,
+                                     'servers': {'$elemMatch': {'ipaddr': ipaddr,
+                                                                'instances.instance': {'$ne': i['instance']}}}},
+                                    {'$push': {'servers.$.instances': i}}) for i in instances]
+        if not operations:
+            return []
+        try:
+            result = self.cursor[self.db][self.collection].bulk_write(operations, ordered=False)
+        except FailureOperation as err:
+            raise err
+        if result.modified_count == len(operations):
+            return [i['instance'] for i in instances]
+        if create_host:
+            return []
+
+        registered = [inst for server in self.find_host_servers(hostname, ipaddr) if server['ipaddr'] == ipaddr
+                      for inst in server['instances']]
+        return [i['instance'] for i in instances if i in registered]
+
+    def create_indexes(self):
+        """ Cria os índices usados pelas consultas do registro, pode ser executado mais de uma vez
+
+            O índice em `nome` não é único: a coleção é compartilhada com outras ferramentas e pode
+            ter nomes repetidos. Um registry_nome único criado por versões anteriores é removido.
+        """
+        collection = self.cursor[self.db][self.collection]
+        try:
+            if collection.index_information().get('registry_nome', {}).get('unique'):
+                collection.drop_index('registry_nome')
+            return [collection.create_index('nome', name='registry_nome'),
+                    collection.create_index('servers.ipaddr', name='registry_servers_ipaddr'),
+                    collection.create_index('servers.hostname', name='registry_servers_hostname')]
+        except FailureOperation as err:
+            raise err
+
+
+class MongoRegistryRepo(MongoRepo):
+    """ Registro com um documento por (host, instância) em vez do documento único `instances`
+
+        Cada documento tem hostname, ipaddr, component, instance e type, com índice único em
+        (ipaddr, instance): registros de hosts diferentes não disputam o mesmo documento e o
+        tamanho do registro não esbarra no limite de 16MB. As leituras e escritas no formato
+        antigo ({'nome': 'instances', 'servers': [...]}) continuam aceitas e são traduzidas.
+    """
+
+    INSTANCE_FIELDS = ('component', 'instance', 'type')
+
+    @property
+    def registry(self):
+        return self.cursor[self.db][self.collection]
+
+    def find_all_services_object(self, one_object, two_object=None):
+        """ Pesquisa documentos, a consulta pelo documento `instances` é montada no formato antigo"""
+        if one_object != {'nome': REGISTRY_NAME}:
+            return super().find_all_services_object(one_object, two_object)
+        servers = self._group(self._find({}))
+        document = {'nome': REGISTRY_NAME, 'servers': servers}
+        if two_object:
+            document = {k: v for k, v in document.items() if two_object.get(k, 1) and k != '_id'}
+        return [document]
+
+    def update_services_object(self, object_one, object_two):
+        """ Traduz $push/$addToSet em servers e servers.N.instances para documentos por instância"""
+        if object_one != {'nome': REGISTRY_NAME}:
+            return super().update_services_object(object_one, object_two)
+        for operator, changes in object_two.items():
+            if operator not in ('$push', '$addToSet'):
+                raise FailureOperation('operator {} not supported by the registry layout'.format(operator))
+            for path, value in changes.items():
+                values = value['$each'] if isinstance(value, dict) and '$each' in value else [value]
+                parts = path.split('.')
+                if parts == ['servers']:
+                    for server in values:
+                        self.add_server(server)
+                elif len(parts) == 3 and parts[0] == 'servers' and parts[2] == 'instances':
+                    server = self._group(self._find({}))[int(parts[1])]
+                    for instance in values:
+                        self.add_instance(server['ipaddr'], instance)
+                else:
+                    raise FailureOperation('path {} not supported by the registry layout'.format(path))
+
+    def find_host_servers(self, hostname, ipaddr):
+        """ Retorna as entradas de servers do host, apenas os documentos do host são lidos"""
+        return self._group(self._find({'$or': [{'hostname': hostname}, {'ipaddr': ipaddr}]}))
+
+    def add_instance(self, ipaddr, instance):
+        """ Registra a instância em um host cadastrado, retorna False se o host não existir ou se
+            a instância já estiver registrada
+        """
+        try:
+            host = self.registry.find_one({'ipaddr': ipaddr}, {'_id': 0, 'hostname': 1})
+        except FailureOperation as err:
+            raise err
+        if host is None:
+            return False
+        return self._upsert(host['hostname'], ipaddr, instance)
+
+    def add_server(self, server):
+        """ Registra um host com as suas instâncias, retorna False se nenhuma foi registrada
+
+            Cada instância é um upsert condicional em (ipaddr, instance), sem consulta prévia ao
+            host. Um host sem instâncias não deixaria documento no registro e é recusado.
+        """
+        instances = server.get('instances') or []
+        if not instances:
+            return False
+        return bool(self.add_instances(server['hostname'], server['ipaddr'], instances, create_host=True))
+
+    def add_instances(self, hostname, ipaddr, instances, create_host=False):
+        """ Registra várias instâncias em um único bulk_write de upserts, retorna as efetivadas"""
+        from pymongo import UpdateOne
+
+        instances = list(instances)
+        operations = [UpdateOne({'ipaddr': ipaddr, 'instance': i['instance']},
+                                {'$setOnInsert': self.document(hostname, ipaddr, i)}, upsert=True)
+                      for i in instances]
+        if not operations:
+            return []
+        try:
+            result = self.registry.bulk_write(operations, ordered=False)
+        except FailureOperation as err:
+            raise err
+        return [instances[index]['instance'] for index in sorted(result.upserted_ids)]
+
+    def create_indexes(self):
+        """ Cria o índice único (ipaddr, instance) e o índice por hostname"""
+        try:
+            return [self.registry.create_index([('ipaddr', 1), ('instance', 1)], unique=True,
+                                               name='registry_host_instance'),
+                    self.registry.create_index('hostname', name='registry_hostname')]
+        except FailureOperation as err:
+            raise err
+
+    def _upsert(self, hostname, ipaddr, instance):
+        """ Insere o documento da instância se ele ainda não existir, em uma única operação"""
+        document = self.document(hostname, ipaddr, instance)
+        try:
+            result = self.registry.update_one({'ipaddr': ipaddr, 'instance': document['instance']},
+                                              {'$setOnInsert': document}, upsert=True)
+        except FailureOperation as err:
+            raise err
+        return result.upserted_id is not None
+
+    def _find(self, query):
+        try:
+            return self.registry.find(query, {'_id': 0}).sort([('ipaddr', 1), ('instance', 1)])
+        except FailureOperation as err:
+            raise err
+
+    @classmethod
+    def document(cls, hostname, ipaddr, instance):
+        """ Documento do registro de uma instância"""
+        document = {'hostname': hostname, 'ipaddr': ipaddr}
+        document.update((field, instance.get(field)) for field in cls.INSTANCE_FIELDS)
+        return document
+
+    @classmethod
+    def _group(cls, documents):
+        """ Agrupa os documentos por host no formato de entrada de servers"""
+        servers = {}
+        for document in documents:
+            server = servers.setdefault(document['ipaddr'], {'hostname': document['hostname'],
+                                                             'ipaddr': document['ipaddr'], 'instances': []})
+            server['instances'].append({field: document.get(field) for field in cls.INSTANCE_FIELDS})
+        return list(servers.values())
@@ -0,0 +1,135 @@
+""" Registro persistente das portas HTTP dos serviços brain e render.
+
+    O ledger é um JSON com a porta de cada serviço, a pilha de portas liberadas e o cursor da
+    próxima porta nunca usada nas faixas configuradas. Cada operação trava o arquivo com flock,
+    relê o estado, altera e grava com rename atômico. Depois da leitura, que é O(n) no número de
+    serviços, alocar e liberar uma porta são O(1): a porta vem da pilha de liberadas ou do cursor.
+"""
+import contextlib
+import fcntl
+import json
+import os
+import tempfile
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+
+class PortsExhausted(Exception):
+    """ Todas as portas das faixas configuradas estão em uso"""
+
+
+def parse_ranges(ranges: str) -> List[Tuple[int, int]]:
+    """ Converte '20000-24999,26000-26999' em [(20000, 24999), (26000, 26999)]"""
+    parsed = []
+    for item in filter(None, (part.strip() for part in str(ranges).split(','))):
+        start, _, end = item.partition('-')
+        start, end = int(start), int(end or start)
+        if not 0 < start <= end < 65536:
+            raise ValueError('invalid port range: {}'.format(item))
+        parsed.append((start, end))
+    if not parsed:
+        raise ValueError('no port range configured')
+    return parsed
+
+
+class PortLedgerRepo:
+    """ Alocação de portas em faixas configuradas, sem colisão entre serviços nem com o host
+
+        path: arquivo JSON do ledger.
+        ranges: faixas de portas, fora do intervalo efêmero do kernel (ip_local_port_range).
+    """
+
+    def __init__(self, path: str, ranges: str):
+        self.path = path
+        self.ranges = parse_ranges(ranges)
+        self.size = sum(end - start + 1 for start, end in self.ranges)
+
+    def port(self, service: str) -> Optional[int]:
+        with self._ledger(write=False) as ledger:
+            return ledger['ports'].get(service)
+
+    def ports(self) -> Dict[str, int]:
+        with self._ledger(write=False) as ledger:
+            return dict(ledger['ports'])
+
+    def allocate(self, services: Iterable[str], taken: Set[int] = frozenset()) -> Dict[str, int]:
+        """ Retorna a porta de cada serviço, reaproveitando a já registrada
+
+            taken: portas que não podem ser entregues, normalmente as em LISTEN no host. Uma porta
+                liberada que esteja em uso volta para o fim da pilha.
+        """
+        allocated = {}
+        with self._ledger() as ledger:
+            used = set(ledger['ports'].values())
+            for service in services:
+                port = ledger['ports'].get(service)
+                if port is None:
+                    port = self._next(ledger, used, taken)
+                    ledger['ports'][service] = port
+                    used.add(port)
+                allocated[service] = port
+        return allocated
+
+    def release(self, services: Iterable[str]) -> Dict[str, int]:
+        """ Devolve as portas dos serviços para a pilha de liberadas"""
+        released = {}
+        with self._ledger() as ledger:
+            for service in services:
+                port = ledger['ports'].pop(service, None)
+                if port is not None:
+                    ledger['free'].append(port)
+                    released[service] = port
+        return released
+
+    def _next(self, ledger: Dict, used: Set[int], taken: Set[int]) -> int:
+        busy = []
+        try:
+            while ledger['free']:
+                port = ledger['free'].pop()
+                if port in used or not self._in_ranges(port):
+                    continue
+                if port in taken:
+                    busy.append(port)
+                    continue
+                return port
+            # O cursor percorre as faixas uma única vez, depois dá a volta procurando lacunas
+            for _ in range(self.size):
+                port = self._port_at(ledger['cursor'] % self.size)
+                ledger['cursor'] = ledger['cursor'] + 1
+                if port not in used and port not in taken:
+                    return port
+        finally:
+            ledger['free'][:0] = busy
+        raise PortsExhausted('no free port in {}'.format(self.ranges))
+
+    def _port_at(self, index: int) -> int:
+        for start, end in self.ranges:
+            if index <= end - start:
+                return start + index
+            index -= end - start + 1
+        raise IndexError(index)
+
+    def _in_ranges(self, port: int) -> bool:
+        return any(start <= port <= end for start, end in self.ranges)
+
+    @contextlib.contextmanager
+    def _ledger(self, write: bool = True):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        with open(self.path + '.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX if write else fcntl.LOCK_SH)
+            try:
+                with open(self.path) as file:
+                    ledger = json.load(file)
+            except FileNotFoundError:
+                ledger = {'ports': {}, 'free': [], 'cursor': 0}
+            yield ledger
+            if write:
+                fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.ports.')
+                try:
+                    with os.fdopen(fd, 'w') as tmp:
+                        json.dump(ledger, tmp, indent=1, sort_keys=True)
+                    os.replace(tmp_path, self.path)
+                except BaseException:
+                    with contextlib.suppress(OSError):
+                        os.unlink(tmp_path)
+                    raise
@@ -0,0 +1,191 @@
+import os
+import re
+import time
+
+from entities.service_process import ServiceProcess
+from repository.inmemory_repo import InMemoryProcessRepo
+from repository.inmemory_repo import ListProcessRepo
+
+
+class ProcFsProcessRepo(InMemoryProcessRepo):
+    """ Descoberta de processos lendo /proc/<pid>/cmdline e /proc/<pid>/stat diretamente.
+
+        O filtro é aplicado sobre os bytes do cmdline antes de qualquer objeto python ser
+        criado, apenas os processos dos serviços têm o stat lido e decodificado.
+    """
+
+    # Posições (após o nome do processo) dos campos de /proc/<pid>/stat
+    STAT_UTIME = 11
+    STAT_STIME = 12
+    STAT_STARTTIME = 19
+    STAT_RSS = 21
+
+    def __init__(self, filters, proc_path='/proc'):
+        self.__filters = filters
+        self.__version = b'python3'
+        self.__proc_path = proc_path
+        self.__service = re.compile(rb'\x00(cs[a-z][^\x00]*)')
+        self.__clock_ticks = os.sysconf('SC_CLK_TCK')
+        self.__page_size = os.sysconf('SC_PAGE_SIZE')
+
+    @property
+    def filters(self):
+        return self.__filters
+
+    @filters.setter
+    def filters(self, value):
+        self.__filters = value
+
+    def list_process(self, fields=None, service=None):
+        """ Retorna os processos dos serviços no mesmo formato do ListProcessRepo"""
+        fields = list(ListProcessRepo.RECORD_ATTRS) if fields is None else fields
+        boot_time = self.boot_time()
+        mem_total = self.mem_total() if 'memory_percent' in fields else None
+        uptime = self.uptime() if 'cpu_percent' in fields else None
+        service_name = service.encode() if service else None
+
+        for entry in os.scandir(self.__proc_path):
+            if not entry.name.isdigit():
+                continue
+
+            cmdline = self.read_file(entry.path, 'cmdline')
+            if not cmdline or b'\x00cs' not in cmdline:
+                continue
+
+            match = self.__service.search(cmdline)
+            if match is None:
+                continue
+            if service_name and match.group(1) != service_name:
+                continue
+
+            stat = self.read_file(entry.path, 'stat')
+            if stat is None:
+                continue
+            comm, _, values = stat.rpartition(b')')
+            if not comm[comm.find(b'(') + 1:].startswith(self.__version):
+                continue
+
+            values = values.split()
+            pid = int(entry.name)
+            start = int(values[self.STAT_STARTTIME]) / self.__clock_ticks
+            info = {'pid': pid,
+                    'cmdline': cmdline.rstrip(b'\x00').decode(errors='replace').split('\x00'),
+                    'create_time': boot_time + start}
+
+            if mem_total:
+                info['memory_percent'] = int(values[self.STAT_RSS]) * self.__page_size / mem_total * 100
+            if uptime:
+                ticks = int(values[self.STAT_UTIME]) + int(values[self.STAT_STIME])
+                info['cpu_percent'] = ticks / self.__clock_ticks / max(uptime - start, 1e-6) * 100
+
+            yield ServiceProcess.from_info(match.group(1).decode(), info, self, fields)
+
+    def load(self, pid, attr):
+        """ Lê environ ou connections do processo no primeiro acesso do ServiceProcess"""
+        if attr == 'environ':
+            return self.read_environ(os.path.join(self.__proc_path, str(pid)))
+        if attr == 'connections':
+            return self.read_connections(pid)
+        return None
+
+    def read_file(self, path, name):
+        """ Lê um arquivo do /proc em uma única chamada, None se o processo não existir mais"""
+        try:
+            with open(os.path.join(path, name), 'rb', buffering=0) as file:
+                return file.read()
+        except (FileNotFoundError, ProcessLookupError, PermissionError):
+            return None
+
+    def read_environ(self, path):
+        """ Retorna as variáveis de ambiente do processo"""
+        environ = self.read_file(path, 'environ')
+        if not environ:
+            return None
+        pairs = (v.partition('=') for v in environ.decode(errors='replace').split('\x00') if v)
+        return {k: v for k, _, v in pairs}
+
+    @staticmethod
+    def read_connections(pid):
+        """ Retorna as conexões do processo, o mapeamento de sockets fica a cargo do psutil"""
+        import psutil
+
+        try:
+            proc = psutil.Process(pid)
+            return (getattr(proc, 'net_connections', None) or proc.connections)()
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            return None
+
+    def boot_time(self):
+        """ Retorna o horário de boot do host em segundos desde a epoch"""
+        for line in self.read_file(self.__proc_path, 'stat').splitlines():
+            if line.startswith(b'btime'):
+                return int(line.split()[1])
+        return 0
+
+    def mem_total(self):
+        """ Retorna a memória total do host em bytes"""
+        for line in self.read_file(self.__proc_path, 'meminfo').splitlines():
+            if line.startswith(b'MemTotal:'):
+                return int(line.split()[1]) * 1024
+        return 0
+
+    def uptime(self):
+        """ Retorna o tempo desde o boot em segundos"""
+        return float(self.read_file(self.__proc_path, 'uptime').split()[0])
+
+
+class CpuSampler:
+    """ Calcula o CPU% de vários processos em duas passadas sobre os ticks do /proc/<pid>/stat.
+
+        Todos os processos são lidos de uma vez, o intervalo é aguardado uma única vez e a
+        segunda leitura é feita em lote, o custo total é o intervalo mais duas varreduras.
+    """
+
+    def __init__(self, proc_path='/proc'):
+        self.__proc_path = proc_path
+        self.__clock_ticks = os.sysconf('SC_CLK_TCK')
+
+    def read_ticks(self, pids):
+        """ Retorna {pid: (starttime, utime + stime)} dos processos ainda existentes"""
+        ticks = {}
+        for pid in pids:
+            try:
+                with open(os.path.join(self.__proc_path, str(pid), 'stat'), 'rb', buffering=0) as file:
+                    values = file.read().rpartition(b')')[2].split()
+            except (FileNotFoundError, ProcessLookupError, PermissionError):
+                continue
+            ticks[pid] = (values[ProcFsProcessRepo.STAT_STARTTIME],
+                          int(values[ProcFsProcessRepo.STAT_UTIME]) + int(values[ProcFsProcessRepo.STAT_STIME]))
+        return ticks
+
+    def sample(self, pids, interval):
+        """ Retorna {pid: cpu_percent} medido durante `interval` segundos"""
+        first = self.read_ticks(pids)
+        started = time.monotonic()
+        time.sleep(interval)
+        second = self.read_ticks(first)
+        elapsed = time.monotonic() - started
+
+        usage = {}
+        for pid, (starttime, ticks) in second.items():
+            first_starttime, first_ticks = first[pid]
+            if starttime != first_starttime:
+                continue
+            usage[pid] = (ticks - first_ticks) / self.__clock_ticks / elapsed * 100
+        return usage
+
+
+def listening_ports(proc_path='/proc'):
+    """ Portas TCP em LISTEN no host, lidas de /proc/net/tcp e /proc/net/tcp6 em uma passada"""
+    ports = set()
+    for name in ('tcp', 'tcp6'):
+        try:
+            with open(os.path.join(proc_path, 'net', name), 'rb') as table:
+                next(table, None)
+                for line in table:
+                    fields = line.split(None, 4)
+                    if len(fields) > 3 and fields[3] == b'0A':
+                        ports.add(int(fields[1].rpartition(b':')[2], 16))
+        except FileNotFoundError:
+            continue
+    return ports
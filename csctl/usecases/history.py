@@ -0,0 +1,107 @@
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from entities.timeseries import ServiceHistory
+
+
+class HistoryRecorder:
+    """ Amostra periodicamente os serviços e guarda o histórico em memória, usado pelo csctld
+
+        sampler: coleta por serviço no formato de ServiceMetricsUseCase.collect, incluindo os
+            serviços instalados parados; recebe se as conexões devem ser contadas. A contagem
+            percorre os sockets de todo o host e é feita apenas a cada `connections_every`
+            amostras, nas demais o último valor é repetido.
+        tiers: resoluções (segundos por janela, janelas), ver entities/timeseries.py.
+
+        Um serviço parado continua com o histórico, gravado com janelas ausentes, para que a
+        última execução possa ser consultada depois de uma queda. O histórico é descartado
+        quando o script é desinstalado (o serviço some da coleta) ou quando a última amostra em
+        execução é mais antiga que a maior resolução; a memória é limitada pelo número de
+        serviços instalados que já estiveram em execução.
+    """
+
+    def __init__(self, sampler: Callable[[bool], Dict[str, Dict]], tiers: List[Tuple[int, int]],
+                 interval: float = 1.0, connections_every: int = 10):
+        self.sampler = sampler
+        self.tiers = tiers
+        self.interval = interval
+        self.connections_every = max(1, connections_every)
+        self.histories: Dict[str, ServiceHistory] = {}
+        self.__lock = threading.Lock()
+        self.__cpu = {}
+        self.__connections = {}
+        self.__last_up = {}
+        self.__samples = 0
+
+    def record(self, now: Optional[float] = None):
+        """ Coleta uma amostra de todos os serviços"""
+        with_connections = self.__samples % self.connections_every == 0
+        self.__samples += 1
+        samples = self.sampler(with_connections)
+        now = time.time() if now is None else now
+
+        with self.__lock:
+            for name in list(self.histories):
+                if name not in samples or now - self.__last_up[name] > self.histories[name].span:
+                    self.discard(name)
+
+            for name, sample in samples.items():
+                if not sample.get('up'):
+                    self.__cpu.pop(name, None)
+                    self.__connections.pop(name, None)
+                    if name in self.histories:
+                        self.histories[name].add(now, {})
+                    continue
+                self.__last_up[name] = now
+                cpu_total = sample['cpu_user'] + sample['cpu_system']
+                previous = self.__cpu.get(name)
+                self.__cpu[name] = (now, cpu_total)
+                cpu_percent = None
+                if previous and now > previous[0] and cpu_total >= previous[1]:
+                    cpu_percent = 100.0 * (cpu_total - previous[1]) / (now - previous[0])
+                if with_connections:
+                    self.__connections[name] = sum(sample['connections'].values())
+
+                history = self.histories.get(name)
+                if history is None:
+                    history = self.histories[name] = ServiceHistory(self.tiers)
+                history.add(now, {'cpu_percent': cpu_percent, 'rss_kb': sample['rss'] / 1024,
+                                  'fds': sample['fds'], 'connections': self.__connections.get(name)})
+
+    def discard(self, name: str):
+        del self.histories[name]
+        self.__cpu.pop(name, None)
+        self.__connections.pop(name, None)
+        self.__last_up.pop(name, None)
+
+    def run(self, stopped: threading.Event, logger=None):
+        """ Amostra a cada `interval` segundos até `stopped`"""
+        while not stopped.wait(self.interval):
+            try:
+                self.record()
+            except Exception:
+                if logger:
+                    logger.exception('history sample failed')
+
+    def query(self, names: List[str], since: float, step: Optional[int] = None) -> Iterator[Dict]:
+        """ Produz as janelas dos últimos `since` segundos de cada serviço"""
+        start = time.time() - since
+        with self.__lock:
+            rows = []
+            for name in names:
+                history = self.histories.get(name)
+                if history is None:
+                    continue
+                tier = history.tier(since, step)
+                for timestamp, values in tier.points(start):
+                    rows.append(dict({'service': name, 'time': timestamp, 'step': tier.step}, **values))
+        return iter(rows)
+
+    def services(self) -> List[str]:
+        with self.__lock:
+            return sorted(self.histories)
+
+    def nbytes(self) -> int:
+        with self.__lock:
+            return sum(history.nbytes for history in self.histories.values())
@@ -1,4 +1,5 @@
-from typing import Dict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
 
 
 class ListInstanceUseCase:
@@ -9,6 +10,10 @@ class ListInstanceUseCase:
         """ Retorna um dicionário com as instâncias registardas"""
         return self.service_repo.find_all_services_object(object_one, object_two)
 
+    def list_host_instances(self, hostname, ipaddr) -> List[Dict]:
+        """ Retorna apenas as entradas de servers do host informado"""
+        return list(self.service_repo.find_host_servers(hostname, ipaddr))
+
 
 class UpdateInstanceUseCase:
     def __init__(self, service_repo):
@@ -17,3 +22,71 @@ class UpdateInstanceUseCase:
     def update_instances(self, object_one, object_two) -> Dict:
         """ Executa cursor para atualizar serviços"""
         return self.service_repo.update_services_object(object_one, object_two)
+
+    def register_instance(self, ipaddr, instance) -> bool:
+        """ Registra uma instância em um host já cadastrado"""
+        return self.service_repo.add_instance(ipaddr, instance)
+
+    def register_server(self, server) -> bool:
+        """ Cadastra um host com as suas instâncias, um host sem instâncias é recusado"""
+        if not server.get('instances'):
+            return False
+        return self.service_repo.add_server(server)
+
+
+@dataclass
+class RegistrationReport:
+    """ Resultado do registro em lote das instâncias de um host"""
+    host_registered: bool
+    added: List[str] = field(default_factory=list)
+    skipped: List[str] = field(default_factory=list)
+    conflicted: List[str] = field(default_factory=list)
+    pending: List[str] = field(default_factory=list)
+
+
+class RegisterInstancesUseCase:
+    """ Registra várias instâncias de um host calculando a diferença localmente
+
+        O registro do host é lido uma vez e apenas as instâncias ausentes seguem para o MongoDB em
+        um único bulk_write. Instâncias já registradas iguais são ignoradas; registradas com outro
+        componente ou tipo, ou que não foram aplicadas por concorrência, são conflitos.
+    """
+
+    def __init__(self, service_repo):
+        self.service_repo = service_repo
+
+    def register(self, hostname, ipaddr, instances: List[Dict], add_host: bool = False) -> RegistrationReport:
+        host = self._host(hostname, ipaddr)
+        report = RegistrationReport(host_registered=host is not None)
+        if host is None and not add_host:
+            return report
+
+        registered = {inst['instance']: inst for inst in (host or {}).get('instances', [])}
+        to_add, seen = [], set()
+        for instance in instances:
+            name = instance['instance']
+            if name in seen:
+                continue
+            seen.add(name)
+            current = registered.get(name)
+            if current is None:
+                to_add.append(instance)
+            elif all(current.get(k) == v for k, v in instance.items() if v is not None):
+                report.skipped.append(name)
+            else:
+                report.conflicted.append(name)
+
+        if not to_add:
+            return report
+
+        applied = self.service_repo.add_instances(hostname, ipaddr, to_add, create_host=host is None)
+        if applied is None:
+            report.pending = [instance['instance'] for instance in to_add]
+            return report
+        for instance in to_add:
+            (report.added if instance['instance'] in applied else report.conflicted).append(instance['instance'])
+        return report
+
+    def _host(self, hostname, ipaddr) -> Optional[Dict]:
+        return next((server for server in self.service_repo.find_host_servers(hostname, ipaddr)
+                     if server['ipaddr'] == ipaddr), None)
@@ -1,11 +1,35 @@
+import time
 from typing import Dict
 
+from entities.process_snapshot import ProcessSnapshot
+
 
 class ListProcessUseCase:
-    def __init__(self, process_repo):
+    def __init__(self, process_repo, cache_ttl=0.0):
         self.process_repo = process_repo
+        self.cache_ttl = cache_ttl
+        self.__cache = {}
+
+    def list_process(self, fields=None, service=None) -> Dict:
+        """ Retorna os processos dos serviços com os campos solicitados"""
+        return self.process_repo.list_process(fields=fields, service=service)
+
+    def snapshot(self, fields=None) -> ProcessSnapshot:
+        """ Retorna uma fotografia indexada da tabela de processos
 
-    def list_process(self) -> Dict:
-        return self.process_repo.list_process()
+            Com cache_ttl > 0 (processo residente, ver csctld) a mesma fotografia é reaproveitada
+            enquanto for mais nova que cache_ttl segundos ou até invalidate() ser chamado.
+        """
+        if self.cache_ttl <= 0:
+            return ProcessSnapshot(self.process_repo.list_process(fields=fields))
 
+        key = tuple(fields or ())
+        cached = self.__cache.get(key)
+        if cached is None or time.monotonic() - cached[0] > self.cache_ttl:
+            cached = (time.monotonic(), ProcessSnapshot(self.process_repo.list_process(fields=fields)))
+            self.__cache[key] = cached
+        return cached[1]
 
+    def invalidate(self):
+        """ Descarta as fotografias em cache"""
+        self.__cache.clear()
@@ -0,0 +1,136 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional
+
+import psutil
+
+
+@dataclass
+class ServiceResult:
+    """ Resultado de uma operação sobre um serviço"""
+    name: str
+    ok: bool
+    returncode: Optional[int] = None
+    detail: str = ''
+
+
+class ManageProcessUseCase:
+    """ Executa operações de ciclo de vida com um pool limitado de workers"""
+
+    def __init__(self, workers: int = 1):
+        self.workers = max(1, workers or 1)
+
+    def run(self, action: Callable[[str], ServiceResult], services: List) -> Iterator[ServiceResult]:
+        """ Aplica `action` a cada serviço, os resultados são entregues na ordem de entrada"""
+        if self.workers == 1 or len(services) < 2:
+            for service in services:
+                yield action(service)
+            return
+
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(services))) as pool:
+            yield from pool.map(action, services)
+
+
+def parse_grace_overrides(value) -> Dict[str, float]:
+    """ Converte 'csbrain-1=30,cstasks-2=60' (ou um dicionário) em {serviço: segundos}"""
+    if not value:
+        return {}
+    if isinstance(value, dict):
+        return {str(name): float(grace) for name, grace in value.items()}
+    overrides = {}
+    for item in filter(None, (part.strip() for part in str(value).split(','))):
+        name, sep, grace = item.partition('=')
+        if not sep or not name.strip():
+            raise ValueError('invalid grace override: {}'.format(item))
+        overrides[name.strip()] = float(grace)
+    return overrides
+
+
+class StopProcessUseCase:
+    """ Para serviços sinalizando todos primeiro e aguardando a saída de todos em conjunto.
+
+        Os processos que não terminarem dentro do prazo de tolerância (`grace`, ou o valor de
+        `overrides` para o serviço) recebem SIGKILL, o tempo total é o do desligamento mais lento
+        e não a soma de todos.
+    """
+
+    # Intervalo máximo entre verificações de processos zumbis
+    POLL = 0.2
+
+    def __init__(self, grace: float = 10.0, kill_timeout: float = 5.0, overrides: Optional[Dict[str, float]] = None):
+        self.grace = grace
+        self.kill_timeout = kill_timeout
+        self.overrides = overrides or {}
+
+    def stop(self, targets: List[Dict]) -> List[ServiceResult]:
+        """ Envia SIGTERM para todos os alvos e aguarda, retorna os resultados na ordem dos alvos"""
+        results = {}
+        procs = {}
+        for target in targets:
+            try:
+                proc = psutil.Process(target['pid'])
+                proc.terminate()
+            except psutil.NoSuchProcess:
+                results[target['pid']] = ServiceResult(target['name'], True, detail='not running')
+                continue
+            except psutil.AccessDenied as err:
+                results[target['pid']] = ServiceResult(target['name'], False, detail='access denied: {}'.format(err))
+                continue
+            procs[proc] = target
+
+        started = time.monotonic()
+        pending = list(procs)
+        killed = []
+        while pending:
+            deadline = min(self.overrides.get(procs[p]['name'], self.grace) for p in pending)
+            gone, pending = self._wait(pending, deadline - (time.monotonic() - started))
+            for proc in gone:
+                results[proc.pid] = self._exited(procs[proc]['name'], proc, 'terminated')
+
+            elapsed = time.monotonic() - started
+            expired = [p for p in pending if self.overrides.get(procs[p]['name'], self.grace) <= elapsed]
+            for proc in expired:
+                try:
+                    proc.kill()
+                except psutil.NoSuchProcess:
+                    pass
+                killed.append(proc)
+            pending = [p for p in pending if p not in expired]
+
+        gone, alive = self._wait(killed, self.kill_timeout)
+        for proc in gone:
+            results[proc.pid] = self._exited(procs[proc]['name'], proc, 'killed')
+        for proc in alive:
+            results[proc.pid] = ServiceResult(procs[proc]['name'], False, detail='still running after SIGKILL')
+
+        return [results[target['pid']] for target in targets]
+
+    def _wait(self, procs: List, timeout: float):
+        """ Aguarda a saída dos processos até `timeout`, zumbis ainda não coletados contam como encerrados"""
+        deadline = time.monotonic() + max(timeout, 0)
+        gone, alive = [], list(procs)
+        while alive:
+            exited, alive = psutil.wait_procs(alive, timeout=max(min(deadline - time.monotonic(), self.POLL), 0))
+            gone.extend(exited)
+            zombies = [p for p in alive if self._is_zombie(p)]
+            gone.extend(zombies)
+            alive = [p for p in alive if p not in zombies]
+            if time.monotonic() >= deadline:
+                break
+        return gone, alive
+
+    @staticmethod
+    def _is_zombie(proc) -> bool:
+        try:
+            return proc.status() == psutil.STATUS_ZOMBIE
+        except psutil.NoSuchProcess:
+            return True
+
+    @staticmethod
+    def _exited(name: str, proc, how: str) -> ServiceResult:
+        """ Resultado de um processo encerrado, o código de saída só é conhecido para processos filhos"""
+        returncode = getattr(proc, 'returncode', None)
+        if returncode is None:
+            return ServiceResult(name, True, detail=how)
+        return ServiceResult(name, True, returncode, '{} (exit {})'.format(how, returncode))
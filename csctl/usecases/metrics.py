@@ -0,0 +1,146 @@
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional
+
+import psutil
+
+
+class ServiceMetricsUseCase:
+    """ Métricas dos serviços no formato texto do Prometheus (0.0.4).
+
+        Uma coleta obtém os processos dos serviços do repositório de processos (PROCESS_BACKEND),
+        a mesma classificação do status e do top, que lê apenas nome e cmdline de cada processo do
+        host; CPU, memória, threads e descritores são lidos somente dos pids dos serviços, e as
+        conexões de todo o host em uma única chamada. O texto gerado
+        é compartilhado por `ttl` segundos: scrapes frequentes ou simultâneos, de um ou mais
+        Prometheus, custam apenas a leitura do texto em cache, e enquanto uma coleta está em
+        andamento os demais scrapes aguardam o seu resultado em vez de coletar de novo.
+
+        process_repo: ListProcessRepo ou ProcFsProcessRepo.
+        installed: retorna os scripts instalados, fonte de csctl_service_up.
+        restarts: retorna os reinícios por serviço registrados pelo supervisor.
+    """
+
+    ATTRS = ['cpu_times', 'memory_info', 'num_threads', 'num_fds', 'create_time']
+
+    def __init__(self, process_repo, installed: Callable[[], Iterable[str]],
+                 restarts: Callable[[], Dict[str, int]] = dict, ttl: float = 5.0):
+        self.process_repo = process_repo
+        self.installed = installed
+        self.restarts = restarts
+        self.ttl = ttl
+        self.__lock = threading.Lock()
+        self.__text = None
+        self.__collected_at = 0.0
+
+    def render(self) -> str:
+        """ Retorna o texto das métricas, coletando apenas se o cache venceu"""
+        with self.__lock:
+            if self.__text is None or time.monotonic() - self.__collected_at > self.ttl:
+                started = time.monotonic()
+                samples = self.collect()
+                self.__collected_at = time.monotonic()
+                self.__text = self.format(samples, self.__collected_at - started)
+            return self.__text
+
+    def collect(self, with_connections: bool = True) -> Dict[str, Dict]:
+        """ Retorna as amostras agregadas por serviço, sem contar conexões se `with_connections` for False"""
+        services = {}
+        pids = {}
+        for record in self.process_repo.list_process(fields=[]):
+            try:
+                # as_dict lê os atributos dentro de um oneshot()
+                info = psutil.Process(record['pid']).as_dict(attrs=self.ATTRS)
+            except psutil.NoSuchProcess:
+                continue
+            service = services.setdefault(record['name'], {'processes': 0, 'rss': 0, 'cpu_user': 0.0,
+                                                           'cpu_system': 0.0, 'threads': 0, 'fds': 0,
+                                                           'start_time': None, 'connections': Counter()})
+            service['processes'] += 1
+            if info['memory_info'] is not None:
+                service['rss'] += info['memory_info'].rss
+            if info['cpu_times'] is not None:
+                service['cpu_user'] += info['cpu_times'].user
+                service['cpu_system'] += info['cpu_times'].system
+            service['threads'] += info['num_threads'] or 0
+            service['fds'] += info['num_fds'] or 0
+            if info['create_time'] and (service['start_time'] is None or info['create_time'] < service['start_time']):
+                service['start_time'] = info['create_time']
+            pids[record['pid']] = service
+
+        for pid, status in self.connections(pids) if with_connections else ():
+            pids[pid]['connections'][status] += 1
+
+        restarts = self.restarts() or {}
+        for name in set(self.installed()) | set(services) | set(restarts):
+            services.setdefault(name, None)
+        return {name: dict(sample or {}, up=sample is not None, restarts=restarts.get(name, 0))
+                for name, sample in services.items()}
+
+    @staticmethod
+    def connections(pids: Dict[int, Dict]) -> List:
+        """ Retorna (pid, status) das conexões dos serviços, em uma única leitura quando permitido"""
+        if not pids:
+            return []
+        try:
+            return [(conn.pid, conn.status) for conn in psutil.net_connections(kind='inet') if conn.pid in pids]
+        except psutil.AccessDenied:
+            pass
+        found = []
+        for pid in pids:
+            try:
+                proc = psutil.Process(pid)
+                method = getattr(proc, 'net_connections', None) or proc.connections
+                found.extend((pid, conn.status) for conn in method(kind='inet'))
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+        return found
+
+    @classmethod
+    def format(cls, samples: Dict[str, Dict], duration: float) -> str:
+        running = sorted(name for name, sample in samples.items() if sample['up'])
+        lines = []
+
+        def metric(name, kind, help_text, values):
+            lines.append('# HELP {} {}'.format(name, help_text))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            for labels, value in values:
+                label_text = ','.join('{}="{}"'.format(k, cls.escape(v)) for k, v in labels.items())
+                lines.append('{}{{{}}} {}'.format(name, label_text, cls.number(value)) if label_text
+                             else '{} {}'.format(name, cls.number(value)))
+
+        metric('csctl_service_up', 'gauge', 'Serviço em execução (1) ou parado (0).',
+               [({'service': name}, int(samples[name]['up'])) for name in sorted(samples)])
+        metric('csctl_service_processes', 'gauge', 'Processos em execução do serviço.',
+               [({'service': name}, samples[name]['processes']) for name in running])
+        metric('csctl_service_resident_memory_bytes', 'gauge', 'Memória residente (RSS) em bytes.',
+               [({'service': name}, samples[name]['rss']) for name in running])
+        metric('csctl_service_cpu_seconds_total', 'counter', 'Tempo de CPU consumido em segundos.',
+               [({'service': name, 'mode': mode}, samples[name]['cpu_' + mode])
+                for name in running for mode in ('user', 'system')])
+        metric('csctl_service_threads', 'gauge', 'Threads dos processos do serviço.',
+               [({'service': name}, samples[name]['threads']) for name in running])
+        metric('csctl_service_open_fds', 'gauge', 'Descritores de arquivo abertos.',
+               [({'service': name}, samples[name]['fds']) for name in running])
+        metric('csctl_service_start_time_seconds', 'gauge', 'Início do processo mais antigo, epoch em segundos.',
+               [({'service': name}, samples[name]['start_time']) for name in running
+                if samples[name]['start_time']])
+        metric('csctl_service_connections', 'gauge', 'Conexões inet por estado.',
+               [({'service': name, 'state': state}, count) for name in running
+                for state, count in sorted(samples[name]['connections'].items())])
+        metric('csctl_service_restarts_total', 'counter', 'Reinícios feitos pelo csctl supervise.',
+               [({'service': name}, samples[name]['restarts']) for name in sorted(samples)])
+        metric('csctl_exporter_collect_duration_seconds', 'gauge', 'Duração da última coleta.',
+               [({}, round(duration, 6))])
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def escape(value) -> str:
+        return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+    @staticmethod
+    def number(value: Optional[float]) -> str:
+        if isinstance(value, float):
+            return repr(round(value, 6))
+        return str(value)
@@ -0,0 +1,94 @@
+import contextlib
+import os
+import stat
+import tempfile
+from dataclasses import dataclass
+from typing import List, Optional, Set
+
+
+@dataclass
+class ProvisionResult:
+    """ Resultado da criação do script de init de um serviço"""
+    name: str
+    ok: bool
+    port: Optional[int] = None
+    detail: str = ''
+
+
+class ProvisionServicesUseCase:
+    """ Cria em lote os scripts de init e os links dos serviços
+
+        O template é compilado uma única vez por instância e cada script é renderizado já com a
+        sua porta, gravado em um arquivo temporário no mesmo diretório e renomeado sobre o destino:
+        um script de init nunca fica parcialmente escrito nem com a porta pendente. As portas vêm
+        do ledger (PortLedgerRepo) e são devolvidas quando a criação do serviço falha.
+    """
+
+    MODE = stat.S_IXUSR | stat.S_IWUSR | stat.S_IRGRP | stat.S_IWGRP | stat.S_IROTH
+
+    def __init__(self, template_path: str, template_name: str, initd_path: str, sbin_path: str, ports=None):
+        self.ports = ports
+        self.template_path = template_path
+        self.template_name = template_name
+        self.initd_path = initd_path
+        self.sbin_path = sbin_path
+        self.__template = None
+
+    @property
+    def template(self):
+        if self.__template is None:
+            from jinja2 import Environment, FileSystemLoader
+            env = Environment(loader=FileSystemLoader(self.template_path), autoescape=True)
+            self.__template = env.get_template(self.template_name)
+        return self.__template
+
+    def provision(self, component: str, service_names: List[str], http: bool = False,
+                  taken: Set[int] = frozenset()) -> List[ProvisionResult]:
+        """ Cria os serviços do componente, com `http` cada um recebe uma porta do ledger
+
+            taken: portas que o ledger não pode entregar, como as em LISTEN no host.
+        """
+        results = {name: ProvisionResult(name, False, detail='already exists') for name in service_names
+                   if os.path.lexists(os.path.join(self.initd_path, name))}
+        to_create = [name for name in service_names if name not in results]
+        ports = self.ports.allocate(to_create, taken) if http and to_create else {}
+        for name in to_create:
+            results[name] = self.create(component, name, ports.get(name))
+        failed = [name for name in to_create if name in ports and not results[name].ok]
+        if failed:
+            self.ports.release(failed)
+        return [results[name] for name in service_names]
+
+    def create(self, component: str, service_name: str, port: Optional[int] = None) -> ProvisionResult:
+        script = os.path.join(self.initd_path, service_name)
+        if os.path.lexists(script):
+            return ProvisionResult(service_name, False, detail='already exists')
+        try:
+            self.write_atomic(script, self.template.render(name=component, port=port))
+        except OSError as err:
+            return ProvisionResult(service_name, False, port, str(err))
+
+        link = os.path.join(self.sbin_path, service_name)
+        detail = ''
+        try:
+            os.symlink(script, link)
+        except FileExistsError:
+            detail = 'link {} already exists'.format(link)
+        except OSError as err:
+            detail = 'link not created: {}'.format(err)
+        return ProvisionResult(service_name, True, port, detail)
+
+    def write_atomic(self, path: str, content: str):
+        """ Grava em um temporário do mesmo diretório e renomeia sobre o destino"""
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.{}.'.format(os.path.basename(path)))
+        try:
+            with os.fdopen(fd, 'w') as tmp:
+                tmp.write(content)
+                tmp.flush()
+                os.fsync(tmp.fileno())
+            os.chmod(tmp_path, self.MODE)
+            os.replace(tmp_path, path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.unlink(tmp_path)
+            raise
@@ -0,0 +1,66 @@
+import os
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+
+
+@dataclass
+class ReconcileReport:
+    """ Divergências entre os scripts instalados, os processos em execução e o registro"""
+    hostname: str
+    ipaddr: str
+    installed: Set[str] = field(default_factory=set)
+    running: Set[str] = field(default_factory=set)
+    registered: Optional[Set[str]] = None
+
+    @property
+    def installed_not_running(self) -> List[str]:
+        return sorted(self.installed - self.running)
+
+    @property
+    def running_not_installed(self) -> List[str]:
+        return sorted(self.running - self.installed)
+
+    @property
+    def installed_not_registered(self) -> List[str]:
+        return [] if self.registered is None else sorted(self.installed - self.registered)
+
+    @property
+    def registered_not_installed(self) -> List[str]:
+        return [] if self.registered is None else sorted(self.registered - self.installed)
+
+    def discrepancies(self) -> Dict[str, List[str]]:
+        return {'installed_not_running': self.installed_not_running,
+                'running_not_installed': self.running_not_installed,
+                'installed_not_registered': self.installed_not_registered,
+                'registered_not_installed': self.registered_not_installed}
+
+    def as_dict(self) -> Dict:
+        return {'hostname': self.hostname, 'ipaddr': self.ipaddr,
+                'counts': {'installed': len(self.installed), 'running': len(self.running),
+                           'registered': None if self.registered is None else len(self.registered)},
+                'registry_available': self.registered is not None,
+                **self.discrepancies()}
+
+
+class ReconcileUseCase:
+    """ Compara em uma passada os scripts do init.d, os processos e o registro do host
+
+        Cada fonte é lida uma única vez e indexada em um conjunto, as divergências são diferenças
+        de conjuntos. Dos processos é coletado apenas o nome e do registro apenas a entrada do host.
+    """
+
+    def __init__(self, files_repo, process_repo, instance_repo):
+        self.files_repo = files_repo
+        self.process_repo = process_repo
+        self.instance_repo = instance_repo
+
+    def reconcile(self, hostname, ipaddr, with_registry: bool = True) -> ReconcileReport:
+        report = ReconcileReport(hostname, ipaddr)
+        report.installed = {os.path.basename(script) for script in self.files_repo.list_files}
+        report.running = {proc['name'] for proc in self.process_repo.list_process(fields=[]) if proc}
+        if with_registry:
+            report.registered = {instance['instance']
+                                 for server in self.instance_repo.find_host_servers(hostname, ipaddr)
+                                 if server['ipaddr'] == ipaddr
+                                 for instance in server['instances']}
+        return report
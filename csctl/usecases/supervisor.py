@@ -0,0 +1,236 @@
+import json
+import os
+import selectors
+import signal
+import time
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, List, Optional
+
+
+@dataclass
+class SupervisedService:
+    """ Estado de um serviço supervisionado"""
+    name: str
+    state: str = 'pending'
+    pid: Optional[int] = None
+    restarts: int = 0
+    failures: int = 0
+    started_at: Optional[float] = None
+    exited_at: Optional[float] = None
+    next_start: float = 0.0
+
+
+class Supervisor:
+    """ Mantém os serviços em execução, reiniciando-os quando o processo termina.
+
+        A saída de cada processo é detectada via pidfd (Linux 5.3+, python 3.9+) registrado em
+        um selector, sem varrer a tabela de processos; sem pidfd o pid é verificado a cada
+        `poll` segundos. Os reinícios seguem backoff exponencial limitado a `backoff_max`,
+        a contagem de falhas zera quando o serviço fica `stable_after` segundos no ar.
+
+        Um serviço cujo arquivo de PID foi removido (csctl stop, script stop) é considerado
+        parado pelo operador e não é reiniciado até um novo arquivo de PID aparecer. O csctl stop
+        remove o arquivo antes de sinalizar o processo, a decisão não depende de `settle`.
+    """
+
+    def __init__(self, names: List[str], start: Callable[[str], object], pid_path: str, state_path: str,
+                 backoff_initial: float = 1.0, backoff_max: float = 60.0, stable_after: float = 30.0,
+                 settle: float = 0.5, poll: float = 1.0, logger=None):
+        self.services = {name: SupervisedService(name) for name in names}
+        self.start = start
+        self.pid_path = pid_path
+        self.state_path = state_path
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.stable_after = stable_after
+        self.settle = settle
+        self.poll = poll
+        self.logger = logger
+        self.selector = selectors.DefaultSelector()
+        self.pidfds = {}
+        self.watched = set()
+        self.running = False
+
+    def run(self):
+        """ Executa o laço de supervisão até receber SIGTERM ou SIGINT"""
+        self.running = True
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, self._handle_signal)
+
+        for service in self.services.values():
+            pid = self.read_pid(service.name)
+            if pid and self.is_alive(pid):
+                self._watch(service, pid)
+            else:
+                self.remove_pid(service.name)
+        self.save_state()
+
+        try:
+            while self.running:
+                self.tick()
+        finally:
+            for fd in list(self.pidfds):
+                self._unwatch(fd)
+            self.save_state()
+
+    def tick(self):
+        """ Uma iteração: inicia os serviços devidos, aguarda saídas e decide reinícios"""
+        now = time.monotonic()
+        changed = False
+
+        for service in self.services.values():
+            if service.state in ('pending', 'backoff') and service.next_start <= now:
+                self._spawn(service)
+                changed = True
+            elif service.state == 'exited' and service.next_start <= now:
+                self._decide(service)
+                changed = True
+            elif service.state == 'stopped':
+                pid = self.read_pid(service.name)
+                if pid and self.is_alive(pid):
+                    self._watch(service, pid)
+                    changed = True
+            elif service.state == 'running':
+                if service.failures and now - service.started_at >= self.stable_after:
+                    service.failures = 0
+                    changed = True
+                if service.pid not in self.watched and not self.is_alive(service.pid):
+                    self._exited(service)
+                    changed = True
+
+        if changed:
+            self.save_state()
+
+        timeout = self.poll
+        waiting = [s.next_start for s in self.services.values() if s.state in ('pending', 'backoff', 'exited')]
+        if waiting:
+            timeout = max(0.0, min(timeout, min(waiting) - time.monotonic()))
+
+        events = []
+        if self.pidfds:
+            events = self.selector.select(timeout)
+        else:
+            time.sleep(timeout)
+        for key, _ in events:
+            service = key.data
+            self._unwatch(key.fd)
+            self._exited(service)
+        if events:
+            self.save_state()
+
+    def _spawn(self, service: SupervisedService):
+        self.remove_pid(service.name)
+        result = self.start(service.name)
+        pid = self.read_pid(service.name)
+        if getattr(result, 'ok', True) and pid and self.is_alive(pid):
+            if service.exited_at is not None:
+                service.restarts += 1
+            self._watch(service, pid)
+            self._log('info', 'service {} started, pid {} (restarts: {})'.format(service.name, pid, service.restarts))
+        else:
+            service.failures += 1
+            self._backoff(service)
+            self._log('error', 'service {} failed to start, retrying in {:.1f}s'.format(
+                service.name, service.next_start - time.monotonic()))
+
+    def _watch(self, service: SupervisedService, pid: int):
+        service.state = 'running'
+        service.pid = pid
+        service.started_at = time.monotonic()
+        if not hasattr(os, 'pidfd_open'):
+            return
+        try:
+            fd = os.pidfd_open(pid)
+        except OSError:
+            return
+        self.pidfds[fd] = pid
+        self.watched.add(pid)
+        self.selector.register(fd, selectors.EVENT_READ, service)
+
+    def _unwatch(self, fd: int):
+        self.selector.unregister(fd)
+        self.watched.discard(self.pidfds.pop(fd, None))
+        os.close(fd)
+
+    def _exited(self, service: SupervisedService):
+        """ O processo terminou, aguarda `settle` para distinguir parada do operador de falha"""
+        service.state = 'exited'
+        service.exited_at = time.time()
+        service.next_start = time.monotonic() + self.settle
+        self._log('warning', 'service {} (pid {}) exited'.format(service.name, service.pid))
+
+    def _decide(self, service: SupervisedService):
+        pid = self.read_pid(service.name)
+        if pid is None:
+            service.state = 'stopped'
+            service.pid = None
+            self._log('info', 'service {} stopped by operator, not restarting'.format(service.name))
+        elif pid != service.pid and self.is_alive(pid):
+            self._watch(service, pid)
+        else:
+            if service.started_at is not None and time.monotonic() - service.started_at < self.stable_after:
+                service.failures += 1
+            self._backoff(service)
+
+    def _backoff(self, service: SupervisedService):
+        delay = min(self.backoff_initial * (2 ** max(service.failures - 1, 0)), self.backoff_max)
+        service.state = 'backoff'
+        service.pid = None
+        service.next_start = time.monotonic() + delay
+
+    def _handle_signal(self, signum, frame):
+        self.running = False
+
+    def _log(self, level: str, message: str):
+        if self.logger is not None:
+            getattr(self.logger, level)(message)
+
+    def read_pid(self, name: str) -> Optional[int]:
+        try:
+            with open(os.path.join(self.pid_path, '{}.pid'.format(name))) as pid_file:
+                return int(pid_file.read().split()[0])
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def remove_pid(self, name: str):
+        try:
+            os.remove(os.path.join(self.pid_path, '{}.pid'.format(name)))
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def is_alive(pid: Optional[int]) -> bool:
+        if not pid:
+            return False
+        try:
+            with open('/proc/{}/stat'.format(pid), 'rb') as stat:
+                return stat.read().rpartition(b')')[2].split()[0] != b'Z'
+        except FileNotFoundError:
+            return False
+        except OSError:
+            return True
+
+    def save_state(self):
+        """ Grava o estado dos serviços de forma atômica para consulta pelo csctl"""
+        state = {'pid': os.getpid(), 'updated_at': time.time(),
+                 'services': {name: self._public(s) for name, s in self.services.items()}}
+        temp_path = '{}.tmp'.format(self.state_path)
+        with open(temp_path, 'w') as state_file:
+            json.dump(state, state_file)
+        os.replace(temp_path, self.state_path)
+
+    @staticmethod
+    def _public(service: SupervisedService) -> Dict:
+        data = asdict(service)
+        data.pop('next_start')
+        data.pop('started_at')
+        return data
+
+    @staticmethod
+    def load_state(state_path: str) -> Optional[Dict]:
+        """ Lê o estado gravado por um supervisor em execução"""
+        try:
+            with open(state_path) as state_file:
+                return json.load(state_file)
+        except (OSError, ValueError):
+            return None
@@ -0,0 +1,87 @@
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import psutil
+
+
+@dataclass
+class TopRow:
+    """ Linha do top de um processo de serviço"""
+    name: str
+    pid: int
+    cpu_percent: float = 0.0
+    memory_percent: float = 0.0
+    rss: int = 0
+    threads: int = 0
+    create_time: float = 0.0
+
+
+class ProcessTopUseCase:
+    """ Acompanha os processos dos serviços entre atualizações mantendo os psutil.Process.
+
+        A cada tick os serviços em execução vêm do repositório de processos (PROCESS_BACKEND),
+        a mesma classificação do status e do exporter, lendo apenas nome, pid e cmdline. Os
+        processos são identificados por (pid, create_time): um pid reaproveitado pelo kernel é
+        tratado como outro processo. Apenas os pids novos ganham um psutil.Process, os que sumiram
+        são descartados e os acompanhados têm lidos somente CPU, memória e threads. O CPU% é a
+        variação desde o tick anterior medida pelo próprio psutil.Process, por isso o primeiro
+        tick de cada processo é 0.
+    """
+
+    SORT_KEYS = {'cpu': lambda row: (-row.cpu_percent, row.name),
+                 'mem': lambda row: (-row.rss, row.name),
+                 'name': lambda row: (row.name, row.pid),
+                 'pid': lambda row: row.pid}
+
+    def __init__(self, process_repo, matches: Callable[[str], bool] = lambda name: True):
+        self.process_repo = process_repo
+        self.matches = matches
+        self.__tracked: Dict[int, Tuple[psutil.Process, TopRow]] = {}
+        self.__mem_total = psutil.virtual_memory().total
+
+    def tick(self, sort: str = 'cpu') -> List[TopRow]:
+        """ Atualiza os processos acompanhados e retorna as linhas ordenadas por `sort`"""
+        services = {record['pid']: record['name'] for record in self.process_repo.list_process(fields=[])
+                    if self.matches(record['name'])}
+        for pid in list(self.__tracked):
+            if pid not in services:
+                del self.__tracked[pid]
+        for pid, name in services.items():
+            if pid not in self.__tracked:
+                self.discover(pid, name)
+
+        rows = []
+        for pid, (proc, row) in list(self.__tracked.items()):
+            if not self.refresh(proc, row):
+                del self.__tracked[pid]
+                continue
+            rows.append(row)
+        return sorted(rows, key=self.SORT_KEYS[sort])
+
+    def discover(self, pid: int, name: str) -> Optional[TopRow]:
+        """ Passa a acompanhar um processo de serviço, None se ele já terminou"""
+        try:
+            proc = psutil.Process(pid)
+            row = TopRow(name, pid, create_time=proc.create_time())
+            proc.cpu_percent()
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            return None
+        self.__tracked[pid] = (proc, row)
+        return row
+
+    def refresh(self, proc: psutil.Process, row: TopRow) -> bool:
+        """ Relê apenas os campos exibidos, False se o processo terminou ou o pid foi reaproveitado"""
+        try:
+            if not proc.is_running():
+                return False
+            with proc.oneshot():
+                row.cpu_percent = proc.cpu_percent()
+                row.rss = proc.memory_info().rss
+                row.threads = proc.num_threads()
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            return False
+        row.memory_percent = 100.0 * row.rss / self.__mem_total if self.__mem_total else 0.0
+        return True
+
+    def __len__(self):
+        return len(self.__tracked)